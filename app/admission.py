@@ -0,0 +1,212 @@
+# app/admission.py
+"""
+Admission control for ingestion and DB-bound reads.
+
+- RateLimiter: a token bucket per authenticated device, refilled at the rate
+  configured for its device_type in RATE_LIMITS ("heart_rate=5:10,
+  blood_pressure=1:5", requests per second and burst), or RATE_LIMIT_DEFAULT.
+  Both are empty by default, which leaves devices unlimited. A device over its
+  rate gets 429 with Retry-After set to when its next token is due, before any
+  DB work is done for it. On /ingest/ws the handshake and every frame take a
+  token (see app/ws_ingest.py).
+- ConcurrencyLimiter: caps handlers in flight per pool at INGEST_CONCURRENCY
+  and READ_CONCURRENCY (0, the default, leaves them uncapped; the connection
+  pool's size plus overflow is a natural choice). A request waits for a slot
+  for at most ADMISSION_QUEUE_BUDGET_MS behind at most ADMISSION_MAX_QUEUE
+  others; past either it gets 503 with Retry-After right away instead of
+  queueing on the connection pool. Streamed reads (?stream=true, /export)
+  hold their slot until the whole body is sent.
+
+Decisions, queue depths and slot waits are reported on /metrics.
+"""
+import asyncio
+import math
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import monotonic, perf_counter
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+
+from app.auth import get_current_device
+from app.config import settings
+from app.metrics import metrics, STAGE_SECONDS
+from app.models import Device
+
+Limit = Tuple[float, float]
+
+
+def parse_limit(spec: str) -> Optional[Limit]:
+    """"rate[:burst]" -> (rate, burst); None for an empty or zero rate (unlimited)."""
+    rate, _, burst = spec.strip().partition(":")
+    if not rate or float(rate) <= 0:
+        return None
+    return float(rate), float(burst) if burst else max(1.0, float(rate))
+
+
+def parse_limits(spec: str) -> Dict[str, Optional[Limit]]:
+    """"type=rate[:burst],..." -> {type: limit}"""
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        device_type, sep, limit = part.partition("=")
+        if not sep:
+            raise ValueError(f"RATE_LIMITS entry {part!r} is not type=rate[:burst]")
+        limits[device_type.strip()] = parse_limit(limit)
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self, now: float) -> float:
+        """0 when a token was taken, else the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, default: Optional[Limit], limits: Dict[str, Optional[Limit]], maxsize: int):
+        self.default = default
+        self.limits = limits
+        self.maxsize = maxsize
+        # device_id -> TokenBucket, least recently seen first; an evicted device starts over with a full burst
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.decisions: Dict[Tuple[str, str], int] = {}
+
+    def limit_for(self, device_type: str) -> Optional[Limit]:
+        return self.limits.get(device_type, self.default)
+
+    def take(self, device: Device) -> float:
+        """Take a token for `device`: 0 when one was taken, else the seconds until one is due."""
+        bucket = self.buckets.get(device.device_id)
+        if bucket is None:
+            limit = self.limit_for(device.device_type)
+            if limit is None:
+                return 0.0
+            bucket = self.buckets[device.device_id] = TokenBucket(*limit)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(device.device_id)
+
+        wait = bucket.take(monotonic())
+        key = (device.device_type, "limited" if wait else "admitted")
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        return wait
+
+    def check(self, device: Device):
+        """Take a token for `device`; 429 when it has none left."""
+        wait = self.take(device)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+    def collect(self):
+        for (device_type, decision), count in self.decisions.items():
+            yield "medtrack_rate_limit_decisions_total", "counter", (("device_type", device_type), ("decision", decision)), count
+        yield "medtrack_rate_limit_devices", "gauge", (), len(self.buckets)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name: str, limit: int, budget: float, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.budget = budget
+        self.max_queue = max_queue
+        # None when uncapped: every request is admitted straight away
+        self.semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.decisions = {"immediate": 0, "queued": 0, "queue_full": 0, "timeout": 0}
+        self._wait_labels = (("stage", f"admission_{name}"),)
+
+    def _shed(self, decision: str):
+        self.decisions[decision] += 1
+        raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore is None:
+            self.decisions["immediate"] += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+            return
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            self.decisions["immediate"] += 1
+        else:
+            if self.waiting >= self.max_queue:
+                self._shed("queue_full")
+            self.waiting += 1
+            start = perf_counter()
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.budget)
+            except asyncio.TimeoutError:
+                self._shed("timeout")
+            finally:
+                self.waiting -= 1
+                if metrics.enabled:
+                    metrics.observe(STAGE_SECONDS, self._wait_labels, perf_counter() - start)
+            self.decisions["queued"] += 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def collect(self):
+        labels = (("pool", self.name),)
+        yield "medtrack_admission_in_flight", "gauge", labels, self.in_flight
+        yield "medtrack_admission_waiting", "gauge", labels, self.waiting
+        yield "medtrack_admission_limit", "gauge", labels, self.limit
+        for decision, count in self.decisions.items():
+            yield "medtrack_admission_decisions_total", "counter", labels + (("decision", decision),), count
+
+
+rate_limiter = RateLimiter(
+    parse_limit(settings.RATE_LIMIT_DEFAULT),
+    parse_limits(settings.RATE_LIMITS),
+    settings.RATE_LIMIT_MAX_DEVICES,
+)
+ingest_slots = ConcurrencyLimiter(
+    "ingest", settings.INGEST_CONCURRENCY,
+    settings.ADMISSION_QUEUE_BUDGET_MS / 1000, settings.ADMISSION_MAX_QUEUE,
+)
+read_slots = ConcurrencyLimiter(
+    "read", settings.READ_CONCURRENCY,
+    settings.ADMISSION_QUEUE_BUDGET_MS / 1000, settings.ADMISSION_MAX_QUEUE,
+)
+metrics.add_collector(rate_limiter.collect)
+metrics.add_collector(ingest_slots.collect)
+metrics.add_collector(read_slots.collect)
+
+
+async def admit_ingest(device: Device = Depends(get_current_device)):
+    """get_current_device, rate limited per device and holding an ingest slot for the request."""
+    rate_limiter.check(device)
+    async with ingest_slots.slot():
+        yield device
+
+
+async def admit_read(device: Device = Depends(get_current_device)):
+    """get_current_device, holding a read slot for the request."""
+    async with read_slots.slot():
+        yield device
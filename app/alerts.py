@@ -0,0 +1,316 @@
+# app/alerts.py
+"""
+Threshold alerts, evaluated as readings are ingested.
+
+write_readings hands every reading it stores to the engine once the
+transaction commits (like the live feed), and the engine keeps incremental
+state per patient instead of querying the reading tables. Rules are
+
+- threshold: the reading's value compared with a bound, e.g. heart_rate > 130
+- sustained: a threshold that has held on every reading for `minutes`,
+  e.g. systolic > 140 for 10 minutes
+- delta: max - min of the metric within the last `minutes` reaches `value`,
+  e.g. heart_rate moving by 40 within 5 minutes (sliding min/max deques)
+
+for every patient, or for one with "patient_id". Alerts are off unless
+ALERTS_ENABLED is set; ALERT_RULES_PATH is then a JSON list of rules shaped
+like DEFAULT_RULES, which apply when it is not set.
+
+Rules comparing the same measure the same way are kept sorted by bound, so the
+rules a reading breaks are a prefix found with one bisect. The cost of a
+reading grows with the number of such groups and of rules it breaks, not with
+the number of rules loaded (see test/benchmark_alerts.py). A rule fires once
+when its condition starts holding and re-arms when it stops. Alerts are
+inserted into the alert table by a background task, off the request path, and
+served by GET /alerts.
+
+Like app/recent.py, the engine only sees readings written by this process. A
+reading older than the last one evaluated for its patient and metric is
+stored but not evaluated.
+"""
+import asyncio
+import json
+import logging
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+from typing import Deque, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import async_session
+from app.metrics import metrics
+from app.models import Alert
+from app.queries import out_columns
+from app.rollups import FIELDS
+from app.schemas import AlertOut
+
+logger = logging.getLogger("medtrack.alerts")
+
+METRICS = {field: model for model, fields in FIELDS.items() for field in fields}
+
+DEFAULT_RULES = [
+    {"name": "heart_rate_high", "metric": "heart_rate", "kind": "threshold", "op": ">", "value": 130},
+    {"name": "heart_rate_low", "metric": "heart_rate", "kind": "threshold", "op": "<", "value": 40},
+    {"name": "heart_rate_jump", "metric": "heart_rate", "kind": "delta", "value": 40, "minutes": 5},
+    {"name": "systolic_high_sustained", "metric": "systolic", "kind": "sustained", "op": ">", "value": 140, "minutes": 10},
+    {"name": "systolic_crisis", "metric": "systolic", "kind": "threshold", "op": ">", "value": 180, "severity": "critical"},
+]
+
+
+class Rule(BaseModel):
+    name: str
+    metric: Literal[tuple(METRICS)]
+    kind: Literal["threshold", "sustained", "delta"] = "threshold"
+    op: Literal[">", ">=", "<", "<="] = ">"
+    value: float
+    minutes: float = Field(default=0, ge=0)
+    patient_id: Optional[str] = None
+    severity: str = "warning"
+
+
+def load_rules(path: str) -> List[Rule]:
+    spec = json.loads(Path(path).read_text()) if path else DEFAULT_RULES
+    rules = TypeAdapter(List[Rule]).validate_python(spec)
+    for rule in rules:
+        if rule.kind != "threshold" and rule.minutes <= 0:
+            raise ValueError(f"Alert rule {rule.name}: {rule.kind} needs minutes > 0")
+    return rules
+
+
+class Group:
+    """Rules on one measure with one comparison, sorted so the broken ones are a prefix."""
+    __slots__ = ("rules", "bounds", "holds", "sign", "strict", "window", "instant")
+
+    def __init__(self, rules: List[Rule], op: str, window: Optional[timedelta]):
+        self.sign = -1 if op[0] == "<" else 1
+        self.strict = len(op) == 1
+        self.rules = sorted(rules, key=lambda r: r.value * self.sign)
+        self.bounds = [r.value * self.sign for r in self.rules]
+        self.holds = [timedelta(minutes=r.minutes if r.kind == "sustained" else 0) for r in self.rules]
+        self.window = window
+        self.instant = not any(self.holds)
+
+    def broken(self, measure: float) -> int:
+        """How many rules `measure` breaks; they are rules[:n]."""
+        if self.strict:
+            return bisect_left(self.bounds, measure * self.sign)
+        return bisect_right(self.bounds, measure * self.sign)
+
+
+class RuleSet:
+    """The groups that apply to one metric for all patients, or for one patient."""
+    __slots__ = ("groups", "windows")
+
+    def __init__(self, rules: List[Rule]):
+        by_key: Dict[Tuple[str, Optional[timedelta]], List[Rule]] = {}
+        for rule in rules:
+            if rule.kind == "delta":
+                key = (">=", timedelta(minutes=rule.minutes))
+            else:
+                key = (rule.op, None)
+            by_key.setdefault(key, []).append(rule)
+        groups = [Group(rules, op, window) for (op, window), rules in by_key.items()]
+        self.groups = [g for g in groups if g.window is None]
+        self.windows: Dict[timedelta, List[Group]] = {}
+        for g in groups:
+            if g.window is not None:
+                self.windows.setdefault(g.window, []).append(g)
+
+
+class Window:
+    """Min and max of the readings within `span` of the newest one."""
+    __slots__ = ("span", "highs", "lows")
+
+    def __init__(self, span: timedelta):
+        self.span = span
+        self.highs: Deque[Tuple[datetime, float]] = deque()
+        self.lows: Deque[Tuple[datetime, float]] = deque()
+
+    def push(self, ts: datetime, value: float) -> float:
+        """Add a reading; the range (max - min) of the window."""
+        cutoff = ts - self.span
+        highs, lows = self.highs, self.lows
+        while highs and highs[-1][1] <= value:
+            highs.pop()
+        highs.append((ts, value))
+        while highs[0][0] <= cutoff:
+            highs.popleft()
+        while lows and lows[-1][1] >= value:
+            lows.pop()
+        lows.append((ts, value))
+        while lows[0][0] <= cutoff:
+            lows.popleft()
+        return highs[0][1] - lows[0][1]
+
+
+class PatientState:
+    __slots__ = ("last", "breaches", "windows")
+
+    def __init__(self):
+        # metric -> timestamp of the last reading evaluated
+        self.last: Dict[str, datetime] = {}
+        # group -> (breach start, fired) of each broken rule, in group order
+        self.breaches: Dict[Group, Tuple[List[datetime], List[bool]]] = {}
+        # (patient_id or None, metric, span) -> window, one per rule set and span
+        self.windows: Dict[Tuple[Optional[str], str, timedelta], Window] = {}
+
+
+class AlertEngine:
+    def __init__(self, rules: List[Rule]):
+        self.rule_count = len(rules)
+        scoped: Dict[Tuple[str, Optional[str]], List[Rule]] = {}
+        for rule in rules:
+            scoped.setdefault((rule.metric, rule.patient_id), []).append(rule)
+        # (metric, patient_id or None for every patient) -> rule set
+        self.rulesets = {key: RuleSet(rules) for key, rules in scoped.items()}
+        self.metrics = {
+            model: tuple(f for f in fields if any(m == f for m, _ in self.rulesets))
+            for model, fields in FIELDS.items()
+        }
+        self.patients: Dict[str, PatientState] = {}
+
+        self.pending: List[dict] = []
+        self._writer: Optional[asyncio.Task] = None
+        self.evaluated = 0
+        self.evaluate_seconds = 0.0
+        self.fired: Dict[str, int] = {}
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rulesets)
+
+    def evaluate(self, model, rows: List[dict], ids: List[int]) -> List[dict]:
+        """Update patient state with stored readings; the alerts they raise."""
+        metric_names = self.metrics.get(model)
+        if not metric_names:
+            return []
+        start = perf_counter()
+        alerts: List[dict] = []
+        table = model.__tablename__
+        for row, id in sorted(zip(rows, ids), key=lambda r: r[0]["timestamp"]):
+            patient_id = row["patient_id"]
+            ts = row["timestamp"]
+            state = self.patients.get(patient_id)
+            if state is None:
+                state = self.patients[patient_id] = PatientState()
+            for metric in metric_names:
+                last = state.last.get(metric)
+                if last is not None and ts < last:
+                    continue
+                state.last[metric] = ts
+                value = row[metric]
+                for scope in (None, patient_id):
+                    ruleset = self.rulesets.get((metric, scope))
+                    if ruleset is None:
+                        continue
+                    for group in ruleset.groups:
+                        self._check(group, state, value, ts, row, table, id, metric, alerts)
+                    for span, groups in ruleset.windows.items():
+                        key = (scope, metric, span)
+                        window = state.windows.get(key)
+                        if window is None:
+                            window = state.windows[key] = Window(span)
+                        spread = window.push(ts, value)
+                        for group in groups:
+                            self._check(group, state, spread, ts, row, table, id, metric, alerts)
+        self.evaluated += len(rows)
+        self.evaluate_seconds += perf_counter() - start
+        return alerts
+
+    def _check(self, group: Group, state: PatientState, measure: float, ts: datetime,
+               row: dict, table: str, reading_id: int, metric: str, alerts: List[dict]):
+        n = group.broken(measure)
+        breach = state.breaches.get(group)
+        if breach is None:
+            if not n:
+                return
+            breach = state.breaches[group] = ([], [])
+        since, fired = breach
+        held = len(since)
+        if n < held:
+            del since[n:], fired[n:]
+        elif n > held:
+            since.extend([ts] * (n - held))
+            fired.extend([False] * (n - held))
+        # In a group without hold times every rule already in the breach has fired.
+        for i in range(held if group.instant else 0, n):
+            if fired[i] or ts - since[i] < group.holds[i]:
+                continue
+            fired[i] = True
+            rule = group.rules[i]
+            self.fired[rule.severity] = self.fired.get(rule.severity, 0) + 1
+            alerts.append({
+                "rule": rule.name,
+                "severity": rule.severity,
+                "device_id": row["device_id"],
+                "patient_id": row["patient_id"],
+                "metric": metric,
+                "value": measure,
+                "threshold": rule.value,
+                "reading_type": table,
+                "reading_id": reading_id,
+                "timestamp": ts,
+                "created_at": datetime.utcnow(),
+            })
+
+    def observe(self, model, rows: List[dict], ids: List[int]):
+        """evaluate, and queue any alerts for the writer task."""
+        alerts = self.evaluate(model, rows, ids)
+        if not alerts:
+            return
+        self.pending.extend(alerts)
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._write(), name="alert-writer")
+
+    async def _write(self):
+        try:
+            while self.pending:
+                batch, self.pending = self.pending, []
+                try:
+                    async with async_session() as db:
+                        await db.execute(insert(Alert), batch)
+                        await db.commit()
+                    self.written += len(batch)
+                except Exception:
+                    logger.exception("Failed to store %d alerts", len(batch))
+                    self.failed += len(batch)
+        finally:
+            self._writer = None
+
+    async def drain(self):
+        """Wait for queued alerts to be stored."""
+        if self._writer is not None:
+            await self._writer
+
+    def collect(self):
+        yield "medtrack_alert_rules", "gauge", (), self.rule_count
+        yield "medtrack_alert_readings_evaluated_total", "counter", (), self.evaluated
+        yield "medtrack_alert_evaluate_seconds_total", "counter", (), self.evaluate_seconds
+        for severity, count in self.fired.items():
+            yield "medtrack_alerts_fired_total", "counter", (("severity", severity),), count
+        yield "medtrack_alerts_written_total", "counter", (), self.written
+        yield "medtrack_alerts_failed_total", "counter", (), self.failed
+
+
+async def alerts_page(db: AsyncSession, device_id: Optional[str], patient_id: Optional[str],
+                      after_id: int, limit: int) -> List[dict]:
+    """Up to `limit` alerts with ids above `after_id`, oldest first, by device or by patient."""
+    query = select(*out_columns(Alert, AlertOut)).where(Alert.id > after_id)
+    if patient_id is not None:
+        query = query.where(Alert.patient_id == patient_id)
+    else:
+        query = query.where(Alert.device_id == device_id)
+    result = await db.execute(query.order_by(Alert.id).limit(limit))
+    return [dict(row) for row in result.mappings()]
+
+
+alert_engine = AlertEngine(load_rules(settings.ALERT_RULES_PATH) if settings.ALERTS_ENABLED else [])
+metrics.add_collector(alert_engine.collect)
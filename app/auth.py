@@ -1,17 +1,56 @@
 # app/auth.py
+import asyncio
 import jwt
+import hashlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from jwt.algorithms import get_default_algorithms
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException
+from typing import List, Optional, Sequence, Tuple
+from fastapi import Depends, HTTPException, WebSocket
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.db import get_db
+from app.db import get_db, async_session
 from app.config import settings
+from app.cache import TTLCache
+from app.metrics import span
 from app.models import Device
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Parsed key objects, loaded once (at startup via load_keys, or lazily on first use)
+_keys = {}
+
+# sha256(token) -> (sub, exp); entries never outlive the token's own exp
+token_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+# device_id -> detached Device
+device_cache = TTLCache(settings.DEVICE_CACHE_SIZE, settings.DEVICE_CACHE_TTL_SECONDS)
+
+
+def _prepare_key(pem: str):
+    algorithm = get_default_algorithms().get(settings.JWT_ALGO)
+    if algorithm is None:
+        raise RuntimeError(f"Unsupported JWT_ALGORITHM {settings.JWT_ALGO}")
+    try:
+        return algorithm.prepare_key(pem)
+    except (jwt.InvalidKeyError, ValueError, TypeError) as e:
+        raise RuntimeError(f"JWT key does not suit JWT_ALGORITHM {settings.JWT_ALGO} (see python -m app.keys)") from e
+
+def load_keys():
+    _keys["private"] = _prepare_key(settings.private_key)
+    _keys["public"] = _prepare_key(settings.public_key)
+
+def signing_key():
+    if "private" not in _keys:
+        _keys["private"] = _prepare_key(settings.private_key)
+    return _keys["private"]
+
+def verifying_key():
+    if "public" not in _keys:
+        _keys["public"] = _prepare_key(settings.public_key)
+    return _keys["public"]
+
 def create_jwt(device_id: str) -> str:
     payload = {
         "sub": device_id,
@@ -19,30 +58,105 @@ def create_jwt(device_id: str) -> str:
     }
     return jwt.encode(
         payload,
-        settings.private_key,
+        signing_key(),
         algorithm=settings.JWT_ALGO
     )
 
+def create_jwts(device_ids: Sequence[str]) -> List[str]:
+    """Tokens for many devices, sharing one expiry and the parsed signing key."""
+    exp = datetime.utcnow() + timedelta(minutes=settings.JWT_EXPIRE_MINUTES)
+    key = signing_key()
+    return [jwt.encode({"sub": device_id, "exp": exp}, key, algorithm=settings.JWT_ALGO) for device_id in device_ids]
+
+# Signing is CPU-bound; bulk minting runs on this pool so the event loop keeps serving.
+# Process workers inherit (or load once) the parsed key.
+MINT_CHUNK = 250
+_mint_pool: Optional[Executor] = None
+
+def _get_mint_pool() -> Executor:
+    global _mint_pool
+    if _mint_pool is None:
+        if settings.TOKEN_MINT_POOL == "process":
+            _mint_pool = ProcessPoolExecutor(settings.TOKEN_MINT_WORKERS, initializer=signing_key)
+        else:
+            _mint_pool = ThreadPoolExecutor(settings.TOKEN_MINT_WORKERS, thread_name_prefix="mint")
+    return _mint_pool
+
+async def mint_tokens(device_ids: Sequence[str]) -> List[str]:
+    """create_jwts on the mint pool in chunks of MINT_CHUNK; tokens in input order."""
+    loop = asyncio.get_running_loop()
+    pool = _get_mint_pool()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, create_jwts, device_ids[i:i + MINT_CHUNK])
+        for i in range(0, len(device_ids), MINT_CHUNK)
+    ))
+    return [token for chunk in chunks for token in chunk]
+
+def shutdown_mint_pool():
+    global _mint_pool
+    if _mint_pool is not None:
+        _mint_pool.shutdown(wait=False, cancel_futures=True)
+        _mint_pool = None
+
 def verify_jwt(token: str) -> str:
+    return verify_jwt_claims(token)[0]
+
+def verify_jwt_claims(token: str) -> Tuple[str, Optional[int]]:
+    """(device_id, exp) for a valid token."""
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(
             token,
-            settings.public_key,
+            verifying_key(),
             algorithms=[settings.JWT_ALGO]
         )
-        return payload["sub"]
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    exp = payload.get("exp")
+    token_cache.set(digest, (payload["sub"], exp), expires_at=exp)
+    return payload["sub"], exp
 
-async def get_current_device(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> Device:
-    device_id = verify_jwt(token)
+def invalidate_device(device_id: str):
+    device_cache.pop(device_id)
+
+async def lookup_device(db: AsyncSession, device_id: str) -> Device:
+    device = device_cache.get(device_id)
+    if device is not None:
+        return device
     result = await db.execute(select(Device).where(Device.device_id == device_id))
     device = result.scalar_one_or_none()
     if not device:
         raise HTTPException(status_code=401, detail="Device not registered")
+    db.expunge(device)
+    device_cache.set(device_id, device)
     return device
+
+async def get_current_device(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> Device:
+    with span("auth"):
+        return await lookup_device(db, verify_jwt(token))
+
+async def authenticate(token: str = Depends(oauth2_scheme)) -> Device:
+    """
+    Like get_current_device, but releases its DB connection right away;
+    for endpoints that hold the request open (event streams).
+    """
+    with span("auth"):
+        device_id = verify_jwt(token)
+        async with async_session() as db:
+            return await lookup_device(db, device_id)
+
+def websocket_token(websocket: WebSocket) -> Optional[str]:
+    """Bearer token from the handshake's Authorization header, or ?token= for clients that cannot set headers."""
+    header = websocket.headers.get("authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return websocket.query_params.get("token")
@@ -0,0 +1,214 @@
+# app/buffer.py
+import asyncio
+import itertools
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+from app.config import settings
+from app.db import async_session
+from app.ingest import Reading, write_readings
+from app.metrics import metrics, span
+
+logger = logging.getLogger("medtrack.buffer")
+
+
+class BufferFull(Exception):
+    pass
+
+
+async def gather(queue: asyncio.Queue, first, limit: int, interval: float, weight: Callable = None):
+    """
+    Group `first` with whatever else arrives on `queue` within `interval` seconds,
+    until `limit` items (or total `weight`) are collected. Returns (batch, stopped),
+    where stopped means the None sentinel was taken off the queue.
+    """
+    loop = asyncio.get_running_loop()
+    batch = [first]
+    size = weight(first) if weight else 1
+    deadline = loop.time() + interval
+    while size < limit:
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+        if item is None:
+            return batch, True
+        batch.append(item)
+        size += weight(item) if weight else 1
+    return batch, False
+
+
+class IngestBuffer:
+    """
+    Write-behind queue for single readings. A background task drains the queue
+    and writes everything it collected in one transaction (group commit), either
+    when `flush_rows` readings are waiting or `flush_interval` seconds have passed.
+
+    Durability:
+      "none"   - acknowledge as soon as the reading is queued
+      "commit" - acknowledge after the group holding the reading is committed
+    """
+
+    def __init__(self, maxsize: int, flush_rows: int, flush_interval: float, durability: str):
+        if durability not in ("none", "commit"):
+            raise ValueError(f"Unknown ingest durability: {durability}")
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._seq = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.max_depth = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name="ingest-buffer")
+
+    async def stop(self):
+        """Stop accepting readings and flush everything already queued."""
+        if not self.running:
+            return
+        self._closing = True
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, device_id: str, reading: Reading) -> int:
+        if self._closing or not self.running:
+            raise BufferFull("Ingest buffer is not running")
+        seq = next(self._seq)
+        done = asyncio.get_running_loop().create_future() if self.durability == "commit" else None
+        try:
+            self.queue.put_nowait((seq, device_id, reading, done))
+        except asyncio.QueueFull:
+            raise BufferFull("Ingest buffer is full")
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        if done is not None:
+            await done
+        return seq
+
+    async def _run(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch, stop = await gather(self.queue, item, self.flush_rows, self.flush_interval)
+            await self._flush(batch)
+            if stop:
+                # Drain whatever raced in behind the sentinel.
+                rest = []
+                while not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is not None:
+                        rest.append(item)
+                if rest:
+                    await self._flush(rest)
+                return
+
+    async def _write(self, items) -> Optional[Exception]:
+        """Write `items` in one transaction; the error if it was rolled back."""
+        by_device = defaultdict(list)
+        for _, device_id, reading, _ in items:
+            by_device[device_id].append(reading)
+        async with async_session() as db:
+            try:
+                for device_id, readings in sorted(by_device.items()):
+                    await write_readings(db, device_id, readings)
+                with span("commit"):
+                    await db.commit()
+            except Exception as e:
+                await db.rollback()
+                return e
+        return None
+
+    async def _write_apart(self, items, error: Exception, errors: dict):
+        """
+        `items` failed together with `error`: write each device's readings on
+        their own, then each reading of a device that still fails, collecting
+        the errors of the readings that cannot be written by seq.
+        """
+        if len(items) == 1:
+            errors[items[0][0]] = error
+            return
+        by_device = defaultdict(list)
+        for item in items:
+            by_device[item[1]].append(item)
+        parts = list(by_device.values()) if len(by_device) > 1 else [[item] for item in items]
+        for part in parts:
+            error = await self._write(part)
+            if error is not None:
+                await self._write_apart(part, error, errors)
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        errors = {}
+        error = await self._write(batch)
+        if error is not None:
+            # One bad reading must not take the rest of the group with it; with
+            # durability "none" their callers already have a 202.
+            if len(batch) > 1:
+                logger.warning("Group commit of %d buffered readings failed, retrying separately: %r", len(batch), error)
+            await self._write_apart(batch, error, errors)
+        elapsed = time.perf_counter() - start
+
+        self.flushes += 1
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.rows_flushed += len(batch) - len(errors)
+        self.rows_failed += len(errors)
+        for seq, device_id, _, done in batch:
+            error = errors.get(seq)
+            if error is not None:
+                logger.error("Failed to flush buffered reading %d for %s", seq, device_id, exc_info=error)
+            if done is not None and not done.done():
+                if error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(error)
+
+    def collect(self):
+        gauges = {
+            "medtrack_ingest_queue_depth": self.queue.qsize(),
+            "medtrack_ingest_queue_max_depth": self.max_depth,
+            "medtrack_ingest_flush_seconds_max": self.max_flush_seconds,
+        }
+        counters = {
+            "medtrack_ingest_flushes_total": self.flushes,
+            "medtrack_ingest_rows_flushed_total": self.rows_flushed,
+            "medtrack_ingest_rows_failed_total": self.rows_failed,
+            "medtrack_ingest_flush_seconds_total": self.total_flush_seconds,
+        }
+        for name, value in gauges.items():
+            yield name, "gauge", (), value
+        for name, value in counters.items():
+            yield name, "counter", (), value
+
+
+ingest_buffer = IngestBuffer(
+    maxsize=settings.INGEST_QUEUE_SIZE,
+    flush_rows=settings.INGEST_FLUSH_ROWS,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+    durability=settings.INGEST_DURABILITY,
+)
+metrics.add_collector(ingest_buffer.collect)
@@ -0,0 +1,237 @@
+# app/bulk_import.py
+"""
+Chunked NDJSON import, shared by POST /ingest/stream and the offline CLI:
+
+    python -m app.bulk_import readings.jsonl [--chunk-size 5000] [--create-devices]
+
+Each line is one HeartRateInput/BloodPressureInput object. Lines are parsed and
+inserted chunk by chunk (one transaction per chunk), so memory stays bounded by
+the chunk size rather than the size of the input.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from collections import defaultdict
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.alerts import alert_engine
+from app.config import settings
+from app.db import async_session, dialect_insert
+from app.ingest import Reading, reading_adapter, validation_error_message, write_readings
+from app.models import Device
+from app.registry import registry
+
+logger = logging.getLogger("medtrack.bulk_import")
+
+
+class ImportStats:
+    def __init__(self, max_rejects: int = 100):
+        self.max_rejects = max_rejects
+        self.lines = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.rejects: List[dict] = []
+        self.started = time.perf_counter()
+
+    def reject(self, line_no: int, error: str):
+        self.rejected += 1
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append({"line": line_no, "error": error})
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.accepted / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "lines": self.lines,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "rejected_lines": self.rejects,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.lines} lines, {self.accepted} accepted, {self.rejected} rejected, "
+            f"{self.rows_per_second:.0f} rows/s"
+        )
+
+
+async def split_lines(chunks: AsyncIterable[bytes], max_bytes: Optional[int] = None) -> AsyncIterator[Optional[bytes]]:
+    """
+    Re-split an arbitrary byte stream on newlines. A line longer than
+    `max_bytes` (INGEST_LINE_MAX_BYTES) is not buffered: its bytes are skipped
+    up to the next newline and it is yielded as None, for the caller to reject.
+    """
+    max_bytes = settings.INGEST_LINE_MAX_BYTES if max_bytes is None else max_bytes
+    tail = b""
+    too_long = False
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if too_long or len(line) > max_bytes:
+                too_long = False
+                yield None
+            else:
+                yield line
+        if len(tail) > max_bytes:
+            tail = b""
+            too_long = True
+    if too_long:
+        yield None
+    elif tail:
+        yield tail
+
+
+async def import_lines(
+        db: AsyncSession,
+        lines: AsyncIterable[Optional[bytes]],
+        stats: ImportStats,
+        chunk_size: int = 1000,
+        device_id: Optional[str] = None,
+        known_devices: Optional[Set[str]] = None,
+        create_device_type: Optional[str] = None,
+        on_chunk: Optional[Callable[[ImportStats], None]] = None,
+) -> ImportStats:
+    """
+    Parse and insert NDJSON readings. With `device_id`, every line must belong
+    to that device. With `known_devices`, lines for other devices are rejected,
+    unless `create_device_type` is given, in which case those devices are
+    registered with that type. A None line (see split_lines) is rejected as too long.
+    """
+    pending: List[Tuple[int, Reading]] = []
+    new_devices: Set[str] = set()
+    async for line in lines:
+        stats.lines += 1
+        if line is None:
+            stats.reject(stats.lines, "Line too long")
+            continue
+        if not line.strip():
+            continue
+        try:
+            reading = reading_adapter.validate_json(line)
+        except ValidationError as e:
+            stats.reject(stats.lines, validation_error_message(e))
+            continue
+        if device_id is not None and reading.device_id != device_id:
+            stats.reject(stats.lines, "Device ID mismatch")
+            continue
+        if known_devices is not None and reading.device_id not in known_devices:
+            if create_device_type is None:
+                stats.reject(stats.lines, "Device not registered")
+                continue
+            known_devices.add(reading.device_id)
+            new_devices.add(reading.device_id)
+        pending.append((stats.lines, reading))
+        if len(pending) >= chunk_size:
+            await _flush(db, pending, stats, new_devices, create_device_type)
+            pending = []
+            if on_chunk:
+                on_chunk(stats)
+    if pending:
+        await _flush(db, pending, stats, new_devices, create_device_type)
+        if on_chunk:
+            on_chunk(stats)
+    return stats
+
+
+async def _flush(
+        db: AsyncSession,
+        pending: List[Tuple[int, Reading]],
+        stats: ImportStats,
+        new_devices: Set[str],
+        device_type: Optional[str],
+):
+    by_device = defaultdict(list)
+    for _, reading in pending:
+        by_device[reading.device_id].append(reading)
+    try:
+        if new_devices:
+            await db.execute(
+                dialect_insert(db)(Device).on_conflict_do_nothing(index_elements=["device_id"]),
+                [{"device_id": d, "device_type": device_type} for d in sorted(new_devices)]
+            )
+        for device_id, readings in sorted(by_device.items()):
+            await write_readings(db, device_id, readings)
+        await db.commit()
+        new_devices.clear()
+    except Exception:
+        await db.rollback()
+        logger.exception("Failed to import chunk of %d readings", len(pending))
+        for line_no, _ in pending:
+            stats.reject(line_no, "Database error")
+        return
+    stats.accepted += len(pending)
+
+
+async def _file_lines(paths: Iterable[str]) -> AsyncIterator[bytes]:
+    for path in paths:
+        if path == "-":
+            for line in sys.stdin.buffer:
+                yield line
+            continue
+        with open(path, "rb") as f:
+            for line in f:
+                yield line
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bulk_import", description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="+", help="NDJSON files to import ('-' for stdin)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--create-devices", action="store_true",
+                        help="register unknown devices instead of rejecting their lines")
+    parser.add_argument("--device-type", default="unknown", help="device_type for --create-devices")
+    args = parser.parse_args(argv)
+
+    stats = ImportStats()
+    last_report = [0.0]
+
+    def report(s: ImportStats):
+        if s.elapsed - last_report[0] >= 1:
+            last_report[0] = s.elapsed
+            print(f"\r{s}", end="", file=sys.stderr, flush=True)
+
+    async with async_session() as db:
+        await registry.preload(db)
+        result = await db.execute(select(Device.device_id))
+        await import_lines(
+            db,
+            _file_lines(args.files),
+            stats,
+            chunk_size=args.chunk_size,
+            known_devices=set(result.scalars().all()),
+            create_device_type=args.device_type if args.create_devices else None,
+            on_chunk=report,
+        )
+    # Alerts raised by the import are stored in the background; like the
+    # server's shutdown, wait for them before the event loop goes away
+    await alert_engine.drain()
+
+    print(f"\r{stats}", file=sys.stderr)
+    for reject in stats.rejects:
+        print(f"line {reject['line']}: {reject['error']}", file=sys.stderr)
+    if stats.rejected > len(stats.rejects):
+        print(f"... {stats.rejected - len(stats.rejects)} more rejected lines", file=sys.stderr)
+    return 0 if stats.rejected == 0 else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main()))
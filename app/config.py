@@ -1,19 +1,83 @@
 from pydantic import BaseModel
 from pathlib import Path
+from functools import cached_property
+from typing import Optional
 import os
 
 class Settings(BaseModel):
     DATABASE_URL: str
+    READ_DATABASE_URL: Optional[str] = None
+    RESET_DB: bool = False
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+    SQLITE_JOURNAL_MODE: str = ""
+    SQLITE_SYNCHRONOUS: str = ""
+    SQLITE_BUSY_TIMEOUT_MS: int = 0
     PRIVATE_KEY_PATH: str
     PUBLIC_KEY_PATH: str
     JWT_ALGO: str = "RS512"
     JWT_EXPIRE_MINUTES: int = 60 * 24 * 7
+    TOKEN_MINT_POOL: str = "thread"
+    TOKEN_MINT_WORKERS: int = 4
+    REGISTER_BATCH_MAX: int = 5000
+    INGEST_BATCH_MAX: int = 1000
+    INGEST_LINE_MAX_BYTES: int = 65536
+    INGEST_BUFFERED: bool = False
+    INGEST_QUEUE_SIZE: int = 10000
+    INGEST_FLUSH_ROWS: int = 500
+    INGEST_FLUSH_INTERVAL_MS: int = 50
+    INGEST_DURABILITY: str = "none"
+    INGEST_WS_WINDOW: int = 1000
+    DEDUP_FILTER_CAPACITY: int = 1000000
+    DEDUP_FILTER_ERROR_RATE: float = 0.01
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    ALERTS_ENABLED: bool = False
+    ALERT_RULES_PATH: str = ""
+    RATE_LIMIT_DEFAULT: str = ""
+    RATE_LIMITS: str = ""
+    RATE_LIMIT_MAX_DEVICES: int = 100000
+    INGEST_CONCURRENCY: int = 0
+    READ_CONCURRENCY: int = 0
+    ADMISSION_QUEUE_BUDGET_MS: int = 500
+    ADMISSION_MAX_QUEUE: int = 100
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    DEVICE_CACHE_SIZE: int = 10000
+    DEVICE_CACHE_TTL_SECONDS: int = 300
+    EXPORT_BATCH_SIZE: int = 10000
+    READINGS_PAGE_SIZE: int = 1000
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    ROLLUPS_ENABLED: bool = True
+    RECENT_WINDOW_SECONDS: int = 0
+    RECENT_MAX_PER_SERIES: int = 3600
+    METRICS_ENABLED: bool = True
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 5
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    PARTITION_INTERVAL: str = "none"
+    PARTITIONS_AHEAD: int = 2
+    RETENTION_RAW_DAYS: int = 0
+    RETENTION_MINUTE_ROLLUP_DAYS: int = 0
+    RETENTION_HOUR_ROLLUP_DAYS: int = 0
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    RETENTION_DELETE_BATCH: int = 5000
+    SSE_QUEUE_SIZE: int = 1000
+    SSE_KEEPALIVE_SECONDS: int = 15
+    SSE_RETRY_MS: int = 2000
 
-    @property
+    @cached_property
     def private_key(self) -> str:
         return Path(self.PRIVATE_KEY_PATH).read_text()
 
-    @property
+    @cached_property
     def public_key(self) -> str:
         return Path(self.PUBLIC_KEY_PATH).read_text()
 
@@ -24,8 +88,70 @@ load_dotenv()
 
 settings = Settings(
     DATABASE_URL=os.getenv("DATABASE_URL"),
+    READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None,
+    RESET_DB = os.getenv("RESET_DB", "false").lower() in ("1", "true", "yes"),
+    DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes"),
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5)),
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10)),
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30)),
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1)),
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes"),
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500)),
+    DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 100)),
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", ""),
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", ""),
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 0)),
     PRIVATE_KEY_PATH = os.getenv("JWT_PRIVATE_KEY_PATH"),
     PUBLIC_KEY_PATH = os.getenv("JWT_PUBLIC_KEY_PATH"),
     JWT_ALGO = os.getenv("JWT_ALGORITHM", "RS512"),
-    JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 60 * 24 * 7))
+    JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 60 * 24 * 7)),
+    TOKEN_MINT_POOL = os.getenv("TOKEN_MINT_POOL", "thread"),
+    TOKEN_MINT_WORKERS = int(os.getenv("TOKEN_MINT_WORKERS", 4)),
+    REGISTER_BATCH_MAX = int(os.getenv("REGISTER_BATCH_MAX", 5000)),
+    INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", 1000)),
+    INGEST_LINE_MAX_BYTES = int(os.getenv("INGEST_LINE_MAX_BYTES", 65536)),
+    INGEST_BUFFERED = os.getenv("INGEST_BUFFERED", "false").lower() in ("1", "true", "yes"),
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10000)),
+    INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", 500)),
+    INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 50)),
+    INGEST_DURABILITY = os.getenv("INGEST_DURABILITY", "none"),
+    INGEST_WS_WINDOW = int(os.getenv("INGEST_WS_WINDOW", 1000)),
+    DEDUP_FILTER_CAPACITY = int(os.getenv("DEDUP_FILTER_CAPACITY", 1000000)),
+    DEDUP_FILTER_ERROR_RATE = float(os.getenv("DEDUP_FILTER_ERROR_RATE", 0.01)),
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24)),
+    ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "false").lower() in ("1", "true", "yes"),
+    ALERT_RULES_PATH = os.getenv("ALERT_RULES_PATH", ""),
+    RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", ""),
+    RATE_LIMITS = os.getenv("RATE_LIMITS", ""),
+    RATE_LIMIT_MAX_DEVICES = int(os.getenv("RATE_LIMIT_MAX_DEVICES", 100000)),
+    INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 0)),
+    READ_CONCURRENCY = int(os.getenv("READ_CONCURRENCY", 0)),
+    ADMISSION_QUEUE_BUDGET_MS = int(os.getenv("ADMISSION_QUEUE_BUDGET_MS", 500)),
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 100)),
+    AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000)),
+    AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 300)),
+    DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", 10000)),
+    DEVICE_CACHE_TTL_SECONDS = int(os.getenv("DEVICE_CACHE_TTL_SECONDS", 300)),
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 10000)),
+    READINGS_PAGE_SIZE = int(os.getenv("READINGS_PAGE_SIZE", 1000)),
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600)),
+    ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes"),
+    RECENT_WINDOW_SECONDS = int(os.getenv("RECENT_WINDOW_SECONDS", 0)),
+    RECENT_MAX_PER_SERIES = int(os.getenv("RECENT_MAX_PER_SERIES", 3600)),
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes"),
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes"),
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024)),
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 5)),
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4)),
+    PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "none"),
+    PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", 2)),
+    RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", 0)),
+    RETENTION_MINUTE_ROLLUP_DAYS = int(os.getenv("RETENTION_MINUTE_ROLLUP_DAYS", 0)),
+    RETENTION_HOUR_ROLLUP_DAYS = int(os.getenv("RETENTION_HOUR_ROLLUP_DAYS", 0)),
+    RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", 3600)),
+    RETENTION_DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", 5000)),
+    SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", 1000)),
+    SSE_KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", 15)),
+    SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", 2000))
 )
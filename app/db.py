@@ -1,12 +1,106 @@
 # app/db.py
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncEngine
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.engine import make_url
+from sqlalchemy import event
+import logging
 from app.config import settings
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+logger = logging.getLogger("medtrack.db")
+
+
+def make_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    """
+    Engine with the pool and driver settings from config.
+    `read_only` engines refuse writes on SQLite (PRAGMA query_only).
+    """
+    url = make_url(url)
+    kwargs = {
+        "echo": settings.DB_ECHO,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    is_sqlite = url.get_backend_name() == "sqlite"
+    if not (is_sqlite and url.database in (None, "", ":memory:")):
+        # In-memory SQLite uses a single static connection; everything else is a queue pool.
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    if url.drivername == "postgresql+asyncpg" and "prepared_statement_cache_size" not in url.query:
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.DB_PREPARED_STATEMENT_CACHE_SIZE)})
+
+    new_engine = create_async_engine(url, **kwargs)
+
+    if is_sqlite:
+        pragmas = []
+        if settings.SQLITE_JOURNAL_MODE:
+            pragmas.append(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        if settings.SQLITE_SYNCHRONOUS:
+            pragmas.append(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        if settings.SQLITE_BUSY_TIMEOUT_MS:
+            pragmas.append(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        if read_only:
+            pragmas.append("PRAGMA query_only=ON")
+
+        if pragmas:
+            @event.listens_for(new_engine.sync_engine, "connect")
+            def _set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+
+    return new_engine
+
+
+engine = make_engine(settings.DATABASE_URL)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Read-only traffic (/readings/*) goes to READ_DATABASE_URL when it is set,
+# otherwise it shares the primary engine.
+read_engine: AsyncEngine = make_engine(settings.READ_DATABASE_URL, read_only=True) if settings.READ_DATABASE_URL else engine
+read_session = async_sessionmaker(read_engine, expire_on_commit=False)
 Base = declarative_base()
 
 async def get_db():
     async with async_session() as session:
         yield session
+
+
+async def get_read_db():
+    async with read_session() as session:
+        yield session
+
+
+def dialect_insert(db: AsyncSession):
+    """The dialect's own insert() construct, which supports ON CONFLICT clauses."""
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT is not supported for {name}")
+    return insert
+
+
+def on_commit(db: AsyncSession, fn):
+    """Run `fn` once the session's current transaction commits; dropped on rollback."""
+    db.info.setdefault("on_commit", []).append(fn)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit(session):
+    for fn in session.info.pop("on_commit", ()):
+        try:
+            fn()
+        except Exception:
+            logger.exception("on_commit hook failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_commit(session):
+    session.info.pop("on_commit", None)
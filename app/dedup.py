@@ -0,0 +1,88 @@
+# app/dedup.py
+"""
+In-memory prefilter for duplicate readings.
+
+Readings are unique on (device_id, patient_id, timestamp) per table, enforced by
+a unique index and ON CONFLICT DO NOTHING inserts. The filter remembers the keys
+this process has committed, so write_readings only looks a reading up in the
+database first when the filter says it may have been seen; everything else goes
+straight to the insert. False positives cost one indexed lookup; keys the filter
+has never seen (other processes, before a restart) are still caught by the index.
+
+Two Bloom filter generations are kept; when the current one reaches its
+capacity the older one is dropped, so memory stays bounded and the false
+positive rate stays near DEDUP_FILTER_ERROR_RATE for the newest keys.
+"""
+import hashlib
+import math
+from datetime import datetime
+from typing import Iterable, Tuple
+
+from app.config import settings
+from app.metrics import metrics
+
+
+class BloomFilter:
+    __slots__ = ("size", "hashes", "bits", "count")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: bytes):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenReadings:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.checks = 0
+        self.maybe = 0
+
+    @staticmethod
+    def _key(table: str, device_id: str, patient_id: str, timestamp: datetime) -> bytes:
+        return f"{table}\x1f{device_id}\x1f{patient_id}\x1f{timestamp.isoformat()}".encode()
+
+    def maybe_seen(self, table: str, device_id: str, patient_id: str, timestamp: datetime) -> bool:
+        key = self._key(table, device_id, patient_id, timestamp)
+        self.checks += 1
+        if key in self.current or (self.previous is not None and key in self.previous):
+            self.maybe += 1
+            return True
+        return False
+
+    def remember(self, table: str, device_id: str, keys: Iterable[Tuple[str, datetime]]):
+        for patient_id, timestamp in keys:
+            if self.current.count >= self.capacity:
+                self.previous = self.current
+                self.current = BloomFilter(self.capacity, self.error_rate)
+            self.current.add(self._key(table, device_id, patient_id, timestamp))
+
+    def clear(self):
+        self.current = BloomFilter(self.capacity, self.error_rate)
+        self.previous = None
+
+    def collect(self):
+        yield "medtrack_dedup_checks_total", "counter", (), self.checks
+        yield "medtrack_dedup_maybe_seen_total", "counter", (), self.maybe
+
+
+seen = SeenReadings(settings.DEDUP_FILTER_CAPACITY, settings.DEDUP_FILTER_ERROR_RATE)
+metrics.add_collector(seen.collect)
@@ -0,0 +1,208 @@
+# app/export.py
+"""
+Columnar export of readings, shared by GET /export/{hr|bp} and the offline CLI:
+
+    python -m app.export hr --device HR001 [--patient P001] [--from 2025-01-01] [--to 2025-02-01]
+                            [--format arrow|parquet|csv] [-o readings.parquet]
+
+Rows are read in (timestamp, id) order EXPORT_BATCH_SIZE at a time, each page
+in its own short read session, and every page is encoded and written out
+before the next is fetched, so memory is bounded by the batch size whatever
+the range. Arrow IPC (stream format) and Parquet need the optional pyarrow
+package; CSV always works.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import sys
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+
+from app.config import settings
+from app.db import read_engine, read_session
+from app.models import HeartRate, BloodPressure
+from app.queries import range_query, out_columns
+from app.schemas import HeartRateOut, BloodPressureOut
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+KINDS = {"hr": (HeartRate, HeartRateOut), "bp": (BloodPressure, BloodPressureOut)}
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+
+def default_format() -> str:
+    return "arrow" if pyarrow is not None else "csv"
+
+
+def check_format(fmt: str):
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {fmt}")
+    if fmt != "csv" and pyarrow is None:
+        raise HTTPException(status_code=501, detail=f"{fmt} export needs pyarrow; use format=csv")
+
+
+def export_query(kind: str, device_id: str, patient_id: Optional[str],
+                 from_time: Optional[datetime], to_time: Optional[datetime]) -> Select:
+    model, schema = KINDS[kind]
+    query = range_query(model, device_id, from_time, to_time, *out_columns(model, schema))
+    if patient_id is not None:
+        query = query.where(model.patient_id == patient_id)
+    return query
+
+
+async def _fetch(query) -> List[tuple]:
+    async with read_session() as db:
+        return [tuple(row) for row in await db.execute(query)]
+
+
+async def pages(query: Select, model, batch_size: int) -> AsyncIterator[List[tuple]]:
+    """
+    Rows of `query` in (timestamp, id) order, a page at a time. No connection is
+    held between pages, and each fetch is shielded from the cancellation a
+    client disconnect delivers, so the pool never gets a half-used connection.
+    """
+    query = query.order_by(model.timestamp, model.id).limit(batch_size)
+    names = [c.name for c in query.selected_columns]
+    ts, id = names.index("timestamp"), names.index("id")
+    page = query
+    while True:
+        rows = await asyncio.shield(_fetch(page))
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        page = query.where(tuple_(model.timestamp, model.id) > tuple_(rows[-1][ts], rows[-1][id]))
+
+
+class _Sink:
+    """Write-only file that pyarrow writers fill and we drain after every batch."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_ARROW_TYPES = {int: "int64", str: "string", float: "float64", datetime: "timestamp[us]"}
+
+
+def _arrow_schema(model, names: List[str]):
+    return pyarrow.schema([
+        (name, pyarrow.type_for_alias(_ARROW_TYPES[model.__table__.c[name].type.python_type]))
+        for name in names
+    ])
+
+
+async def _csv(rows_pages, names: List[str]) -> AsyncIterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    async for rows in rows_pages:
+        writer.writerows([v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+async def _columnar(rows_pages, model, names: List[str], fmt: str) -> AsyncIterator[bytes]:
+    schema = _arrow_schema(model, names)
+    sink = _Sink()
+    if fmt == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        async for rows in rows_pages:
+            columns = zip(*rows)
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_stream(kind: str, query: Select, fmt: str, batch_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Encoded chunks of the export of `query` (from export_query) in `fmt`."""
+    model, _ = KINDS[kind]
+    names = [c.name for c in query.selected_columns]
+    rows_pages = pages(query, model, batch_size or settings.EXPORT_BATCH_SIZE)
+    if fmt == "csv":
+        return _csv(rows_pages, names)
+    return _columnar(rows_pages, model, names, fmt)
+
+
+def filename(kind: str, device_id: str, fmt: str) -> str:
+    return f"{kind}-{device_id}.{fmt}"
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.export", description=__doc__.split("\n\n")[0])
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("--device", required=True, help="device_id to export")
+    parser.add_argument("--patient", help="only this patient_id")
+    parser.add_argument("--from", dest="from_time", type=datetime.fromisoformat)
+    parser.add_argument("--to", dest="to_time", type=datetime.fromisoformat)
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default=default_format())
+    parser.add_argument("--batch-size", type=int, default=settings.EXPORT_BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="output file (default stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        check_format(args.format)
+    except HTTPException as e:
+        parser.error(e.detail)
+
+    query = export_query(args.kind, args.device, args.patient, args.from_time, args.to_time)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_stream(args.kind, query, args.format, args.batch_size):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    await read_engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
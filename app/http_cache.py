@@ -0,0 +1,181 @@
+# app/http_cache.py
+"""
+Response cache for closed historical ranges of /readings/hr and /readings/bp.
+
+A request whose to_time is in the past (raw rows, aggregate, bucket or page,
+but not stream=true) is answered from an LRU of serialized bodies keyed by
+table, device, range and query, bounded to RESPONSE_CACHE_MAX_BYTES. Cached
+responses carry a strong ETag (a hash of the body) and Last-Modified (when the
+body was built), and a request whose If-None-Match matches gets 304, with the
+same (weak) ETag and Vary that CompressionMiddleware gives a compressed 200.
+
+Past data only changes through late-arriving readings: once its transaction
+commits, write_readings drops exactly the entries for that table and device
+whose range holds one of the timestamps it stored, and a body built while such
+a write was in flight is not cached. Retention clears the cache when it
+deletes readings. Like app/recent.py, only this process's writes are seen;
+RESPONSE_CACHE_TTL_SECONDS bounds how stale an entry can get when other
+processes (or a lagging read replica) are involved.
+"""
+import hashlib
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import formatdate
+from typing import Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from app.config import settings
+from app.metrics import metrics
+from app.responses import accepted_encoding, compressible, mark_encoded
+
+Series = Tuple[str, str]  # (table, device_id)
+
+
+def _naive(value: datetime) -> datetime:
+    # Stored timestamps drop their offset the same way (app/ingest.py to_row)
+    return value.replace(tzinfo=None)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+class Entry:
+    __slots__ = ("series", "start", "end", "body", "headers", "etag", "last_modified", "expires_at")
+
+    def __init__(self, series: Series, start: datetime, end: datetime, body: bytes, headers: Dict[str, str], ttl: float):
+        self.series = series
+        self.start = start
+        self.end = end
+        self.body = body
+        self.headers = headers
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        now = time.time()
+        self.last_modified = formatdate(now, usegmt=True)
+        self.expires_at = now + ttl
+
+    def respond(self, request_headers: Headers) -> Response:
+        validators = {"ETag": self.etag, "Last-Modified": self.last_modified, "Cache-Control": "private, no-cache"}
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, self.etag):
+            response_cache.not_modified += 1
+            headers = MutableHeaders(validators)
+            # CompressionMiddleware leaves the empty 304 alone, so it gets the
+            # ETag and Vary here that the 200 it revalidates went out with.
+            if (
+                settings.COMPRESSION_ENABLED
+                and accepted_encoding(request_headers.get("accept-encoding", ""))
+                and compressible("application/json", len(self.body), settings.COMPRESSION_MIN_BYTES)
+            ):
+                mark_encoded(headers)
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers={**self.headers, **validators})
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self.by_series: Dict[Series, Set[Hashable]] = {}
+        # Bumped by every committed write to a series, so a body built meanwhile is not cached
+        self.generations: Dict[Series, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidated = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, model, device_id: str, from_time: Optional[datetime], to_time: Optional[datetime], *query) -> Optional[tuple]:
+        """Cache key of a range that ended in the past; None for one reaching the present."""
+        if not self.enabled or to_time is None or _naive(to_time) >= datetime.utcnow():
+            return None
+        start = _naive(from_time) if from_time else datetime.min
+        return (model.__tablename__, device_id, start, _naive(to_time), *query)
+
+    def generation(self, key: tuple) -> int:
+        return self.generations.get(key[:2], 0)
+
+    def get(self, key: tuple) -> Optional[Entry]:
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at <= time.time():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, response: Response, generation: int) -> Optional[Entry]:
+        """Cache a built response; None when it is too large or its series was written meanwhile."""
+        body = response.body
+        if len(body) > self.max_entry_bytes or self.generation(key) != generation:
+            return None
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+        if key in self.entries:
+            self._drop(key)
+        series = key[:2]
+        entry = self.entries[key] = Entry(series, key[2], key[3], body, headers, self.ttl)
+        self.by_series.setdefault(series, set()).add(key)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.evicted += 1
+        return entry
+
+    def invalidate(self, table: str, device_id: str, timestamps: Iterable[datetime]):
+        """Drop the entries of (table, device) whose range holds one of `timestamps`."""
+        series = (table, device_id)
+        self.generations[series] = self.generations.get(series, 0) + 1
+        keys = self.by_series.get(series)
+        if not keys:
+            return
+        stamps = sorted(timestamps)
+        for key in list(keys):
+            entry = self.entries[key]
+            i = bisect_left(stamps, entry.start)
+            if i < len(stamps) and stamps[i] <= entry.end:
+                self._drop(key)
+                self.invalidated += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.by_series.clear()
+        self.size = 0
+
+    def _drop(self, key: tuple):
+        entry = self.entries.pop(key)
+        self.size -= len(entry.body)
+        keys = self.by_series[entry.series]
+        keys.discard(key)
+        if not keys:
+            del self.by_series[entry.series]
+
+    def collect(self):
+        labels = (("cache", "response"),)
+        yield "medtrack_cache_hits_total", "counter", labels, self.hits
+        yield "medtrack_cache_misses_total", "counter", labels, self.misses
+        yield "medtrack_cache_entries", "gauge", labels, len(self.entries)
+        yield "medtrack_response_cache_bytes", "gauge", (), self.size
+        yield "medtrack_response_cache_not_modified_total", "counter", (), self.not_modified
+        yield "medtrack_response_cache_invalidated_total", "counter", (), self.invalidated
+        yield "medtrack_response_cache_evicted_total", "counter", (), self.evicted
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_TTL_SECONDS)
+metrics.add_collector(response_cache.collect)
@@ -0,0 +1,40 @@
+# app/idempotency.py
+"""
+Idempotency-Key support for POST /ingest/batch.
+
+The first request with a key (per device) stores its response in the same
+transaction as its readings; a retry with that key gets the stored response
+back and writes nothing. Keys expire after IDEMPOTENCY_TTL_HOURS (app.retention).
+"""
+import json
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import dialect_insert
+from app.models import IdempotencyKey
+
+
+async def lookup(db: AsyncSession, device_id: str, key: str) -> Optional[dict]:
+    result = await db.execute(
+        select(IdempotencyKey.response).where(IdempotencyKey.device_id == device_id, IdempotencyKey.key == key)
+    )
+    response = result.scalar_one_or_none()
+    return json.loads(response) if response is not None else None
+
+
+async def claim(db: AsyncSession, device_id: str, key: str, response: dict) -> bool:
+    """Store `response` under the key. False if another request already claimed it. Does not commit."""
+    result = await db.execute(
+        dialect_insert(db)(IdempotencyKey)
+        .values(device_id=device_id, key=key, response=json.dumps(response))
+        .on_conflict_do_nothing(index_elements=["device_id", "key"])
+        .returning(IdempotencyKey.key)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+def replay(response: dict) -> JSONResponse:
+    return JSONResponse(content=response, headers={"Idempotent-Replayed": "true"})
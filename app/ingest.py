@@ -0,0 +1,147 @@
+# app/ingest.py
+from functools import partial
+from datetime import datetime
+from typing import Union, List, Dict, NamedTuple, Set, Tuple
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
+
+from app import rollups
+from app.alerts import alert_engine
+from app.config import settings
+from app.db import dialect_insert, on_commit
+from app.dedup import seen
+from app.http_cache import response_cache
+from app.live import broker
+from app.recent import recent
+from app.models import HeartRate, BloodPressure
+from app.registry import registry
+from app.schemas import HeartRateInput, BloodPressureInput
+
+Reading = Union[HeartRateInput, BloodPressureInput]
+
+reading_adapter = TypeAdapter(Reading)
+
+# Readings are unique on these columns per table (uq_hr_reading / uq_bp_reading).
+READING_KEY = ["device_id", "patient_id", "timestamp"]
+
+
+def validation_error_message(e: ValidationError) -> str:
+    err = e.errors()[0]
+    if not err["loc"]:
+        return err["msg"]
+    return f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}"
+
+
+def to_row(reading: Reading) -> Dict:
+    timestamp = reading.timestamp.replace(microsecond=0).replace(tzinfo=None)
+    if isinstance(reading, HeartRateInput):
+        return {
+            "device_id": reading.device_id,
+            "patient_id": reading.patient_id,
+            "timestamp": timestamp,
+            "heart_rate": reading.heart_rate,
+            "quality": reading.measurement_quality,
+        }
+    return {
+        "device_id": reading.device_id,
+        "patient_id": reading.patient_id,
+        "timestamp": timestamp,
+        "systolic": reading.systolic,
+        "diastolic": reading.diastolic,
+        "pulse": reading.pulse,
+    }
+
+
+class Written(NamedTuple):
+    ids: List[int]          # new id, or the stored reading's id for a duplicate
+    duplicates: Set[int]    # positions of readings that were already stored
+
+
+ReadingKey = Tuple[str, datetime]  # (patient_id, timestamp); device and table are implied
+
+
+async def _stored_ids(db: AsyncSession, model, device_id: str, keys: List[ReadingKey]) -> Dict[ReadingKey, int]:
+    found = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        result = await db.execute(
+            select(model.id, model.patient_id, model.timestamp).where(
+                model.device_id == device_id,
+                tuple_(model.patient_id, model.timestamp).in_(chunk)
+            )
+        )
+        found.update(((p, ts), id) for id, p, ts in result)
+    return found
+
+
+async def write_readings(db: AsyncSession, device_id: str, readings: List[Reading]) -> Written:
+    """
+    Insert readings with one multi-row insert per table and return their ids in
+    input order. A reading whose (patient, timestamp) is already stored for the
+    device and table - or repeated within `readings` - is not inserted again and
+    gets the stored id. Patients/assignments are created as needed. Does not commit.
+    """
+    await registry.ensure(db, device_id, (r.patient_id for r in readings))
+    insert = dialect_insert(db)
+
+    ids: List[int] = [0] * len(readings)
+    duplicates: Set[int] = set()
+    for model, kind in ((HeartRate, HeartRateInput), (BloodPressure, BloodPressureInput)):
+        positions = [i for i, r in enumerate(readings) if isinstance(r, kind)]
+        if not positions:
+            continue
+        table = model.__tablename__
+
+        keys: List[ReadingKey] = []
+        keyed: Dict[ReadingKey, dict] = {}
+        for i in positions:
+            row = to_row(readings[i])
+            key = (row["patient_id"], row["timestamp"])
+            keys.append(key)
+            keyed.setdefault(key, row)
+
+        # Only keys the prefilter may have seen are looked up before inserting.
+        maybe_seen = [k for k in keyed if seen.maybe_seen(table, device_id, *k)]
+        stored = await _stored_ids(db, model, device_id, maybe_seen) if maybe_seen else {}
+        rows = [row for k, row in keyed.items() if k not in stored]
+
+        inserted: Dict[ReadingKey, int] = {}
+        if rows:
+            result = await db.execute(
+                insert(model).on_conflict_do_nothing(index_elements=READING_KEY)
+                .returning(model.id, model.patient_id, model.timestamp),
+                rows
+            )
+            inserted = {(p, ts): id for id, p, ts in result}
+            if len(inserted) < len(rows):
+                # Stored by another process, or before the prefilter knew about it.
+                missed = [k for k in keyed if k not in inserted and k not in stored]
+                stored.update(await _stored_ids(db, model, device_id, missed))
+                rows = [r for r in rows if (r["patient_id"], r["timestamp"]) in inserted]
+
+        claimed = set()
+        for i, key in zip(positions, keys):
+            if key in inserted and key not in claimed:
+                claimed.add(key)
+                ids[i] = inserted[key]
+            else:
+                duplicates.add(i)
+                ids[i] = inserted.get(key) or stored.get(key, 0)
+
+        if not rows:
+            continue
+        new_ids = [inserted[(r["patient_id"], r["timestamp"])] for r in rows]
+        if settings.ROLLUPS_ENABLED:
+            await rollups.apply(db, model, rows)
+        on_commit(db, partial(seen.remember, table, device_id, list(inserted)))
+        if recent.enabled:
+            on_commit(db, partial(recent.add, model, rows, new_ids))
+        # Whether anyone is watching is decided at commit: a subscriber that
+        # connects before then may not see these rows in its database snapshot.
+        on_commit(db, partial(broker.publish, model, rows, new_ids))
+        if alert_engine.enabled:
+            on_commit(db, partial(alert_engine.observe, model, rows, new_ids))
+        if response_cache.enabled:
+            on_commit(db, partial(response_cache.invalidate, table, device_id, [r["timestamp"] for r in rows]))
+    return Written(ids, duplicates)
@@ -0,0 +1,59 @@
+# app/keys.py
+"""
+Generate a JWT signing key pair for JWT_ALGORITHM:
+
+    python -m app.keys --algorithm EdDSA --private private.pem --public public.pem
+
+RS256/RS512 use 2048-bit RSA keys. ES256 (P-256) and EdDSA (Ed25519) sign
+about ten times faster and make much shorter tokens, which matters when
+provisioning thousands of devices through POST /register/batch.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+ALGORITHMS = ("RS256", "RS512", "ES256", "ES384", "EdDSA")
+
+
+def generate(algorithm: str) -> Tuple[bytes, bytes]:
+    """(private PEM, public PEM) for `algorithm`."""
+    if algorithm.startswith("RS"):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "ES256":
+        key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "ES384":
+        key = ec.generate_private_key(ec.SECP384R1())
+    elif algorithm == "EdDSA":
+        key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"Unsupported algorithm {algorithm}")
+    private = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private, public
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.keys", description="Generate a JWT signing key pair")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="EdDSA")
+    parser.add_argument("--private", required=True, help="path for the private key PEM")
+    parser.add_argument("--public", required=True, help="path for the public key PEM")
+    args = parser.parse_args(argv)
+
+    private, public = generate(args.algorithm)
+    Path(args.private).write_bytes(private)
+    Path(args.private).chmod(0o600)
+    Path(args.public).write_bytes(public)
+    print(f"Wrote {args.algorithm} keys; set JWT_ALGORITHM={args.algorithm}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# app/live.py
+"""
+Live feed of committed readings, served as Server-Sent Events by GET /readings/stream.
+
+write_readings hands rows to the in-process broker once their transaction
+commits, and the broker passes them on to whoever is watching the device by
+then. Event ids are "<last heart_rate id>:<last blood_pressure id>", so a
+client reconnecting with Last-Event-ID (or ?last_id=) is first replayed what
+it missed from the database and then switched to the live feed. A subscriber
+that falls more than SSE_QUEUE_SIZE events behind is disconnected and recovers
+the same way.
+
+Like app/recent.py, the broker only sees readings written by this process.
+
+Ids follow commit order on SQLite, which has one writer at a time. On Postgres
+concurrent ingest transactions can commit out of id order: a connected client
+still gets every reading live, but a reading committed while the client was
+away, with an id below one it had already seen, is not part of the replay
+after Last-Event-ID. There the feed is gap-free only while connected.
+"""
+import asyncio
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.db import async_session
+from app.models import HeartRate, BloodPressure
+from app.metrics import metrics
+from app.queries import out_columns
+from app.responses import dumps
+from app.schemas import HeartRateOut, BloodPressureOut
+
+MODELS = ((HeartRate, HeartRateOut), (BloodPressure, BloodPressureOut))
+
+REPLAY_BATCH = 1000
+
+
+class Subscription:
+    __slots__ = ("device_id", "patient_id", "queue", "overflowed")
+
+    def __init__(self, device_id: str, patient_id: Optional[str], maxsize: int):
+        self.device_id = device_id
+        self.patient_id = patient_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class Broker:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, device_id: str, patient_id: Optional[str] = None) -> Subscription:
+        sub = Subscription(device_id, patient_id, self.queue_size)
+        self.subscribers[device_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self.subscribers.get(sub.device_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self.subscribers[sub.device_id]
+
+    def publish(self, model, rows: List[dict], ids: List[int]):
+        if not self.subscribers:
+            return
+        table = model.__tablename__
+        for row, id in zip(rows, ids):
+            subs = self.subscribers.get(row["device_id"])
+            if not subs:
+                continue
+            for sub in list(subs):
+                if sub.patient_id is not None and sub.patient_id != row["patient_id"]:
+                    continue
+                try:
+                    sub.queue.put_nowait((table, id, row))
+                except asyncio.QueueFull:
+                    sub.overflowed = True
+                    self.unsubscribe(sub)
+
+    def collect(self):
+        yield "medtrack_sse_subscribers", "gauge", (), sum(len(s) for s in self.subscribers.values())
+
+
+broker = Broker(settings.SSE_QUEUE_SIZE)
+metrics.add_collector(broker.collect)
+
+
+def parse_last_id(value: str) -> Dict[str, int]:
+    try:
+        ids = [int(part) for part in value.split(":")]
+    except ValueError:
+        ids = []
+    if len(ids) != len(MODELS):
+        raise HTTPException(status_code=400, detail="Invalid last event id")
+    return {model.__tablename__: id for (model, _), id in zip(MODELS, ids)}
+
+
+def _event(table: str, row: dict, cursor: Dict[str, int]) -> str:
+    event_id = ":".join(str(cursor[model.__tablename__]) for model, _ in MODELS)
+    return f"id: {event_id}\nevent: {table}\ndata: {dumps(row).decode()}\n\n"
+
+
+async def _fetch(query) -> List[dict]:
+    async with async_session() as db:
+        return [dict(row) for row in (await db.execute(query)).mappings()]
+
+
+async def _query(query) -> List[dict]:
+    """
+    Run `query` in its own short session, shielded from the cancellation that a
+    client disconnect delivers to the stream, so a connection is never returned
+    to the pool half-way through a statement.
+    """
+    return await asyncio.shield(_fetch(query))
+
+
+async def _current_ids() -> Dict[str, int]:
+    ids = {}
+    for model, _ in MODELS:
+        rows = await _query(select(func.max(model.id).label("id")))
+        ids[model.__tablename__] = rows[0]["id"] or 0
+    return ids
+
+
+async def _replay(device_id: str, patient_id: Optional[str], cursor: Dict[str, int]):
+    """Rows committed after `cursor`, per table in id order; no connection is held between pages."""
+    for model, schema in MODELS:
+        table = model.__tablename__
+        query = select(*out_columns(model, schema)).where(model.device_id == device_id)
+        if patient_id is not None:
+            query = query.where(model.patient_id == patient_id)
+        while True:
+            page = query.where(model.id > cursor[table]).order_by(model.id).limit(REPLAY_BATCH)
+            rows = await _query(page)
+            for row in rows:
+                cursor[table] = row["id"]
+                yield table, row
+            if len(rows) < REPLAY_BATCH:
+                break
+
+
+async def event_stream(device_id: str, patient_id: Optional[str], cursor: Optional[Dict[str, int]]):
+    # Subscribe before reading the database so nothing committed in between is
+    # missed. Live events are not skipped by id - a lower id can commit after a
+    # higher one - only when the replay already sent that row. The queue holds
+    # at most SSE_QUEUE_SIZE events, so only that many of the newest replayed
+    # rows are remembered; an older one that still turns up live is sent twice.
+    sub = broker.subscribe(device_id, patient_id)
+    last_replayed: Deque[Tuple[str, int]] = deque(maxlen=settings.SSE_QUEUE_SIZE)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        if cursor is None:
+            cursor = await _current_ids()
+        else:
+            async for table, row in _replay(device_id, patient_id, cursor):
+                last_replayed.append((table, row["id"]))
+                yield _event(table, row, cursor)
+        replayed = set(last_replayed)
+
+        while True:
+            if sub.overflowed and sub.queue.empty():
+                return
+            try:
+                table, id, row = await asyncio.wait_for(sub.queue.get(), settings.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if (table, id) in replayed:
+                continue
+            cursor[table] = max(cursor[table], id)
+            yield _event(table, {"id": id, **row}, cursor)
+    finally:
+        broker.unsubscribe(sub)
@@ -0,0 +1,227 @@
+# app/metrics.py
+"""
+Low-overhead in-process metrics rendered in the Prometheus text format.
+
+- MetricsMiddleware times every HTTP request by method, route template and status.
+- TimedRoute times the endpoint body; the gap between it returning and the
+  response starting is recorded as the "serialize" stage.
+- span(stage) times arbitrary stages (auth, commit, ...).
+- instrument_engine() times every DB statement by verb.
+- Collectors registered with add_collector() report gauges such as pool stats.
+"""
+import asyncio
+import functools
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from app.config import settings
+
+Labels = Tuple[Tuple[str, str], ...]
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = "medtrack_http_request_seconds"
+STAGE_SECONDS = "medtrack_stage_seconds"
+DB_SECONDS = "medtrack_db_statement_seconds"
+
+HELP = {
+    REQUEST_SECONDS: "HTTP request latency by method, route and status",
+    STAGE_SECONDS: "Time spent per request stage",
+    DB_SECONDS: "Database statement latency by verb",
+}
+
+_request_state: ContextVar[dict] = ContextVar("medtrack_request_state")
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.help: Dict[str, str] = dict(HELP)
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, Labels, float]]]] = []
+
+    def observe(self, name: str, labels: Labels, value: float):
+        series = self.histograms.get(name)
+        if series is None:
+            series = self.histograms[name] = {}
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1):
+        series = self.counters.get(name)
+        if series is None:
+            series = self.counters[name] = {}
+        series[labels] = series.get(labels, 0) + amount
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, str, Labels, float]]]):
+        """`fn` yields (name, type, labels, value) samples when /metrics is scraped."""
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_fmt(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_fmt(labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{name}_sum{_fmt(labels)} {h.sum}")
+                lines.append(f"{name}_count{_fmt(labels)} {h.count}")
+        for name, series in sorted(self.counters.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_fmt(labels)} {value}")
+        families: Dict[str, Tuple[str, list]] = {}
+        for collector in self.collectors:
+            for name, kind, labels, value in collector():
+                families.setdefault(name, (kind, []))[1].append((labels, value))
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+metrics = Metrics(settings.METRICS_ENABLED)
+
+_stage_labels: Dict[str, Labels] = {}
+
+
+@contextmanager
+def span(stage: str):
+    if not metrics.enabled:
+        yield
+        return
+    labels = _stage_labels.get(stage)
+    if labels is None:
+        labels = _stage_labels[stage] = (("stage", stage),)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(STAGE_SECONDS, labels, perf_counter() - start)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"status": 500}
+        token = _request_state.set(state)
+        start = perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                endpoint_end = state.get("endpoint_end")
+                if endpoint_end is not None:
+                    metrics.observe(STAGE_SECONDS, (("stage", "serialize"),), perf_counter() - endpoint_end)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _request_state.reset(token)
+            route = scope.get("route")
+            labels = (
+                ("method", scope["method"]),
+                ("route", getattr(route, "path", "<unmatched>")),
+                ("status", str(state["status"])),
+            )
+            metrics.observe(REQUEST_SECONDS, labels, perf_counter() - start)
+
+
+def _timed_endpoint(fn):
+    labels = (("stage", "endpoint"),)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            end = perf_counter()
+            metrics.observe(STAGE_SECONDS, labels, end - start)
+            state = _request_state.get(None)
+            if state is not None:
+                state["endpoint_end"] = end
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if metrics.enabled and asyncio.iscoroutinefunction(endpoint):
+            endpoint = _timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def instrument_engine(engine, name: str = "primary"):
+    """Time every statement on `engine` and report its pool on /metrics."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._medtrack_start = perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_medtrack_start", None)
+        if start is None:
+            return
+        elapsed = perf_counter() - start
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        metrics.observe(DB_SECONDS, (("engine", name), ("op", verb)), elapsed)
+
+    def pool_stats():
+        pool = sync_engine.pool
+        labels = (("engine", name),)
+        for attr in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, attr, None)
+            if callable(fn):
+                yield f"medtrack_db_pool_{attr}", "gauge", labels, fn()
+
+    metrics.add_collector(pool_stats)
@@ -0,0 +1,205 @@
+# app/migrations.py
+"""
+Versioned schema migrations.
+
+schema_version records every migration applied. At startup migrate() reads the
+current version with one query and returns immediately when it is up to date;
+otherwise it takes a database-wide lock (pg_advisory_xact_lock on Postgres,
+BEGIN IMMEDIATE on SQLite), re-reads the version and applies whatever is still
+pending in the same transaction, so workers starting together neither race nor
+repeat work.
+
+To change the schema, append a (version, name, fn) entry to MIGRATIONS where
+fn(conn) is an async function; never edit one that has shipped.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Column, DateTime, Integer, String, Table, delete, func, insert, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app import partitions, rollups
+from app.db import Base, engine
+from app.models import Alert, DevicePatientAssignment, HeartRate, BloodPressure, IdempotencyKey, PARTITIONED_MODELS
+
+logger = logging.getLogger("medtrack.migrations")
+
+# Arbitrary key for the Postgres advisory lock held while migrating.
+LOCK_KEY = 0x6D656474
+
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+async def _rebuild_rollups(conn: AsyncConnection, model, from_time=None, to_time=None):
+    session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+    await rollups.rebuild(session, model, from_time, to_time)
+    await session.flush()
+
+
+async def _initial_schema(conn: AsyncConnection):
+    existing = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+    await conn.run_sync(Base.metadata.create_all)
+
+    # Databases created before migrations existed may have the tables but not
+    # every index declared on the models. Unique indexes are left to the
+    # migrations that introduce them, which first clean up conflicting rows.
+    def create_indexes(sync_conn):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if not index.unique:
+                    index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create_indexes)
+    if PARTITIONED_MODELS:
+        await partitions.ensure(conn)
+
+    # Readings stored before the rollup tables existed are folded in now, or
+    # aggregates served from rollups would leave them out.
+    for model, rollup in rollups.ROLLUPS.items():
+        if model.__tablename__ in existing and rollup.__tablename__ not in existing:
+            await _rebuild_rollups(conn, model)
+
+
+async def _unique_readings(conn: AsyncConnection):
+    """Drop repeated (device, patient, timestamp) readings, keeping the first, then add the unique indexes."""
+    for model in (HeartRate, BloodPressure):
+        keep = select(func.min(model.id)).group_by(model.device_id, model.patient_id, model.timestamp)
+        repeated = model.id.not_in(keep.scalar_subquery())
+        first, last = (await conn.execute(select(func.min(model.timestamp), func.max(model.timestamp)).where(repeated))).one()
+        if first is None:
+            continue
+        result = await conn.execute(delete(model).where(repeated))
+        logger.info("Removed %d duplicate %s readings", result.rowcount, model.__tablename__)
+        # The duplicates were counted in the rollups too.
+        await _rebuild_rollups(conn, model, first, last)
+
+    def create(sync_conn):
+        IdempotencyKey.__table__.create(sync_conn, checkfirst=True)
+        for model in (HeartRate, BloodPressure, IdempotencyKey):
+            for index in model.__table__.indexes:
+                index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create)
+
+
+async def _patient_indexes(conn: AsyncConnection):
+    def create(sync_conn):
+        for model in (HeartRate, BloodPressure):
+            for index in model.__table__.indexes:
+                index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create)
+
+
+async def _alerts(conn: AsyncConnection):
+    def create(sync_conn):
+        Alert.__table__.create(sync_conn, checkfirst=True)
+        for index in Alert.__table__.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create)
+
+
+async def _unique_assignments(conn: AsyncConnection):
+    """Drop repeated device/patient assignments, keeping the first, then replace the plain index with a unique one."""
+    model = DevicePatientAssignment
+    keep = select(func.min(model.id)).group_by(model.device_id, model.patient_id)
+    result = await conn.execute(delete(model).where(model.id.not_in(keep.scalar_subquery())))
+    if result.rowcount:
+        logger.info("Removed %d duplicate device/patient assignments", result.rowcount)
+
+    def create(sync_conn):
+        for index in model.__table__.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create)
+    # Declared by the models before migrations existed; the unique index covers it.
+    await conn.execute(text("DROP INDEX IF EXISTS idx_assignment_device_patient"))
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "unique readings and idempotency keys", _unique_readings),
+    (3, "patient/time indexes on readings", _patient_indexes),
+    (4, "alert table", _alerts),
+    (5, "unique device/patient assignments", _unique_assignments),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+async def current_version(engine: AsyncEngine) -> int:
+    """Applied schema version, 0 for an empty database."""
+    try:
+        async with engine.connect() as conn:
+            return (await conn.execute(select(func.max(schema_version.c.version)))).scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+@asynccontextmanager
+async def _locked(engine: AsyncEngine):
+    """A connection inside a transaction that holds the migration lock."""
+    async with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            # BEGIN IMMEDIATE takes the write lock up front; other workers wait for it.
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                await conn.exec_driver_sql("ROLLBACK")
+                raise
+            await conn.exec_driver_sql("COMMIT")
+            return
+        async with conn.begin():
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+            yield conn
+
+
+async def migrate(engine: AsyncEngine, reset: bool = False) -> List[int]:
+    """Bring the schema up to LATEST. `reset` drops everything first. Returns the versions applied."""
+    if not reset and await current_version(engine) >= LATEST:
+        return []
+
+    applied = []
+    async with _locked(engine) as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(schema_version.create, checkfirst=True)
+        version = (await conn.execute(select(func.max(schema_version.c.version)))).scalar() or 0
+        for number, name, fn in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info("Applying migration %d: %s", number, name)
+            await fn(conn)
+            await conn.execute(insert(schema_version).values(version=number, name=name))
+            applied.append(number)
+    return applied
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Apply pending schema migrations")
+    parser.add_argument("--reset", action="store_true", help="drop every table first")
+    args = parser.parse_args(argv)
+    applied = await migrate(engine, reset=args.reset)
+    print(f"schema at version {LATEST}" + (f", applied {applied}" if applied else ", nothing to do"), file=sys.stderr)
+    await engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,9 +1,25 @@
 # app/models.py
 from datetime import datetime
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy import String, Integer, BigInteger, DateTime, Float, ForeignKey, Text
+from sqlalchemy.engine import make_url
+from app.config import settings
 from app.db import Base
 
+# On Postgres the raw reading tables are range-partitioned on timestamp (app/partitions.py).
+# A partitioned table's primary key has to include the partition key.
+PARTITIONED = (
+    settings.PARTITION_INTERVAL != "none"
+    and make_url(settings.DATABASE_URL).get_backend_name() == "postgresql"
+)
+
+
+def _reading_table_args(*indexes):
+    if PARTITIONED:
+        return (*indexes, {"postgresql_partition_by": "RANGE (timestamp)"})
+    return indexes
+
+
 class Device(Base):
     __tablename__ = "device"
     device_id: Mapped[str] = mapped_column(String, primary_key=True)
@@ -20,40 +36,116 @@ from sqlalchemy import Index
 
 class HeartRate(Base):
     __tablename__ = "heart_rate"
-    __table_args__ = (
+    __table_args__ = _reading_table_args(
         Index("idx_hr_device_time", "device_id", "timestamp"),
+        Index("idx_hr_patient_time", "patient_id", "timestamp"),
+        Index("uq_hr_reading", "device_id", "patient_id", "timestamp", unique=True),
     )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
     patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
-    timestamp: Mapped[datetime] = mapped_column(DateTime)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=PARTITIONED)
     heart_rate: Mapped[int] = mapped_column(Integer)
     quality: Mapped[str] = mapped_column(String)
 
 
 class BloodPressure(Base):
     __tablename__ = "blood_pressure"
-    __table_args__ = (
+    __table_args__ = _reading_table_args(
         Index("idx_bp_device_time", "device_id", "timestamp"),
+        Index("idx_bp_patient_time", "patient_id", "timestamp"),
+        Index("uq_bp_reading", "device_id", "patient_id", "timestamp", unique=True),
     )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
     patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
-    timestamp: Mapped[datetime] = mapped_column(DateTime)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=PARTITIONED)
     systolic: Mapped[int] = mapped_column(Integer)
     diastolic: Mapped[int] = mapped_column(Integer)
     pulse: Mapped[int] = mapped_column(Integer)
 
 
+PARTITIONED_MODELS = (HeartRate, BloodPressure) if PARTITIONED else ()
+
+
 class DevicePatientAssignment(Base):
     __tablename__ = "device_patient_assignment"
     __table_args__ = (
-        Index("idx_assignment_device_patient", "device_id", "patient_id"),
+        Index("uq_assignment_device_patient", "device_id", "patient_id", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
+    patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
+    assigned_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class HeartRateRollup(Base):
+    __tablename__ = "heart_rate_rollup"
+    __table_args__ = (
+        Index("uq_hr_rollup_bucket", "granularity", "device_id", "patient_id", "bucket_start", unique=True),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    granularity: Mapped[str] = mapped_column(String)
     device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
     patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
-    assigned_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    bucket_start: Mapped[datetime] = mapped_column(DateTime)
+    count: Mapped[int] = mapped_column(Integer)
+    heart_rate_sum: Mapped[int] = mapped_column(BigInteger)
+    heart_rate_min: Mapped[int] = mapped_column(Integer)
+    heart_rate_max: Mapped[int] = mapped_column(Integer)
+
+
+class BloodPressureRollup(Base):
+    __tablename__ = "blood_pressure_rollup"
+    __table_args__ = (
+        Index("uq_bp_rollup_bucket", "granularity", "device_id", "patient_id", "bucket_start", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    granularity: Mapped[str] = mapped_column(String)
+    device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
+    patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
+    bucket_start: Mapped[datetime] = mapped_column(DateTime)
+    count: Mapped[int] = mapped_column(Integer)
+    systolic_sum: Mapped[int] = mapped_column(BigInteger)
+    systolic_min: Mapped[int] = mapped_column(Integer)
+    systolic_max: Mapped[int] = mapped_column(Integer)
+    diastolic_sum: Mapped[int] = mapped_column(BigInteger)
+    diastolic_min: Mapped[int] = mapped_column(Integer)
+    diastolic_max: Mapped[int] = mapped_column(Integer)
+    pulse_sum: Mapped[int] = mapped_column(BigInteger)
+    pulse_min: Mapped[int] = mapped_column(Integer)
+    pulse_max: Mapped[int] = mapped_column(Integer)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+
+    device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"), primary_key=True)
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    response: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class Alert(Base):
+    __tablename__ = "alert"
+    __table_args__ = (
+        Index("idx_alert_patient", "patient_id", "id"),
+        Index("idx_alert_device", "device_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    rule: Mapped[str] = mapped_column(String)
+    severity: Mapped[str] = mapped_column(String)
+    device_id: Mapped[str] = mapped_column(String, ForeignKey("device.device_id"))
+    patient_id: Mapped[str] = mapped_column(String, ForeignKey("patient.patient_id"))
+    metric: Mapped[str] = mapped_column(String)
+    value: Mapped[float] = mapped_column(Float)
+    threshold: Mapped[float] = mapped_column(Float)
+    reading_type: Mapped[str] = mapped_column(String)
+    reading_id: Mapped[int] = mapped_column(Integer)
+    timestamp: Mapped[datetime] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
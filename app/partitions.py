@@ -0,0 +1,113 @@
+# app/partitions.py
+"""
+Native range partitions on Postgres for the raw reading tables.
+
+With PARTITION_INTERVAL set to "month" or "week" (it is "none" by default),
+heart_rate and blood_pressure are created PARTITION BY RANGE (timestamp) (see
+app/models.py) with one partition per interval named <table>_p<YYYYMMDD of the
+start>, plus a <table>_default partition for readings outside every range.
+ensure() creates the partitions from the current interval to PARTITIONS_AHEAD
+intervals ahead; drop_before() detaches and drops whole partitions that end at
+or before a cutoff, which is O(1) per partition.
+
+Tables that already existed as plain tables are not converted: ensure() skips
+them with a warning and retention deletes their rows in batches instead.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import settings
+from app.models import PARTITIONED_MODELS
+
+logger = logging.getLogger("medtrack.partitions")
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def interval_start(dt: datetime, interval: str) -> datetime:
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "month":
+        return day.replace(day=1)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def next_start(start: datetime, interval: str) -> datetime:
+    if interval == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=7)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """(name, start, end) of every partition of `table`; the default partition has no bounds."""
+    result = await conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table ORDER BY c.relname"
+    ), {"table": table})
+    partitions = []
+    for name, bound in result:
+        match = _BOUND.search(bound or "")
+        if match:
+            partitions.append((name, datetime.fromisoformat(match[1]), datetime.fromisoformat(match[2])))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table"
+    ), {"table": table})
+    return result.first() is not None
+
+
+async def ensure(conn: AsyncConnection, now: Optional[datetime] = None, ahead: Optional[int] = None) -> List[str]:
+    """Create the default partition and the partitions up to `ahead` intervals past now. Returns new names."""
+    interval = settings.PARTITION_INTERVAL
+    now = now or datetime.utcnow()
+    ahead = settings.PARTITIONS_AHEAD if ahead is None else ahead
+    created = []
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        if not await is_partitioned(conn, table):
+            logger.warning("%s was created before partitioning was enabled and is left unpartitioned", table)
+            continue
+        existing = {name for name, _, _ in await list_partitions(conn, table)}
+        if f"{table}_default" not in existing:
+            await conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+            created.append(f"{table}_default")
+        start = interval_start(now, interval)
+        for _ in range(ahead + 1):
+            end = next_start(start, interval)
+            name = partition_name(table, start)
+            if name not in existing:
+                await conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+                ))
+                created.append(name)
+            start = end
+    return created
+
+
+async def drop_before(conn: AsyncConnection, model, cutoff: datetime) -> List[str]:
+    """Detach and drop the partitions of `model` that only hold rows older than `cutoff`."""
+    table = model.__tablename__
+    dropped = []
+    for name, _, end in await list_partitions(conn, table):
+        if end is not None and end <= cutoff:
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
@@ -0,0 +1,85 @@
+# app/patients.py
+"""
+Patient-centric reads for GET /patients/{patient_id}/readings.
+
+A patient's heart rate and blood pressure readings, from every device that
+was ever assigned to them, come back in one statement: a UNION ALL of one
+branch per table, each an index range scan on (patient_id, timestamp) that
+stops after a page worth of rows, merged and cut to the page by the outer
+ORDER BY timestamp, type, id. Pages continue with a keyset cursor on
+(timestamp, type, id), pushed down into each branch.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, cast, literal, null, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import HeartRate, BloodPressure
+from app.queries import encode_cursor, decode_cursor
+
+# Output columns, and the reading tables in the order their rows sort at equal timestamps.
+COLUMNS = ("id", "device_id", "patient_id", "timestamp", "heart_rate", "quality", "systolic", "diastolic", "pulse")
+MODELS = {BloodPressure.__tablename__: BloodPressure, HeartRate.__tablename__: HeartRate}
+
+
+def encode_patient_cursor(type: str, timestamp: datetime, id: int) -> str:
+    return f"{type}.{encode_cursor(timestamp, id)}"
+
+
+def decode_patient_cursor(cursor: str) -> Tuple[datetime, str, int]:
+    type, _, rest = cursor.partition(".")
+    if type not in MODELS:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    timestamp, id = decode_cursor(rest)
+    return timestamp, type, id
+
+
+def _branch(type: str, patient_id: str, from_time: Optional[datetime], to_time: Optional[datetime],
+            after: Optional[Tuple[datetime, str, int]], limit: int):
+    model = MODELS[type]
+    columns = [literal(type, String).label("type")]
+    for name in COLUMNS:
+        column = model.__table__.c.get(name)
+        if column is None:
+            column = cast(null(), String if name == "quality" else Integer)
+        columns.append(column.label(name))
+
+    query = select(*columns).where(model.patient_id == patient_id)
+    if from_time:
+        query = query.where(model.timestamp >= from_time)
+    if to_time:
+        query = query.where(model.timestamp <= to_time)
+    if after is not None:
+        # (timestamp, type, id) > cursor, with `type` fixed for this branch
+        ts, after_type, after_id = after
+        if type > after_type:
+            query = query.where(model.timestamp >= ts)
+        elif type < after_type:
+            query = query.where(model.timestamp > ts)
+        else:
+            query = query.where(tuple_(model.timestamp, model.id) > tuple_(ts, after_id))
+    return select(query.order_by(model.timestamp, model.id).limit(limit).subquery())
+
+
+async def readings_page(
+        db: AsyncSession,
+        patient_id: str,
+        from_time: Optional[datetime],
+        to_time: Optional[datetime],
+        cursor: Optional[str],
+        limit: int,
+) -> Tuple[List[dict], Optional[str]]:
+    """Up to `limit` readings in (timestamp, type, id) order and the cursor of the next page, if any."""
+    after = decode_patient_cursor(cursor) if cursor else None
+    merged = union_all(*(
+        _branch(type, patient_id, from_time, to_time, after, limit + 1) for type in MODELS
+    )).subquery()
+    query = select(merged).order_by(merged.c.timestamp, merged.c.type, merged.c.id).limit(limit + 1)
+    rows = [dict(row) for row in (await db.execute(query)).mappings()]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_patient_cursor(last["type"], last["timestamp"], last["id"])
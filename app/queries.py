@@ -0,0 +1,75 @@
+# app/queries.py
+import base64
+from datetime import datetime, timezone
+from typing import Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, tuple_, func, cast, BigInteger, Integer
+from sqlalchemy.sql import Select
+
+from app.db import read_session
+from app.responses import dumps
+
+
+def range_query(model, device_id: str, from_time: Optional[datetime], to_time: Optional[datetime], *columns) -> Select:
+    query = select(*columns) if columns else select(model)
+    query = query.where(model.device_id == device_id)
+    if from_time:
+        query = query.where(model.timestamp >= from_time)
+    if to_time:
+        query = query.where(model.timestamp <= to_time)
+    return query
+
+
+def out_columns(model, schema: Type[BaseModel]):
+    """Table columns named like the fields of an *Out schema, in field order."""
+    return [model.__table__.c[name] for name in schema.model_fields]
+
+
+BUCKET_SECONDS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+
+
+def bucket_epoch(column, seconds: int, dialect: str):
+    """SQL expression for the epoch second at which `column`'s bucket starts."""
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), Integer) // seconds * seconds
+    if dialect == "postgresql":
+        return cast(func.floor(func.extract("epoch", column) / seconds) * seconds, BigInteger)
+    raise NotImplementedError(f"Time buckets are not supported for {dialect}")
+
+
+def from_epoch(epoch: int) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+def encode_cursor(timestamp: datetime, id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(query: Select, model, cursor: Optional[str], limit: Optional[int]) -> Select:
+    """Order by (timestamp, id) and continue after `cursor`, fetching one extra row to detect a next page."""
+    query = query.order_by(model.timestamp, model.id)
+    if cursor:
+        query = query.where(tuple_(model.timestamp, model.id) > tuple_(*decode_cursor(cursor)))
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
+
+async def stream_ndjson(query: Select, batch_size: int = 1000):
+    """Yield query rows as NDJSON from a server-side cursor in its own session."""
+    async with read_session() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.mappings().partitions():
+            yield b"".join(dumps(dict(row)) + b"\n" for row in rows)
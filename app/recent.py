@@ -0,0 +1,226 @@
+# app/recent.py
+"""
+In-memory window of the most recent readings per (table, device, patient),
+fed by committed ingests and used to answer recent range queries and
+/readings/latest without touching the database.
+
+The window only sees readings written by this process, so enable it
+(RECENT_WINDOW_SECONDS > 0) only where a single process writes the database.
+"""
+import calendar
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.models import HeartRate, BloodPressure
+from app.queries import from_epoch
+
+FIELDS = {
+    HeartRate: ("heart_rate",),
+    BloodPressure: ("systolic", "diastolic", "pulse"),
+}
+
+SeriesKey = Tuple[str, str, str]
+
+
+def _epoch(dt: datetime) -> float:
+    return calendar.timegm(dt.timetuple())
+
+
+def _columns(model):
+    columns = [model.id, model.device_id, model.patient_id, model.timestamp, *(getattr(model, f) for f in FIELDS[model])]
+    if model is HeartRate:
+        columns.append(model.quality)
+    return columns
+
+
+def _latest_query(model, columns, device_id: Optional[str] = None):
+    """Rows holding the newest timestamp of each (device, patient) series."""
+    newest = select(model.device_id, model.patient_id, func.max(model.timestamp).label("timestamp"))
+    if device_id is not None:
+        newest = newest.where(model.device_id == device_id)
+    newest = newest.group_by(model.device_id, model.patient_id).subquery()
+    return select(*columns).join(
+        newest,
+        (model.device_id == newest.c.device_id)
+        & (model.patient_id == newest.c.patient_id)
+        & (model.timestamp == newest.c.timestamp)
+    )
+
+
+async def latest_from_db(db: AsyncSession, device_id: str) -> Dict[str, Dict[str, dict]]:
+    out: Dict[str, Dict[str, dict]] = defaultdict(dict)
+    for model in FIELDS:
+        table = model.__tablename__
+        for row in (await db.execute(_latest_query(model, _columns(model), device_id))).mappings():
+            current = out[row["patient_id"]].get(table)
+            if current is None or row["id"] > current["id"]:
+                out[row["patient_id"]][table] = dict(row)
+    return out
+
+
+class SeriesRing:
+    """Fixed-capacity ring of (id, timestamp, values) in parallel arrays."""
+
+    __slots__ = ("capacity", "ids", "ts", "values", "quality", "head", "size", "evicted_max")
+
+    def __init__(self, capacity: int, nfields: int, with_quality: bool):
+        self.capacity = capacity
+        self.ids = array("q", bytes(8 * capacity))
+        self.ts = array("d", bytes(8 * capacity))
+        self.values = [array("l", bytes(array("l").itemsize * capacity)) for _ in range(nfields)]
+        self.quality: Optional[List[Optional[str]]] = [None] * capacity if with_quality else None
+        self.head = 0
+        self.size = 0
+        # Newest timestamp that has been evicted; anything at or before it may be incomplete.
+        self.evicted_max = float("-inf")
+
+    def append(self, id: int, ts: float, values, quality: Optional[str]):
+        if self.size == self.capacity:
+            self._evict()
+        i = (self.head + self.size) % self.capacity
+        self.ids[i] = id
+        self.ts[i] = ts
+        for column, value in zip(self.values, values):
+            column[i] = value
+        if self.quality is not None:
+            self.quality[i] = quality
+        self.size += 1
+
+    def _evict(self):
+        self.evicted_max = max(self.evicted_max, self.ts[self.head])
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
+
+    def trim(self, cutoff: float):
+        while self.size and self.ts[self.head] < cutoff:
+            self._evict()
+
+    def positions(self):
+        for k in range(self.size):
+            yield (self.head + k) % self.capacity
+
+
+class RecentReadings:
+    def __init__(self, window_seconds: int, capacity: int):
+        self.window = window_seconds
+        self.capacity = capacity
+        self.series: Dict[SeriesKey, SeriesRing] = {}
+        self.latest: Dict[SeriesKey, dict] = {}
+        self.by_device: Dict[str, Set[SeriesKey]] = defaultdict(set)
+        # Epoch from which every reading is known to be in the window; None until preloaded.
+        self.since: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, model, rows: List[dict], ids: List[int]):
+        if not self.enabled:
+            return
+        fields = FIELDS[model]
+        table = model.__tablename__
+        cutoff = time.time() - self.window
+        for row, id in zip(rows, ids):
+            key = self._remember_latest(table, row, id)
+            ts = _epoch(row["timestamp"])
+            if ts < cutoff:
+                continue
+            ring = self.series.get(key)
+            if ring is None:
+                ring = self.series[key] = SeriesRing(self.capacity, len(fields), model is HeartRate)
+            ring.trim(cutoff)
+            ring.append(id, ts, [row[f] for f in fields], row.get("quality"))
+
+    def _remember_latest(self, table: str, row: dict, id: int) -> SeriesKey:
+        key = (table, row["device_id"], row["patient_id"])
+        latest = self.latest.get(key)
+        if latest is None or (row["timestamp"], id) > (latest["timestamp"], latest["id"]):
+            self.latest[key] = {"id": id, **row}
+            self.by_device[row["device_id"]].add(key)
+        return key
+
+    def range(self, model, device_id: str, from_time: Optional[datetime], to_time: Optional[datetime]):
+        """Rows for the range, or None if the window cannot answer it completely."""
+        if not self.enabled or self.since is None or from_time is None:
+            return None
+        start = _epoch(from_time.replace(tzinfo=None))
+        cutoff = time.time() - self.window
+        if start < max(self.since, cutoff):
+            self.misses += 1
+            return None
+
+        table = model.__tablename__
+        fields = FIELDS[model]
+        keys = [k for k in self.by_device.get(device_id, ()) if k[0] == table and k in self.series]
+        if any(start <= self.series[k].evicted_max for k in keys):
+            self.misses += 1
+            return None
+
+        end = _epoch(to_time.replace(tzinfo=None)) if to_time is not None else float("inf")
+        rows = []
+        for key in keys:
+            ring = self.series[key]
+            for i in ring.positions():
+                ts = ring.ts[i]
+                if ts < start or ts > end:
+                    continue
+                row = {
+                    "id": ring.ids[i],
+                    "device_id": key[1],
+                    "patient_id": key[2],
+                    "timestamp": from_epoch(int(ts)),
+                }
+                for f, column in zip(fields, ring.values):
+                    row[f] = column[i]
+                if ring.quality is not None:
+                    row["quality"] = ring.quality[i]
+                rows.append(row)
+        rows.sort(key=lambda r: (r["timestamp"], r["id"]))
+        self.hits += 1
+        return rows
+
+    def latest_for(self, device_id: str) -> Dict[str, Dict[str, dict]]:
+        """{patient_id: {table: latest row}} for the device, in O(series)."""
+        out: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        for key in self.by_device.get(device_id, ()):
+            out[key[2]][key[0]] = self.latest[key]
+        return out
+
+    async def preload(self, db: AsyncSession):
+        """Seed the window with recent rows and the latest row of every series."""
+        if not self.enabled:
+            return
+        started = time.time()
+        window_start = from_epoch(int(started - self.window))
+        for model in FIELDS:
+            columns = _columns(model)
+
+            query = _latest_query(model, columns)
+            for row in (await db.execute(query)).mappings():
+                row = dict(row)
+                self._remember_latest(model.__tablename__, row, row.pop("id"))
+
+            result = await db.execute(
+                select(*columns).where(model.timestamp >= window_start).order_by(model.timestamp, model.id)
+            )
+            rows = [dict(r) for r in result.mappings()]
+            self.add(model, [{k: v for k, v in r.items() if k != "id"} for r in rows], [r["id"] for r in rows])
+        self.since = started - self.window
+
+    def clear(self):
+        self.series.clear()
+        self.latest.clear()
+        self.by_device.clear()
+        self.since = None
+
+
+recent = RecentReadings(settings.RECENT_WINDOW_SECONDS, settings.RECENT_MAX_PER_SERIES)
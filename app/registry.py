@@ -0,0 +1,77 @@
+# app/registry.py
+from typing import Iterable, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.db import dialect_insert, on_commit
+from app.models import DevicePatientAssignment, Patient
+
+
+class PatientRegistry:
+    """
+    Process-local set of known patients and (device, patient) assignments.
+    Unknown ones are upserted with ON CONFLICT DO NOTHING, so concurrent first
+    readings for the same patient cannot collide, and are only remembered once
+    the transaction that created them commits.
+    """
+
+    def __init__(self):
+        self.patients: Set[str] = set()
+        self.assignments: Set[Tuple[str, str]] = set()
+
+    async def preload(self, db: AsyncSession):
+        result = await db.execute(select(Patient.patient_id))
+        self.patients.update(result.scalars().all())
+        result = await db.execute(
+            select(DevicePatientAssignment.device_id, DevicePatientAssignment.patient_id)
+        )
+        self.assignments.update((row.device_id, row.patient_id) for row in result)
+
+    async def ensure(self, db: AsyncSession, device_id: str, patient_ids: Iterable[str]):
+        """Create missing patients and device assignments. Does not commit."""
+        patient_ids = set(patient_ids)
+        new_patients = patient_ids - self.patients
+        new_pairs = {(device_id, p) for p in patient_ids} - self.assignments
+        if not new_patients and not new_pairs:
+            return
+
+        insert = dialect_insert(db)
+        if new_patients:
+            await db.execute(
+                insert(Patient).on_conflict_do_nothing(index_elements=["patient_id"]),
+                [{"patient_id": p, "name": "Unnamed"} for p in sorted(new_patients)]
+            )
+        if new_pairs:
+            await db.execute(
+                insert(DevicePatientAssignment).on_conflict_do_nothing(
+                    index_elements=["device_id", "patient_id"]
+                ),
+                [{"device_id": d, "patient_id": p} for d, p in sorted(new_pairs)]
+            )
+        on_commit(db, lambda: self._remember(new_patients, new_pairs))
+
+    async def is_assigned(self, db: AsyncSession, device_id: str, patient_id: str) -> bool:
+        """Whether the device is assigned to the patient; the set is checked first, then the database."""
+        if (device_id, patient_id) in self.assignments:
+            return True
+        result = await db.execute(
+            select(DevicePatientAssignment.id).where(
+                DevicePatientAssignment.device_id == device_id,
+                DevicePatientAssignment.patient_id == patient_id
+            )
+        )
+        if result.first() is None:
+            return False
+        self.assignments.add((device_id, patient_id))
+        return True
+
+    def _remember(self, patients, pairs):
+        self.patients.update(patients)
+        self.assignments.update(pairs)
+
+    def clear(self):
+        self.patients.clear()
+        self.assignments.clear()
+
+
+registry = PatientRegistry()
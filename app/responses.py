@@ -0,0 +1,174 @@
+# app/responses.py
+"""
+Fast JSON responses and negotiated compression.
+
+Reading endpoints return rows (dicts of column values) through RowsResponse,
+which serializes them straight to bytes - with orjson when it is installed,
+else the stdlib encoder - instead of validating a Pydantic model per row. The
+routes keep their response_model for the OpenAPI schema; FastAPI skips it when
+a Response is returned.
+
+CompressionMiddleware compresses JSON, NDJSON and text bodies of at least
+COMPRESSION_MIN_BYTES with brotli (if the `brotli` package is installed) or
+gzip, whichever the client prefers in Accept-Encoding. Streaming bodies are
+compressed chunk by chunk and flushed so every chunk is still sent as soon as
+it is produced. Server-Sent Events are left alone.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/plain", "text/csv")
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RowsResponse(JSONResponse):
+    """JSON response for lists of plain rows; no per-row model is built."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """The best encoding we support from an Accept-Encoding header, or None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compressible(content_type: str, size: Optional[int], minimum_size: int) -> bool:
+    """Whether a body is compressed; `size` is None for a streamed one."""
+    return content_type.startswith(COMPRESSIBLE) and (size is None or size >= minimum_size)
+
+
+def mark_encoded(headers: MutableHeaders):
+    """Vary, and a weak ETag, for a response whose body is sent with a content coding."""
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        # A strong ETag names the identity body; the encoded one only matches weakly.
+        headers["etag"] = "W/" + etag
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress.
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start.get("headers", ())))
+                start = {**start, "headers": headers.raw}
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not compressible(
+                    content_type, None if more else len(body), self.minimum_size
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["content-encoding"] = encoding
+                mark_encoded(headers)
+                if more:
+                    del headers["content-length"]
+                else:
+                    body = compressor.finish(body)
+                    headers["content-length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            body = compressor.chunk(body) if more else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,171 @@
+# app/retention.py
+"""
+Retention and downsampling of reading data.
+
+- Raw readings older than RETENTION_RAW_DAYS (whole days) are removed. Their
+  minute/hour/day rollups are kept, so aggregates and buckets over old ranges
+  keep working; with ROLLUPS_ENABLED off the expiring days are compacted into
+  rollups first.
+- Minute rollups older than RETENTION_MINUTE_ROLLUP_DAYS and hour rollups older
+  than RETENTION_HOUR_ROLLUP_DAYS are removed; day rollups are kept.
+- Idempotency keys older than IDEMPOTENCY_TTL_HOURS are removed.
+
+With partitioning on (Postgres, PARTITION_INTERVAL) expired raw data goes by
+dropping whole partitions (app/partitions.py), so a partition is removed once
+all of it is past the cutoff. Elsewhere, and for the default partition, rows
+are deleted in RETENTION_DELETE_BATCH batches, each in its own transaction, so
+a large backlog never becomes one huge DELETE.
+
+0 disables a setting. run() is scheduled every RETENTION_INTERVAL_SECONDS by
+the app; it can also be run by hand:
+
+    python -m app.retention [--now 2025-06-01T00:00:00]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import column, delete, func, select, table as table_clause
+
+from app import partitions, rollups
+from app.config import settings
+from app.db import async_session, engine
+from app.http_cache import response_cache
+from app.metrics import metrics
+from app.models import HeartRate, BloodPressure, IdempotencyKey, PARTITIONED_MODELS
+
+logger = logging.getLogger("medtrack.retention")
+
+MODELS = (HeartRate, BloodPressure)
+
+
+def _days_ago(now: datetime, days: int) -> datetime:
+    return (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def delete_before(table, time_col, cutoff: datetime, *criteria, batch_size: Optional[int] = None) -> int:
+    """
+    Delete rows with `time_col` < cutoff in id-ordered batches, committing each one.
+    Old rows sit at the low end of the id range, so each batch finds its rows by
+    walking the primary key rather than needing an index on time.
+    """
+    batch_size = batch_size or settings.RETENTION_DELETE_BATCH
+    deleted = 0
+    while True:
+        ids = select(table.c.id).where(time_col < cutoff, *criteria).order_by(table.c.id).limit(batch_size)
+        async with async_session() as db:
+            result = await db.execute(delete(table).where(table.c.id.in_(ids.scalar_subquery())))
+            await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+async def compact(model, cutoff: datetime):
+    """Make sure the rollups cover every raw row before `cutoff` (only needed with ROLLUPS_ENABLED off)."""
+    async with async_session() as db:
+        oldest = (await db.execute(select(func.min(model.timestamp)).where(model.timestamp < cutoff))).scalar()
+        if oldest is None:
+            return
+        await rollups.rebuild(db, model, oldest, cutoff - timedelta(seconds=1))
+        await db.commit()
+
+
+async def expire_raw(model, cutoff: datetime) -> int:
+    table = model.__tablename__
+    if model in PARTITIONED_MODELS:
+        async with engine.begin() as conn:
+            partitioned = await partitions.is_partitioned(conn, table)
+            dropped = await partitions.drop_before(conn, model, cutoff) if partitioned else []
+        if dropped:
+            logger.info("Dropped partitions %s", ", ".join(dropped))
+        if partitioned:
+            # Rows outside every partition's range live in the default partition.
+            default = table_clause(f"{table}_default", column("id"), column("timestamp"))
+            return await delete_before(default, default.c.timestamp, cutoff)
+    return await delete_before(model.__table__, model.__table__.c.timestamp, cutoff)
+
+
+async def expire_idempotency_keys(cutoff: datetime) -> int:
+    async with async_session() as db:
+        result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+        await db.commit()
+    return result.rowcount
+
+
+async def run(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Apply the retention policy once. Returns rows deleted per table."""
+    now = now or datetime.utcnow()
+    deleted: Dict[str, int] = {}
+
+    if PARTITIONED_MODELS:
+        async with engine.begin() as conn:
+            created = await partitions.ensure(conn, now)
+        if created:
+            logger.info("Created partitions %s", ", ".join(created))
+
+    if settings.RETENTION_RAW_DAYS:
+        cutoff = _days_ago(now, settings.RETENTION_RAW_DAYS)
+        for model in MODELS:
+            if not settings.ROLLUPS_ENABLED:
+                await compact(model, cutoff)
+            deleted[model.__tablename__] = await expire_raw(model, cutoff)
+
+    for granularity, days in (("1m", settings.RETENTION_MINUTE_ROLLUP_DAYS), ("1h", settings.RETENTION_HOUR_ROLLUP_DAYS)):
+        if not days:
+            continue
+        cutoff = _days_ago(now, days)
+        for rollup in rollups.ROLLUPS.values():
+            table = rollup.__table__
+            name = f"{rollup.__tablename__}:{granularity}"
+            deleted[name] = await delete_before(table, table.c.bucket_start, cutoff, table.c.granularity == granularity)
+
+    if settings.IDEMPOTENCY_TTL_HOURS:
+        deleted[IdempotencyKey.__tablename__] = await expire_idempotency_keys(now - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS))
+
+    for name, count in deleted.items():
+        if count:
+            metrics.inc("medtrack_retention_deleted_rows_total", (("table", name),), count)
+    if any(count for name, count in deleted.items() if name != IdempotencyKey.__tablename__):
+        # Cached ranges may include what was just deleted (or compacted)
+        response_cache.clear()
+    return deleted
+
+
+def enabled() -> bool:
+    return bool(
+        PARTITIONED_MODELS
+        or settings.RETENTION_RAW_DAYS
+        or settings.RETENTION_MINUTE_ROLLUP_DAYS
+        or settings.RETENTION_HOUR_ROLLUP_DAYS
+        or settings.IDEMPOTENCY_TTL_HOURS
+    )
+
+
+async def loop():
+    """Run the policy every RETENTION_INTERVAL_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+        try:
+            deleted = await run()
+            if any(deleted.values()):
+                logger.info("Retention removed %s", deleted)
+        except Exception:
+            logger.exception("Retention run failed")
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.retention", description="Apply the retention policy once")
+    parser.add_argument("--now", type=datetime.fromisoformat, help="pretend it is this time (UTC)")
+    args = parser.parse_args(argv)
+    deleted = await run(args.now)
+    for name, count in deleted.items():
+        print(f"{name}: {count} rows deleted", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,323 @@
+# app/rollups.py
+"""
+Per-minute/hour/day rollups (count, sum, min, max per device, patient and bucket)
+for heart_rate and blood_pressure.
+
+Rollups are updated in the same transaction as the raw insert, so they are always
+consistent with the committed raw rows. Range and bucket queries are split into
+segments: whole days, hours and minutes inside the range come from the coarsest
+rollup that fits, and only the unaligned edges are read from the raw table.
+
+Rebuild rollups from raw data (e.g. after enabling them on an existing database;
+days whose raw rows retention has expired are kept as they are):
+
+    python -m app.rollups rebuild [--from 2025-01-01] [--to 2025-02-01]
+"""
+import argparse
+import asyncio
+import calendar
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select
+
+from app.db import dialect_insert
+from app.models import HeartRate, BloodPressure, HeartRateRollup, BloodPressureRollup
+from app.queries import bucket_epoch, from_epoch
+
+GRANULARITIES = {"1d": 86400, "1h": 3600, "1m": 60}
+LEVELS = (86400, 3600, 60)
+LABELS = {seconds: label for label, seconds in GRANULARITIES.items()}
+
+FIELDS = {
+    HeartRate: ("heart_rate",),
+    BloodPressure: ("systolic", "diastolic", "pulse"),
+}
+ROLLUPS = {
+    HeartRate: HeartRateRollup,
+    BloodPressure: BloodPressureRollup,
+}
+
+
+def _epoch(dt: datetime) -> int:
+    return calendar.timegm(dt.timetuple())
+
+
+def _floor(dt: datetime, seconds: int) -> datetime:
+    return from_epoch(_epoch(dt) // seconds * seconds)
+
+
+def _ceil(dt: datetime, seconds: int) -> datetime:
+    floored = _floor(dt, seconds)
+    return floored if floored == dt else floored + timedelta(seconds=seconds)
+
+
+def _truncate(dt: datetime, seconds: int) -> datetime:
+    if seconds == 60:
+        return dt.replace(second=0, microsecond=0)
+    if seconds == 3600:
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def plan(start: Optional[datetime], end: Optional[datetime], levels: Sequence[int]):
+    """
+    Split [start, end) into (granularity, lo, hi) segments, coarsest first.
+    A granularity of None means raw rows; None bounds are open.
+    """
+    if not levels:
+        if start is not None and end is not None and start >= end:
+            return []
+        return [(None, start, end)]
+    g, rest = levels[0], levels[1:]
+    a = None if start is None else _ceil(start, g)
+    b = None if end is None else _floor(end, g)
+    if a is not None and b is not None and a >= b:
+        return plan(start, end, rest)
+    segments = []
+    if start is not None and start < a:
+        segments += plan(start, a, rest)
+    segments.append((g, a, b))
+    if end is not None and b < end:
+        segments += plan(b, end, rest)
+    return segments
+
+
+async def apply(db: AsyncSession, model, rows: List[dict]):
+    """Fold freshly inserted raw rows into every rollup granularity. Does not commit."""
+    fields = FIELDS[model]
+    deltas: Dict[tuple, dict] = {}
+    for row in rows:
+        for label, seconds in GRANULARITIES.items():
+            key = (label, row["device_id"], row["patient_id"], _truncate(row["timestamp"], seconds))
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = {
+                    "granularity": label,
+                    "device_id": row["device_id"],
+                    "patient_id": row["patient_id"],
+                    "bucket_start": key[3],
+                    "count": 0,
+                }
+                for f in fields:
+                    delta[f"{f}_sum"] = 0
+                    delta[f"{f}_min"] = row[f]
+                    delta[f"{f}_max"] = row[f]
+            delta["count"] += 1
+            for f in fields:
+                value = row[f]
+                delta[f"{f}_sum"] += value
+                if value < delta[f"{f}_min"]:
+                    delta[f"{f}_min"] = value
+                if value > delta[f"{f}_max"]:
+                    delta[f"{f}_max"] = value
+    if deltas:
+        # In key order, so concurrent transactions updating the same buckets
+        # lock their rows in the same order and cannot deadlock on Postgres.
+        # Writers covering several devices in one transaction (app/buffer.py,
+        # app/bulk_import.py) call this in device_id order for the same reason.
+        await _upsert(db, model, [deltas[key] for key in sorted(deltas)])
+
+
+async def _upsert(db: AsyncSession, model, deltas: List[dict]):
+    rollup = ROLLUPS[model]
+    stmt = dialect_insert(db)(rollup)
+    if db.get_bind().dialect.name == "sqlite":
+        least, greatest = func.min, func.max
+    else:
+        least, greatest = func.least, func.greatest
+    set_ = {"count": rollup.count + stmt.excluded["count"]}
+    for f in FIELDS[model]:
+        set_[f"{f}_sum"] = getattr(rollup, f"{f}_sum") + stmt.excluded[f"{f}_sum"]
+        set_[f"{f}_min"] = least(getattr(rollup, f"{f}_min"), stmt.excluded[f"{f}_min"])
+        set_[f"{f}_max"] = greatest(getattr(rollup, f"{f}_max"), stmt.excluded[f"{f}_max"])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["granularity", "device_id", "patient_id", "bucket_start"],
+        set_=set_
+    )
+    await db.execute(stmt, deltas)
+
+
+def _bounds(from_time: Optional[datetime], to_time: Optional[datetime]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Inclusive [from_time, to_time] as a half-open range on whole seconds."""
+    start = end = None
+    if from_time is not None:
+        start = from_time.replace(tzinfo=None)
+        if start.microsecond:
+            start = start.replace(microsecond=0) + timedelta(seconds=1)
+    if to_time is not None:
+        end = to_time.replace(tzinfo=None, microsecond=0) + timedelta(seconds=1)
+    return start, end
+
+
+async def _raw_plan(db: AsyncSession, model, device_id: str, start: Optional[datetime], end: Optional[datetime],
+                    levels: Sequence[int]):
+    """
+    Segments for reading raw rows only. Whole days before the device's oldest raw
+    row were compacted into rollups by app.retention, so those come from rollups.
+    """
+    oldest = (await db.execute(select(func.min(model.timestamp)).where(model.device_id == device_id))).scalar()
+    if oldest is None:
+        return plan(start, end, levels)
+    boundary = _floor(oldest, 86400)
+    if start is not None and start >= boundary:
+        return [(None, start, end)]
+    segments = plan(start, boundary if end is None else min(end, boundary), levels)
+    if end is None or end > boundary:
+        segments.append((None, boundary, end))
+    return segments
+
+
+async def aggregate(
+        db: AsyncSession,
+        model,
+        device_id: str,
+        from_time: Optional[datetime],
+        to_time: Optional[datetime],
+        bucket_seconds: Optional[int] = None,
+        use_rollups: bool = True,
+) -> List[dict]:
+    """
+    count/sum/min/max per patient (and per bucket when `bucket_seconds` is given)
+    over [from_time, to_time], combining rollup segments with raw edges.
+    Rows are sorted by patient and bucket and carry `first`, the earliest
+    timestamp (or rollup bucket start) that contributed.
+    """
+    fields = FIELDS[model]
+    rollup = ROLLUPS[model]
+    dialect = db.get_bind().dialect.name
+    start, end = _bounds(from_time, to_time)
+
+    levels = tuple(g for g in LEVELS if bucket_seconds is None or (g <= bucket_seconds and bucket_seconds % g == 0))
+    if use_rollups:
+        segments = plan(start, end, levels)
+    else:
+        segments = await _raw_plan(db, model, device_id, start, end, levels)
+
+    acc: Dict[tuple, dict] = {}
+    for granularity, lo, hi in segments:
+        if granularity is None:
+            source, time_col = model, model.timestamp
+            columns = [func.count().label("count"), func.min(time_col).label("first")]
+            for f in fields:
+                col = getattr(model, f)
+                columns += [func.sum(col).label(f"{f}_sum"), func.min(col).label(f"{f}_min"), func.max(col).label(f"{f}_max")]
+        else:
+            source, time_col = rollup, rollup.bucket_start
+            columns = [func.sum(rollup.count).label("count"), func.min(time_col).label("first")]
+            for f in fields:
+                columns += [
+                    func.sum(getattr(rollup, f"{f}_sum")).label(f"{f}_sum"),
+                    func.min(getattr(rollup, f"{f}_min")).label(f"{f}_min"),
+                    func.max(getattr(rollup, f"{f}_max")).label(f"{f}_max"),
+                ]
+        group = [source.patient_id]
+        if bucket_seconds is not None:
+            group.append(bucket_epoch(time_col, bucket_seconds, dialect).label("bucket"))
+
+        query = select(*group, *columns).where(source.device_id == device_id)
+        if granularity is not None:
+            query = query.where(rollup.granularity == LABELS[granularity])
+        if lo is not None:
+            query = query.where(time_col >= lo)
+        if hi is not None:
+            query = query.where(time_col < hi)
+        query = query.group_by(*group)
+
+        for row in (await db.execute(query)).mappings():
+            if not row["count"]:
+                continue
+            key = (row["patient_id"], row["bucket"] if bucket_seconds is not None else None)
+            current = acc.get(key)
+            if current is None:
+                acc[key] = dict(row)
+                continue
+            current["count"] += row["count"]
+            current["first"] = min(current["first"], row["first"])
+            for f in fields:
+                current[f"{f}_sum"] += row[f"{f}_sum"]
+                current[f"{f}_min"] = min(current[f"{f}_min"], row[f"{f}_min"])
+                current[f"{f}_max"] = max(current[f"{f}_max"], row[f"{f}_max"])
+
+    return [acc[key] for key in sorted(acc, key=lambda k: (k[0], k[1] or 0))]
+
+
+async def rebuild(db: AsyncSession, model, from_time: Optional[datetime] = None, to_time: Optional[datetime] = None,
+                  chunk_size: int = 5000) -> int:
+    """
+    Recompute rollups from raw rows, widened to whole days so every granularity
+    is rebuilt completely. Days before the oldest raw row are left alone: their
+    raw rows were expired by app.retention and the rollups are all that is left.
+    Does not commit. Returns the number of rollup rows written.
+    """
+    rollup = ROLLUPS[model]
+    fields = FIELDS[model]
+    dialect = db.get_bind().dialect.name
+    oldest = (await db.execute(select(func.min(model.timestamp)))).scalar()
+    if oldest is None:
+        return 0
+    start = _floor(oldest, 86400)
+    if from_time:
+        start = max(start, _floor(from_time.replace(tzinfo=None), 86400))
+    end = _ceil(to_time.replace(tzinfo=None) + timedelta(seconds=1), 86400) if to_time else None
+    if end is not None and end <= start:
+        return 0
+
+    clear = delete(rollup).where(rollup.bucket_start >= start)
+    if end is not None:
+        clear = clear.where(rollup.bucket_start < end)
+    await db.execute(clear)
+
+    written = 0
+    for label, seconds in GRANULARITIES.items():
+        epoch = bucket_epoch(model.timestamp, seconds, dialect).label("bucket")
+        columns = [model.device_id, model.patient_id, epoch, func.count().label("count")]
+        for f in fields:
+            col = getattr(model, f)
+            columns += [func.sum(col).label(f"{f}_sum"), func.min(col).label(f"{f}_min"), func.max(col).label(f"{f}_max")]
+        query = select(*columns).where(model.timestamp >= start)
+        if end is not None:
+            query = query.where(model.timestamp < end)
+        query = query.group_by(model.device_id, model.patient_id, epoch)
+
+        result = await db.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.mappings().partitions():
+            deltas = []
+            for row in rows:
+                delta = dict(row)
+                delta["granularity"] = label
+                delta["bucket_start"] = from_epoch(delta.pop("bucket"))
+                deltas.append(delta)
+            await _upsert(db, model, deltas)
+            written += len(deltas)
+    return written
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+async def main(argv=None) -> int:
+    from app.db import async_session
+
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description="Maintain reading rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="regenerate rollups from raw readings")
+    rebuild_cmd.add_argument("--from", dest="from_time", type=_parse_time)
+    rebuild_cmd.add_argument("--to", dest="to_time", type=_parse_time)
+    rebuild_cmd.add_argument("--table", choices=("hr", "bp"), help="only rebuild one reading table")
+    args = parser.parse_args(argv)
+
+    models = {"hr": [HeartRate], "bp": [BloodPressure], None: [HeartRate, BloodPressure]}[args.table]
+    async with async_session() as db:
+        for model in models:
+            written = await rebuild(db, model, args.from_time, args.to_time)
+            await db.commit()
+            print(f"{model.__tablename__}: {written} rollup rows", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
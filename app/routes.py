@@ -1,19 +1,44 @@
 # app/routes.py
-from fastapi import APIRouter,Query, Depends, HTTPException
+import logging
+from fastapi import APIRouter,Query, Depends, HTTPException, Body, Header, Path, Request, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import Union, List
+from sqlalchemy import select
+from typing import Union, List, Any, Dict, Optional
 from datetime import datetime
 
-from app.db import get_db
-from app.auth import get_current_device, create_jwt
-from app.models import Device, DevicePatientAssignment, HeartRate, BloodPressure, Patient
+from app.db import get_db, get_read_db, dialect_insert
+from app.config import settings
+from app.ingest import reading_adapter, validation_error_message, write_readings
+from app.buffer import ingest_buffer, BufferFull
+from app.bulk_import import ImportStats, import_lines, split_lines
+from app.queries import (
+    range_query, out_columns, keyset, encode_cursor, stream_ndjson, BUCKET_SECONDS, from_epoch
+)
+from app import rollups, stats, ws_ingest, live, idempotency, export, patients
+from app.alerts import alerts_page
+from app.recent import recent, latest_from_db
+from app.registry import registry
+from app.metrics import metrics, span, TimedRoute
+from app.responses import RowsResponse
+from app.http_cache import response_cache
+from app.auth import authenticate, create_jwt, mint_tokens, invalidate_device
+from app.admission import admit_ingest, admit_read
+from app.models import Device, HeartRate, BloodPressure
 from app.schemas import (
     DeviceRegister, TokenOut, HeartRateInput, HeartRateOut,
-    BloodPressureInput, BloodPressureOut
+    BloodPressureInput, BloodPressureOut, IngestResult, BatchIngestOut,
+    HeartRateBucketOut, BloodPressureBucketOut, HeartRateStatisticOut, BloodPressureStatisticOut,
+    LatestReadingOut, PatientReadingOut,
+    RegisterResult, RegisterBatchOut, AlertOut
 )
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+logger = logging.getLogger("medtrack.routes")
+
+# Statistics are not whole numbers, unlike readings and their min/max/avg
+STATISTIC_SCHEMAS = {HeartRate: HeartRateStatisticOut, BloodPressure: BloodPressureStatisticOut}
 
 @router.post("/register", response_model=TokenOut)
 async def register_device(data: DeviceRegister, db: AsyncSession = Depends(get_db)):
@@ -26,167 +51,406 @@ async def register_device(data: DeviceRegister, db: AsyncSession = Depends(get_d
     new_device = Device(device_id=data.device_id, device_type=data.device_type)
     db.add(new_device)
     await db.commit()
+    invalidate_device(data.device_id)
 
     token = create_jwt(data.device_id)
     return {"access_token": token}
 
 
+@router.post("/register/batch", response_model=RegisterBatchOut)
+async def register_devices(devices: List[DeviceRegister] = Body(...), db: AsyncSession = Depends(get_db)):
+    if len(devices) > settings.REGISTER_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.REGISTER_BATCH_MAX} devices")
+
+    results = [RegisterResult(index=i, device_id=d.device_id) for i, d in enumerate(devices)]
+    first: Dict[str, int] = {}
+    for i, d in enumerate(devices):
+        if d.device_id in first:
+            results[i].error = "Duplicate device_id in batch"
+        else:
+            first[d.device_id] = i
+
+    try:
+        result = await db.execute(
+            dialect_insert(db)(Device).on_conflict_do_nothing(index_elements=["device_id"]).returning(Device.device_id),
+            [{"device_id": device_id, "device_type": devices[i].device_type} for device_id, i in first.items()]
+        ) if first else None
+        created = set(result.scalars().all()) if result is not None else set()
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Internal error")
+
+    new_ids = [device_id for device_id in first if device_id in created]
+    for device_id in new_ids:
+        invalidate_device(device_id)
+    for device_id, i in first.items():
+        if device_id not in created:
+            results[i].error = "Device already registered"
+
+    for device_id, token in zip(new_ids, await mint_tokens(new_ids)):
+        results[first[device_id]].access_token = token
+
+    return RegisterBatchOut(registered=len(new_ids), rejected=len(devices) - len(new_ids), results=results)
+
+
 @router.post("/ingest")
 async def ingest_data(
         reading: Union[HeartRateInput, BloodPressureInput],
-        device: Device = Depends(get_current_device),
+        device: Device = Depends(admit_ingest),
         db: AsyncSession = Depends(get_db)
 ):
     if reading.device_id != device.device_id:
         raise HTTPException(status_code=403, detail="Device ID mismatch")
 
-    # Ensure patient exists
-    result = await db.execute(select(Patient).where(Patient.patient_id == reading.patient_id))
-    patient = result.scalar_one_or_none()
-    if not patient:
-        new_patient = Patient(patient_id=reading.patient_id, name="Unnamed")
-        db.add(new_patient)
-        await db.commit()
-
-    # Ensure assignment exists
-    result = await db.execute(
-        select(DevicePatientAssignment).where(
-            DevicePatientAssignment.device_id == device.device_id,
-            DevicePatientAssignment.patient_id == reading.patient_id
-        )
-    )
-    if result.scalar_one_or_none() is None:
-        db.add(DevicePatientAssignment(device_id=device.device_id, patient_id=reading.patient_id))
-        await db.commit()
+    if settings.INGEST_BUFFERED:
+        try:
+            seq = await ingest_buffer.submit(device.device_id, reading)
+        except BufferFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except Exception:
+            raise HTTPException(status_code=500, detail="Internal error")
+        return JSONResponse(status_code=202, content={"status": "accepted", "seq": seq})
 
-    # Proceed with ingestion
     try:
-        if isinstance(reading, HeartRateInput):
-            record = HeartRate(
-                device_id=reading.device_id,
-                patient_id=reading.patient_id,
-                timestamp=reading.timestamp.replace(microsecond=0).replace(tzinfo=None),
-                heart_rate=reading.heart_rate,
-                quality=reading.measurement_quality,
-            )
-        else:
-            record = BloodPressure(
-                device_id=reading.device_id,
-                patient_id=reading.patient_id,
-                timestamp=reading.timestamp.replace(microsecond=0).replace(tzinfo=None),
-                systolic=reading.systolic,
-                diastolic=reading.diastolic,
-                pulse=reading.pulse,
-            )
-        db.add(record)
-        await db.commit()
-        await db.refresh(record)
+        written = await write_readings(db, device.device_id, [reading])
+        with span("commit"):
+            await db.commit()
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail="Internal error")
 
-    return {"status": "ok", "id": record.id}
+    return {"status": "ok", "id": written.ids[0], "duplicate": bool(written.duplicates)}
 
 
-@router.get("/readings/hr", response_model=List[HeartRateOut])
-async def get_heart_rate_data(
-    device: Device = Depends(get_current_device),
-    db: AsyncSession = Depends(get_db),
-    from_time: datetime = Query(default=None),
-    to_time: datetime = Query(default=None),
-    aggregate: str = Query(default=None, pattern="^(min|max|avg)?$")
+@router.post("/ingest/batch", response_model=BatchIngestOut)
+async def ingest_batch(
+        items: List[Dict[str, Any]] = Body(...),
+        idempotency_key: Optional[str] = Header(default=None, max_length=255),
+        device: Device = Depends(admit_ingest),
+        db: AsyncSession = Depends(get_db)
 ):
-    if aggregate:
-        agg_func = {
-            "min": func.min,
-            "max": func.max,
-            "avg": func.avg
-        }[aggregate]
+    if len(items) > settings.INGEST_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.INGEST_BATCH_MAX} readings")
+
+    if idempotency_key:
+        stored = await idempotency.lookup(db, device.device_id, idempotency_key)
+        if stored is not None:
+            return idempotency.replay(stored)
+
+    results = [IngestResult(index=i) for i in range(len(items))]
+    readings, positions = [], []
+    for i, item in enumerate(items):
+        try:
+            reading = reading_adapter.validate_python(item)
+        except ValidationError as e:
+            results[i].error = validation_error_message(e)
+            continue
+        if reading.device_id != device.device_id:
+            results[i].error = "Device ID mismatch"
+            continue
+        readings.append(reading)
+        positions.append(i)
 
-        query = select(
-            HeartRate.patient_id,
-            agg_func(HeartRate.heart_rate).label("heart_rate")
-        ).where(HeartRate.device_id == device.device_id)
+    try:
+        written = await write_readings(db, device.device_id, readings) if readings else None
+        if written is not None:
+            for k, (i, new_id) in enumerate(zip(positions, written.ids)):
+                results[i].id = new_id
+                results[i].duplicate = k in written.duplicates
+        out = BatchIngestOut(
+            status="ok",
+            accepted=len(readings),
+            duplicates=len(written.duplicates) if written is not None else 0,
+            rejected=len(items) - len(readings),
+            results=results
+        )
+        if idempotency_key and not await idempotency.claim(db, device.device_id, idempotency_key, out.model_dump(mode="json")):
+            # A concurrent request with the same key got there first; answer with its response.
+            await db.rollback()
+            return idempotency.replay(await idempotency.lookup(db, device.device_id, idempotency_key))
+        if written is not None or idempotency_key:
+            with span("commit"):
+                await db.commit()
+    except Exception:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Internal error")
 
-        if from_time:
-            query = query.where(HeartRate.timestamp >= from_time)
-        if to_time:
-            query = query.where(HeartRate.timestamp <= to_time)
+    return out
 
-        query = query.group_by(HeartRate.patient_id)
 
+@router.post("/ingest/stream")
+async def ingest_stream(
+        request: Request,
+        chunk_size: int = Query(default=1000, ge=1, le=10000),
+        device: Device = Depends(admit_ingest),
+        db: AsyncSession = Depends(get_db)
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in ("application/x-ndjson", "application/jsonl", ""):
+        raise HTTPException(status_code=415, detail="Expected application/x-ndjson")
+
+    stats = ImportStats()
+    await import_lines(
+        db,
+        split_lines(request.stream()),
+        stats,
+        chunk_size=chunk_size,
+        device_id=device.device_id,
+        on_chunk=lambda s: logger.info("ingest stream %s: %s", device.device_id, s)
+    )
+    return {"status": "ok", **stats.summary()}
+
+
+@router.websocket("/ingest/ws")
+async def ingest_ws(websocket: WebSocket):
+    await ws_ingest.serve(websocket)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def _list_readings(db, model, schema, device_id, from_time, to_time, limit, cursor, stream):
+    query = range_query(model, device_id, from_time, to_time, *out_columns(model, schema))
+
+    if stream:
+        query = keyset(query, model, cursor, None)
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(stream_ndjson(query), media_type="application/x-ndjson")
+
+    # Rows are serialized as they come from the database; see app/responses.py
+    if limit is None and cursor is None:
+        rows = recent.range(model, device_id, from_time, to_time)
+        if rows is not None:
+            return RowsResponse(rows)
         result = await db.execute(query)
-        rows = result.all()
-        return [
-            HeartRateOut(
+        return RowsResponse([dict(row) for row in result.mappings()])
+
+    # Keyset pagination on (timestamp, id); the next page starts after the last row returned
+    limit = limit or settings.READINGS_PAGE_SIZE
+    result = await db.execute(keyset(query, model, cursor, limit))
+    rows = [dict(row) for row in result.mappings()]
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return RowsResponse(rows, headers=headers)
+
+
+def _aggregate_value(row, field, aggregate):
+    if aggregate in stats.STATISTICS:
+        return row[field]
+    if aggregate == "avg":
+        return round(row[f"{field}_sum"] / row["count"])
+    return row[f"{field}_{aggregate}"]
+
+
+async def _bucket_readings(db, model, device_id, from_time, to_time, bucket):
+    """One row per patient per time bucket, with count and min/max/avg of each field."""
+    rows = await rollups.aggregate(
+        db, model, device_id, from_time, to_time,
+        bucket_seconds=BUCKET_SECONDS[bucket], use_rollups=settings.ROLLUPS_ENABLED
+    )
+    return RowsResponse([
+        {
+            "device_id": device_id,
+            "patient_id": row["patient_id"],
+            "bucket_start": from_epoch(row["bucket"]),
+            "count": row["count"],
+            **{
+                field: {
+                    "min": row[f"{field}_min"],
+                    "max": row[f"{field}_max"],
+                    "avg": row[f"{field}_sum"] / row["count"],
+                } for field in rollups.FIELDS[model]
+            }
+        } for row in rows
+    ])
+
+
+@router.get("/readings/latest", response_model=List[LatestReadingOut])
+async def get_latest_readings(
+    device: Device = Depends(authenticate),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if recent.enabled and recent.since is not None:
+        latest = recent.latest_for(device.device_id)
+    else:
+        latest = await latest_from_db(db, device.device_id)
+    return [
+        LatestReadingOut(
+            patient_id=patient_id,
+            heart_rate=tables.get(HeartRate.__tablename__),
+            blood_pressure=tables.get(BloodPressure.__tablename__)
+        ) for patient_id, tables in sorted(latest.items())
+    ]
+
+
+@router.get("/readings/stream")
+async def stream_readings(
+    request: Request,
+    device: Device = Depends(authenticate),
+    patient_id: str = Query(default=None),
+    last_id: str = Query(default=None)
+):
+    """Server-Sent Events feed of readings as they are ingested; resumes after Last-Event-ID."""
+    last_id = request.headers.get("last-event-id") or last_id
+    cursor = live.parse_last_id(last_id) if last_id else None
+    return StreamingResponse(
+        live.event_stream(device.device_id, patient_id, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _build_readings(db, model, schema, device_id, from_time, to_time, aggregate, bucket, limit, cursor, stream):
+    if bucket:
+        return await _bucket_readings(db, model, device_id, from_time, to_time, bucket)
+
+    if aggregate:
+        if aggregate in stats.STATISTICS:
+            rows = await stats.compute(db, model, device_id, from_time, to_time, aggregate)
+            schema = STATISTIC_SCHEMAS[model]
+        else:
+            rows = await rollups.aggregate(
+                db, model, device_id, from_time, to_time, use_rollups=settings.ROLLUPS_ENABLED
+            )
+        # One `schema` row per patient, with the aggregate in place of each reading field
+        return RowsResponse([
+            schema(
                 id=0,
-                device_id=device.device_id,
-                patient_id=row.patient_id,
-                timestamp=datetime.utcnow(),
-                heart_rate=row.heart_rate if row.heart_rate else 0,
-                quality=aggregate
-            ) for row in rows
-        ]
+                device_id=device_id,
+                patient_id=row["patient_id"],
+                timestamp=from_time or row["first"],
+                **{field: _aggregate_value(row, field, aggregate) for field in rollups.FIELDS[model]},
+                **({"quality": aggregate} if "quality" in schema.model_fields else {})
+            ).model_dump(mode="json") for row in rows
+        ])
 
-    query = select(HeartRate).where(HeartRate.device_id == device.device_id)
-    if from_time:
-        query = query.where(HeartRate.timestamp >= from_time)
-    if to_time:
-        query = query.where(HeartRate.timestamp <= to_time)
+    return await _list_readings(db, model, schema, device_id, from_time, to_time, limit, cursor, stream)
 
-    result = await db.execute(query)
-    return result.scalars().all()
 
+def _check_shape(aggregate, bucket, limit, cursor, stream):
+    """400 for parameters that would be ignored by the shape of response asked for."""
+    if aggregate and bucket:
+        raise HTTPException(status_code=400, detail="aggregate and bucket cannot be combined")
+    if (aggregate or bucket) and (limit is not None or cursor is not None or stream):
+        param = "aggregate" if aggregate else "bucket"
+        raise HTTPException(status_code=400, detail=f"limit, cursor and stream do not apply to {param}")
 
 
-@router.get("/readings/bp", response_model=List[BloodPressureOut])
+async def _readings(request, db, model, schema, device_id, from_time, to_time, aggregate, bucket, limit, cursor, stream):
+    """_build_readings, served from the response cache when the range is closed."""
+    _check_shape(aggregate, bucket, limit, cursor, stream)
+    args = (db, model, schema, device_id, from_time, to_time, aggregate, bucket, limit, cursor, stream)
+    key = None if stream else response_cache.key(model, device_id, from_time, to_time, aggregate, bucket, limit, cursor)
+    if key is None:
+        return await _build_readings(*args)
+
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation(key)
+        response = await _build_readings(*args)
+        entry = response_cache.put(key, response, generation)
+        if entry is None:
+            return response
+    return entry.respond(request.headers)
+
+
+@router.get("/readings/hr", response_model=Union[List[HeartRateOut], List[HeartRateStatisticOut], List[HeartRateBucketOut]])
+async def get_heart_rate_data(
+    request: Request,
+    device: Device = Depends(admit_read),
+    db: AsyncSession = Depends(get_read_db),
+    from_time: datetime = Query(default=None),
+    to_time: datetime = Query(default=None),
+    aggregate: str = Query(default=None, pattern="^(min|max|avg|median|p5|p95|stddev|hrv)?$"),
+    bucket: str = Query(default=None, pattern="^(1m|5m|1h|1d)$"),
+    limit: int = Query(default=None, ge=1, le=10000),
+    cursor: str = Query(default=None),
+    stream: bool = Query(default=False)
+):
+    return await _readings(
+        request, db, HeartRate, HeartRateOut, device.device_id, from_time, to_time, aggregate, bucket, limit, cursor, stream
+    )
+
+
+
+@router.get("/readings/bp", response_model=Union[List[BloodPressureOut], List[BloodPressureStatisticOut], List[BloodPressureBucketOut]])
 async def get_blood_pressure_data(
-    device: Device = Depends(get_current_device),
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    device: Device = Depends(admit_read),
+    db: AsyncSession = Depends(get_read_db),
     from_time: datetime = Query(default=None),
     to_time: datetime = Query(default=None),
-    aggregate: str = Query(default=None, pattern="^(min|max|avg)?$")
+    aggregate: str = Query(default=None, pattern="^(min|max|avg|median|p5|p95|stddev)?$"),
+    bucket: str = Query(default=None, pattern="^(1m|5m|1h|1d)$"),
+    limit: int = Query(default=None, ge=1, le=10000),
+    cursor: str = Query(default=None),
+    stream: bool = Query(default=False)
 ):
-    if aggregate:
-        agg_func = {
-            "min": func.min,
-            "max": func.max,
-            "avg": func.avg
-        }[aggregate]
-
-        query = select(
-            BloodPressure.patient_id,
-            agg_func(BloodPressure.systolic).label("systolic"),
-            agg_func(BloodPressure.diastolic).label("diastolic"),
-            agg_func(BloodPressure.pulse).label("pulse"),
-        ).where(BloodPressure.device_id == device.device_id)
-
-        if from_time:
-            query = query.where(BloodPressure.timestamp >= from_time)
-        if to_time:
-            query = query.where(BloodPressure.timestamp <= to_time)
-
-        query = query.group_by(BloodPressure.patient_id)
+    return await _readings(
+        request, db, BloodPressure, BloodPressureOut, device.device_id, from_time, to_time, aggregate, bucket, limit, cursor, stream
+    )
 
-        result = await db.execute(query)
-        rows = result.all()
-        return [
-            BloodPressureOut(
-                id=0,
-                device_id=device.device_id,
-                patient_id=row.patient_id,
-                timestamp=datetime.utcnow(),
-                systolic=row.systolic or 0,
-                diastolic=row.diastolic or 0,
-                pulse=row.pulse or 0
-            ) for row in rows
-        ]
-
-    query = select(BloodPressure).where(BloodPressure.device_id == device.device_id)
-    if from_time:
-        query = query.where(BloodPressure.timestamp >= from_time)
-    if to_time:
-        query = query.where(BloodPressure.timestamp <= to_time)
-
-    result = await db.execute(query)
-    return result.scalars().all()
+
+@router.get("/export/{kind}")
+async def export_readings(
+    kind: str = Path(pattern="^(hr|bp)$"),
+    device: Device = Depends(admit_read),
+    patient_id: str = Query(default=None),
+    from_time: datetime = Query(default=None),
+    to_time: datetime = Query(default=None),
+    format: str = Query(default=None, pattern="^(arrow|parquet|csv)$")
+):
+    """Stream the device's readings as Arrow IPC, Parquet or CSV; see app/export.py."""
+    format = format or export.default_format()
+    export.check_format(format)
+    query = export.export_query(kind, device.device_id, patient_id, from_time, to_time)
+    return StreamingResponse(
+        export.export_stream(kind, query, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export.filename(kind, device.device_id, format)}"'}
+    )
+
+
+@router.get("/patients/{patient_id}/readings", response_model=List[PatientReadingOut])
+async def get_patient_readings(
+    patient_id: str,
+    device: Device = Depends(admit_read),
+    db: AsyncSession = Depends(get_read_db),
+    from_time: datetime = Query(default=None),
+    to_time: datetime = Query(default=None),
+    limit: int = Query(default=None, ge=1, le=10000),
+    cursor: str = Query(default=None)
+):
+    """Heart rate and blood pressure readings of a patient from all their devices, in time order."""
+    if not await registry.is_assigned(db, device.device_id, patient_id):
+        raise HTTPException(status_code=403, detail="Device is not assigned to this patient")
+    rows, next_cursor = await patients.readings_page(
+        db, patient_id, from_time, to_time, cursor, limit or settings.READINGS_PAGE_SIZE
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return RowsResponse(rows, headers=headers)
+
+
+@router.get("/alerts", response_model=List[AlertOut])
+async def get_alerts(
+    device: Device = Depends(admit_read),
+    db: AsyncSession = Depends(get_read_db),
+    patient_id: str = Query(default=None),
+    after_id: int = Query(default=0, ge=0),
+    limit: int = Query(default=None, ge=1, le=10000)
+):
+    """
+    Alerts raised by this device's readings or, with patient_id, by any
+    device's readings of one of its patients; oldest first. Poll with
+    after_id set to the last id seen.
+    """
+    if patient_id is not None and not await registry.is_assigned(db, device.device_id, patient_id):
+        raise HTTPException(status_code=403, detail="Device is not assigned to this patient")
+    rows = await alerts_page(db, device.device_id, patient_id, after_id, limit or settings.READINGS_PAGE_SIZE)
+    return RowsResponse(rows)
@@ -1,6 +1,7 @@
 
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional, List
 
 class DeviceRegister(BaseModel):
     device_id: str
@@ -10,6 +11,18 @@ class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+class RegisterResult(BaseModel):
+    index: int
+    device_id: str
+    access_token: Optional[str] = None
+    error: Optional[str] = None
+
+class RegisterBatchOut(BaseModel):
+    registered: int
+    rejected: int
+    token_type: str = "bearer"
+    results: List[RegisterResult]
+
 class HeartRateInput(BaseModel):
     device_id: str
     patient_id: str
@@ -25,6 +38,27 @@ class HeartRateOut(BaseModel):
     heart_rate: int
     quality: str
 
+class HeartRateStatisticOut(BaseModel):
+    """A patient's aggregate=median|p5|p95|stddev|hrv, computed from the raw readings."""
+    id: int
+    device_id: str
+    patient_id: str
+    timestamp: datetime
+    heart_rate: float
+    quality: str
+
+class SeriesStats(BaseModel):
+    min: int
+    max: int
+    avg: float
+
+class HeartRateBucketOut(BaseModel):
+    device_id: str
+    patient_id: str
+    bucket_start: datetime
+    count: int
+    heart_rate: SeriesStats
+
 class BloodPressureInput(BaseModel):
     device_id: str
     patient_id: str
@@ -41,3 +75,66 @@ class BloodPressureOut(BaseModel):
     systolic: int
     diastolic: int
     pulse: int
+
+class BloodPressureStatisticOut(BaseModel):
+    """A patient's aggregate=median|p5|p95|stddev, computed from the raw readings."""
+    id: int
+    device_id: str
+    patient_id: str
+    timestamp: datetime
+    systolic: float
+    diastolic: float
+    pulse: float
+
+class BloodPressureBucketOut(BaseModel):
+    device_id: str
+    patient_id: str
+    bucket_start: datetime
+    count: int
+    systolic: SeriesStats
+    diastolic: SeriesStats
+    pulse: SeriesStats
+
+class PatientReadingOut(BaseModel):
+    type: str
+    id: int
+    device_id: str
+    patient_id: str
+    timestamp: datetime
+    heart_rate: Optional[int] = None
+    quality: Optional[str] = None
+    systolic: Optional[int] = None
+    diastolic: Optional[int] = None
+    pulse: Optional[int] = None
+
+class LatestReadingOut(BaseModel):
+    patient_id: str
+    heart_rate: Optional[HeartRateOut] = None
+    blood_pressure: Optional[BloodPressureOut] = None
+
+class IngestResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    duplicate: bool = False
+    error: Optional[str] = None
+
+class BatchIngestOut(BaseModel):
+    status: str
+    accepted: int
+    duplicates: int = 0
+    rejected: int
+    results: List[IngestResult]
+
+class AlertOut(BaseModel):
+    id: int
+    rule: str
+    severity: str
+    device_id: str
+    patient_id: str
+    metric: str
+    value: float
+    threshold: float
+    reading_type: str
+    reading_id: int
+    timestamp: datetime
+    created_at: datetime
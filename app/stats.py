@@ -0,0 +1,123 @@
+# app/stats.py
+"""
+Order statistics and variability over raw readings, for
+aggregate=median|p5|p95|stddev|hrv on /readings/hr and /readings/bp.
+
+Rollups only hold count/sum/min/max, so these are computed from the raw rows
+in the range: each reading field is fetched into a compact array("i") per
+patient (4 bytes a reading, in time order) and reduced with NumPy when it is
+installed, or plain Python otherwise. Percentiles interpolate linearly between
+the closest ranks (NumPy's default); stddev is the sample standard deviation;
+hrv is RMSSD, the root mean square of successive differences of the RR
+intervals implied by consecutive heart rate readings (60000 / bpm, in ms).
+
+Ranges older than RETENTION_RAW_DAYS have no raw rows left to compute from.
+"""
+import math
+import statistics
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import HeartRate
+from app.queries import range_query
+from app.rollups import FIELDS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERCENTILES = {"median": 50, "p5": 5, "p95": 95}
+STATISTICS = (*PERCENTILES, "stddev", "hrv")
+
+# Fields hrv is defined for.
+HRV_FIELDS = {HeartRate: ("heart_rate",)}
+
+FETCH_BATCH = 10000
+
+
+def percentile(values: array, q: float) -> float:
+    if numpy is not None:
+        return float(numpy.percentile(numpy.frombuffer(values, dtype=numpy.intc), q))
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo = math.floor(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def stddev(values: array) -> Optional[float]:
+    if len(values) < 2:
+        return None
+    if numpy is not None:
+        return float(numpy.std(numpy.frombuffer(values, dtype=numpy.intc), ddof=1))
+    return statistics.stdev(values)
+
+
+def rmssd(heart_rates: array) -> Optional[float]:
+    if len(heart_rates) < 2:
+        return None
+    if numpy is not None:
+        rr = 60000.0 / numpy.frombuffer(heart_rates, dtype=numpy.intc)
+        return float(numpy.sqrt(numpy.mean(numpy.square(numpy.diff(rr)))))
+    rr = [60000.0 / hr for hr in heart_rates]
+    return math.sqrt(sum((b - a) ** 2 for a, b in zip(rr, rr[1:])) / (len(rr) - 1))
+
+
+def reduce(statistic: str, values: array) -> Optional[float]:
+    """`statistic` of one series; None when it has too few readings."""
+    if not values:
+        return None
+    if statistic in PERCENTILES:
+        return percentile(values, PERCENTILES[statistic])
+    if statistic == "stddev":
+        return stddev(values)
+    return rmssd(values)
+
+
+async def compute(
+        db: AsyncSession,
+        model,
+        device_id: str,
+        from_time: Optional[datetime],
+        to_time: Optional[datetime],
+        statistic: str,
+) -> List[dict]:
+    """
+    One row per patient with `first` (earliest timestamp in the range) and the
+    statistic of each field, sorted by patient. Patients with too few readings
+    for the statistic are left out.
+    """
+    fields = HRV_FIELDS[model] if statistic == "hrv" else FIELDS[model]
+    # Only the numeric columns are streamed; timestamps would cost more to decode than the values.
+    columns = [model.patient_id, *(getattr(model, f) for f in fields)]
+    query = range_query(model, device_id, from_time, to_time, *columns).order_by(model.timestamp, model.id)
+
+    # Core rows from the session's connection; the ORM result layer roughly doubles the cost here.
+    conn = await db.connection()
+    series: Dict[str, Dict[str, array]] = {}
+    result = await conn.stream(query.execution_options(yield_per=FETCH_BATCH))
+    async for rows in result.partitions():
+        for patient_id, *values in rows:
+            s = series.get(patient_id)
+            if s is None:
+                s = series[patient_id] = {f: array("i") for f in fields}
+            for f, value in zip(fields, values):
+                s[f].append(value)
+    if not series:
+        return []
+
+    first = range_query(model, device_id, from_time, to_time, model.patient_id, func.min(model.timestamp))
+    first = dict((await db.execute(first.group_by(model.patient_id))).all())
+
+    out = []
+    for patient_id in sorted(series):
+        reduced = {f: reduce(statistic, values) for f, values in series[patient_id].items()}
+        if any(v is None for v in reduced.values()):
+            continue
+        out.append({"patient_id": patient_id, "first": first[patient_id], **reduced})
+    return out
@@ -0,0 +1,199 @@
+# app/ws_ingest.py
+"""
+Persistent WebSocket ingestion (WS /ingest/ws).
+
+The device authenticates once in the handshake (`Authorization: Bearer <jwt>`,
+or `?token=<jwt>`) and then sends JSON text frames holding one reading or a list
+of readings. Frames are numbered 1, 2, 3, ... per connection. A writer task
+commits the readings of all waiting frames together (up to INGEST_FLUSH_ROWS
+readings or INGEST_FLUSH_INTERVAL_MS) and answers with one ack per group:
+
+    {"type": "ack", "seq": 12, "accepted": 40,
+     "rejected": [{"seq": 9, "index": 0, "error": "..."}], "credit": 988}
+
+Every frame up to `seq` is committed. `credit` is how many more frames the server
+will queue before it stops reading the socket (TCP backpressure takes over from
+there); clients should pause while it is 0. If a commit fails the server sends
+{"type": "error", "seq": 12, "detail": "..."} and the frames up to `seq` should be
+resent. The connection is closed with 1008 when the token expires.
+
+With rate limits configured (app/admission.py) the handshake and every frame
+take a token from the device's bucket, like a request to POST /ingest. A
+connection without one is closed with 1013 right after the handshake, and a
+frame without one is rejected ("Rate limit exceeded; retry after N s") and can
+be sent again later.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, WebSocket, status
+from pydantic import ValidationError
+
+from app.admission import rate_limiter
+from app.auth import lookup_device, verify_jwt_claims, websocket_token
+from app.buffer import gather
+from app.config import settings
+from app.db import async_session
+from app.ingest import Reading, reading_adapter, validation_error_message, write_readings
+from app.metrics import metrics, span
+from app.models import Device
+
+logger = logging.getLogger("medtrack.ws")
+
+# (seq, readings, [(index, error)])
+Frame = Tuple[int, List[Reading], List[Tuple[int, str]]]
+
+
+class IngestConnection:
+    def __init__(self, websocket: WebSocket, device: Device, expires_at: Optional[float]):
+        self.websocket = websocket
+        self.device = device
+        self.device_id = device.device_id
+        self.expires_at = expires_at
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_WS_WINDOW)
+        self.seq = 0
+        self.open = True
+
+    async def run(self):
+        writer = asyncio.create_task(self._write())
+        close_code = None
+        try:
+            close_code = await self._read()
+        finally:
+            # Commit whatever was received before the client went away.
+            if not writer.done():
+                await self.queue.put(None)
+            await writer
+        if close_code is not None and self.open:
+            await self.websocket.close(code=close_code, reason="Token expired")
+
+    async def _read(self) -> Optional[int]:
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                self.open = False
+                return None
+            if self.expires_at is not None and time.time() >= self.expires_at:
+                return status.WS_1008_POLICY_VIOLATION
+            self.seq += 1
+            wait = rate_limiter.take(self.device)
+            if wait:
+                frame = (self.seq, [], [(0, f"Rate limit exceeded; retry after {math.ceil(wait)} s")])
+            else:
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes") or b""
+                frame = self._parse(self.seq, data)
+            metrics.inc("medtrack_ws_frames_total")
+            # Blocks once the window is full, which stops reading the socket.
+            await self.queue.put(frame)
+
+    def _parse(self, seq: int, data) -> Frame:
+        try:
+            items = json.loads(data)
+        except ValueError:
+            return seq, [], [(0, "Invalid JSON")]
+        if isinstance(items, dict):
+            items = [items]
+        elif not isinstance(items, list):
+            return seq, [], [(0, "Expected a reading or a list of readings")]
+        if len(items) > settings.INGEST_BATCH_MAX:
+            return seq, [], [(0, f"Frame exceeds {settings.INGEST_BATCH_MAX} readings")]
+
+        readings, errors = [], []
+        for i, item in enumerate(items):
+            try:
+                reading = reading_adapter.validate_python(item)
+            except ValidationError as e:
+                errors.append((i, validation_error_message(e)))
+                continue
+            if reading.device_id != self.device_id:
+                errors.append((i, "Device ID mismatch"))
+                continue
+            readings.append(reading)
+        return seq, readings, errors
+
+    async def _write(self):
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                return
+            frames, stop = await gather(
+                self.queue, frame, settings.INGEST_FLUSH_ROWS, settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+                weight=lambda f: len(f[1]) or 1
+            )
+            await self._flush(frames)
+            if stop:
+                return
+
+    async def _flush(self, frames: List[Frame]):
+        last = frames[-1][0]
+        readings = [r for _, rs, _ in frames for r in rs]
+        rejected = [{"seq": seq, "index": i, "error": error} for seq, _, errors in frames for i, error in errors]
+        if readings:
+            async with async_session() as db:
+                try:
+                    await write_readings(db, self.device_id, readings)
+                    with span("commit"):
+                        await db.commit()
+                except Exception:
+                    await db.rollback()
+                    logger.exception("Failed to commit %d readings from %s", len(readings), self.device_id)
+                    await self._send({"type": "error", "seq": last, "detail": "Internal error"})
+                    return
+            metrics.inc("medtrack_ws_readings_total", amount=len(readings))
+        await self._send({
+            "type": "ack",
+            "seq": last,
+            "accepted": len(readings),
+            "rejected": rejected,
+            "credit": self.queue.maxsize - self.queue.qsize(),
+        })
+
+    async def _send(self, message: dict):
+        if not self.open:
+            return
+        try:
+            await self.websocket.send_text(json.dumps(message))
+        except Exception:
+            # The client disconnected; the reader will notice and stop.
+            self.open = False
+
+
+active = 0
+
+
+async def serve(websocket: WebSocket):
+    global active
+    token = websocket_token(websocket)
+    try:
+        if not token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        device_id, expires_at = verify_jwt_claims(token)
+        async with async_session() as db:
+            device = await lookup_device(db, device_id)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    wait = rate_limiter.take(device)
+    await websocket.accept()
+    if wait:
+        # Accepted first so the client sees 1013 rather than a refused handshake
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=f"Rate limit exceeded; retry after {math.ceil(wait)} s")
+        return
+    active += 1
+    try:
+        await IngestConnection(websocket, device, expires_at).run()
+    finally:
+        active -= 1
+
+
+def collect():
+    yield "medtrack_ws_connections", "gauge", (), active
+
+
+metrics.add_collector(collect)
@@ -1,35 +1,81 @@
+import asyncio
 import uvicorn
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.db import Base
 from app.routes import router
 
-from sqlalchemy import text
-from app.db import engine
+from app.db import engine, read_engine, async_session
+from app.config import settings
+from app.buffer import ingest_buffer
+from app.alerts import alert_engine
+from app.registry import registry
+from app.recent import recent
+from app.metrics import metrics, MetricsMiddleware, instrument_engine
+from app.responses import CompressionMiddleware
+from app import auth, migrations, partitions, retention
+from app.models import PARTITIONED_MODELS
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("medtrack")
 
-RESET_DB = True
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        if RESET_DB:
-            await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-        #indexes
-        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_hr_device_time ON heart_rate(device_id, timestamp);"))
-        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_bp_device_time ON blood_pressure(device_id, timestamp);"))
-        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_assignment_device_patient ON device_patient_assignment(device_id, patient_id);"))
+    auth.load_keys()
+    applied = await migrations.migrate(engine, reset=settings.RESET_DB)
+    if applied:
+        logger.info("Applied schema migrations %s", applied)
+    if PARTITIONED_MODELS:
+        async with engine.begin() as conn:
+            await partitions.ensure(conn)
+
+    async with async_session() as db:
+        await registry.preload(db)
+        await recent.preload(db)
+
+    if settings.INGEST_BUFFERED:
+        await ingest_buffer.start()
+
+    maintenance = asyncio.create_task(retention.loop(), name="retention") if retention.enabled() else None
 
     yield
 
+    if maintenance is not None:
+        maintenance.cancel()
+    await ingest_buffer.stop()
+    await alert_engine.drain()
+    auth.shutdown_mint_pool()
+
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_BYTES,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    if read_engine is not engine:
+        instrument_engine(read_engine, "replica")
+
+    def cache_stats():
+        for name, cache in (("token", auth.token_cache), ("device", auth.device_cache)):
+            labels = (("cache", name),)
+            yield "medtrack_cache_hits_total", "counter", labels, cache.hits
+            yield "medtrack_cache_misses_total", "counter", labels, cache.misses
+            yield "medtrack_cache_entries", "gauge", labels, len(cache)
+        labels = (("cache", "recent"),)
+        yield "medtrack_cache_hits_total", "counter", labels, recent.hits
+        yield "medtrack_cache_misses_total", "counter", labels, recent.misses
+
+    metrics.add_collector(cache_stats)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
 
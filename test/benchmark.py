@@ -0,0 +1,315 @@
+"""
+Load generator and latency benchmark for the API.
+
+Runs the app in-process on a throwaway SQLite file (default) or against a
+running server (--url), simulates N devices posting readings at a fixed rate
+plus a mixed read workload, and reports requests/s and p50/p95/p99 latency
+per endpoint. Requests shed by admission control (429/503) are counted apart
+from errors. --noisy adds devices that post as fast as they can, to check
+that well-behaved devices keep their latency while those are limited (set
+RATE_LIMIT_DEFAULT or RATE_LIMITS and INGEST_CONCURRENCY / READ_CONCURRENCY,
+which are off by default).
+Results are written as JSON so runs can be compared:
+
+    python test/benchmark.py --devices 50 --rate 2 --duration 20 --out before.json
+    python test/benchmark.py --devices 50 --rate 2 --duration 20 --out after.json
+    python test/benchmark.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+
+    async def call(self, name, coro):
+        start = time.perf_counter()
+        try:
+            res = await coro
+            status = res.status_code
+        except httpx.HTTPError:
+            status = None
+        elapsed = time.perf_counter() - start
+        if status is not None and status < 400:
+            self.latencies[name].append(elapsed)
+        elif status in (429, 503):
+            self.shed[name] += 1
+        else:
+            self.errors[name] += 1
+
+    def summary(self, duration):
+        out = {}
+        for name in sorted(set(self.latencies) | set(self.errors) | set(self.shed)):
+            values = sorted(self.latencies[name])
+            out[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "shed": self.shed[name],
+                "rps": round(len(values) / duration, 2),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+            }
+        return out
+
+
+def hr_payload(device_id, patient_id, ts):
+    return {
+        "device_id": device_id,
+        "patient_id": patient_id,
+        "timestamp": ts.isoformat(),
+        "heart_rate": random.randint(50, 130),
+        "measurement_quality": "good",
+    }
+
+
+def bp_payload(device_id, patient_id, ts):
+    return {
+        "device_id": device_id,
+        "patient_id": patient_id,
+        "timestamp": ts.isoformat(),
+        "systolic": random.randint(100, 150),
+        "diastolic": random.randint(60, 95),
+        "pulse": random.randint(55, 110),
+    }
+
+
+async def register(client, devices):
+    tokens = {}
+    for device_id, device_type in devices:
+        res = await client.post("/register", json={"device_id": device_id, "device_type": device_type})
+        res.raise_for_status()
+        tokens[device_id] = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    return tokens
+
+
+async def noisy_loop(client, rec, device_id, headers, deadline):
+    """A device stuck in a retry loop: posts back to back, ignoring Retry-After."""
+    patient_id = f"P-{device_id}"
+    ts = datetime.utcnow() - timedelta(days=1)
+    while time.perf_counter() < deadline:
+        ts += timedelta(seconds=1)
+        await rec.call("POST /ingest (noisy)", client.post("/ingest", json=hr_payload(device_id, patient_id, ts), headers=headers))
+
+
+async def device_loop(client, rec, device_id, device_type, headers, rate, batch, deadline):
+    patient_id = f"P-{device_id}"
+    make = hr_payload if device_type == "heart_rate" else bp_payload
+    interval = 1.0 / rate
+    next_at = time.perf_counter() + random.random() * interval
+    ts = datetime.utcnow() - timedelta(days=1)
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+        next_at += interval
+        if batch > 1:
+            items = []
+            for _ in range(batch):
+                ts += timedelta(seconds=1)
+                items.append(make(device_id, patient_id, ts))
+            await rec.call("POST /ingest/batch", client.post("/ingest/batch", json=items, headers=headers))
+        else:
+            ts += timedelta(seconds=1)
+            await rec.call("POST /ingest", client.post("/ingest", json=make(device_id, patient_id, ts), headers=headers))
+
+
+READS = [
+    ("GET /readings/hr", "/readings/hr?from_time={since}"),
+    ("GET /readings/hr?aggregate", "/readings/hr?aggregate=avg&from_time={since}"),
+    ("GET /readings/bp?bucket", "/readings/bp?bucket=1h&from_time={since}"),
+    ("GET /readings/latest", "/readings/latest"),
+]
+
+
+async def reader_loop(client, rec, tokens, devices, rate, deadline):
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    since = (datetime.utcnow() - timedelta(days=2)).isoformat()
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+        next_at += interval
+        name, path = random.choice(READS)
+        device_id, device_type = random.choice(devices)
+        if "/hr" in path and device_type != "heart_rate" or "/bp" in path and device_type != "blood_pressure":
+            path = path.replace("/hr", "/bp") if "/hr" in path else path.replace("/bp", "/hr")
+            name = name.replace("/hr", "/bp") if "/hr" in name else name.replace("/bp", "/hr")
+        await rec.call(name, client.get(path.format(since=since), headers=tokens[device_id]))
+
+
+async def run(args):
+    run_id = f"{int(time.time())}-{random.randint(0, 9999):04d}"
+    devices = [
+        (f"BENCH-{run_id}-{i}", "heart_rate" if i % 2 == 0 else "blood_pressure")
+        for i in range(args.devices)
+    ]
+    noisy = [(f"NOISY-{run_id}-{i}", "heart_rate") for i in range(args.noisy)]
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        lifespan = None
+    else:
+        sys.path.insert(0, str(ROOT))
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+
+    try:
+        async with client:
+            tokens = await register(client, devices + noisy)
+            rec = Recorder()
+            started = time.perf_counter()
+            deadline = started + args.duration
+            tasks = [
+                device_loop(client, rec, device_id, device_type, tokens[device_id], args.rate, args.batch, deadline)
+                for device_id, device_type in devices
+            ]
+            tasks += [reader_loop(client, rec, tokens, devices, args.read_rate, deadline) for _ in range(args.readers)]
+            tasks += [
+                noisy_loop(client, rec, device_id, tokens[device_id], deadline)
+                for device_id, _ in noisy for _ in range(args.noisy_concurrency)
+            ]
+            await asyncio.gather(*tasks)
+            duration = time.perf_counter() - started
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "run_id": run_id,
+        "started_at": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "target": args.url or "in-process",
+        "config": {
+            "devices": args.devices,
+            "rate": args.rate,
+            "batch": args.batch,
+            "readers": args.readers,
+            "read_rate": args.read_rate,
+            "noisy": args.noisy,
+            "noisy_concurrency": args.noisy_concurrency,
+            "duration": args.duration,
+        },
+        "duration": round(duration, 3),
+        "endpoints": rec.summary(duration),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    table = Table(show_header=True, header_style="bold magenta", title=f"{results['target']} @ {results['commit']}")
+    for column in ("Endpoint", "Requests", "Errors", "Shed", "RPS", "p50 ms", "p95 ms", "p99 ms"):
+        table.add_column(column)
+    for name, s in results["endpoints"].items():
+        table.add_row(name, str(s["requests"]), str(s["errors"]), str(s.get("shed", 0)), f"{s['rps']:.1f}",
+                      f"{s['p50_ms']:.2f}", f"{s['p95_ms']:.2f}", f"{s['p99_ms']:.2f}")
+    console.print(table)
+
+
+def compare(before_path, after_path):
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+    table = Table(show_header=True, header_style="bold magenta",
+                  title=f"{before.get('commit')} -> {after.get('commit')}")
+    for column in ("Endpoint", "RPS", "p50 ms", "p95 ms", "p99 ms"):
+        table.add_column(column)
+
+    def delta(old, new, higher_is_better):
+        if not old:
+            return f"{new:.2f}"
+        change = (new - old) / old * 100
+        good = change >= 0 if higher_is_better else change <= 0
+        color = "green" if good else "red"
+        return f"{old:.2f} -> {new:.2f} [{color}]({change:+.1f}%)[/{color}]"
+
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b = before["endpoints"].get(name, {})
+        a = after["endpoints"].get(name, {})
+        table.add_row(
+            name,
+            delta(b.get("rps", 0), a.get("rps", 0), True),
+            delta(b.get("p50_ms", 0), a.get("p50_ms", 0), False),
+            delta(b.get("p95_ms", 0), a.get("p95_ms", 0), False),
+            delta(b.get("p99_ms", 0), a.get("p99_ms", 0), False),
+        )
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=1.0, help="requests per second per device")
+    parser.add_argument("--batch", type=int, default=1, help="readings per request (>1 uses /ingest/batch)")
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--read-rate", type=float, default=5.0, help="requests per second per reader")
+    parser.add_argument("--noisy", type=int, default=0, help="devices posting back to back, ignoring limits")
+    parser.add_argument("--noisy-concurrency", type=int, default=4, help="requests in flight per noisy device")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if not args.url and "DATABASE_URL" not in os.environ:
+        db_path = Path(tempfile.mkdtemp()) / "bench.sqlite"
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+        console.print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
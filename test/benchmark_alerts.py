@@ -0,0 +1,151 @@
+"""
+Alert rule evaluation benchmark.
+
+Feeds synthetic heart rate and blood pressure readings for many patients
+through app/alerts.py with the default rules and with thousands of generated
+ones (global thresholds, sustained and delta rules, plus per-patient
+thresholds), and reports the evaluation cost per reading. A linear scan over
+every rule of the reading's metric is timed alongside for comparison. Runs
+without a database or server:
+
+    python test/benchmark_alerts.py --readings 100000 --patients 1000 --rules 5000
+"""
+import argparse
+import json
+import operator
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Settings needs these to load; nothing is stored.
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+os.environ.setdefault("JWT_PRIVATE_KEY_PATH", "unused")
+os.environ.setdefault("JWT_PUBLIC_KEY_PATH", "unused")
+
+from app.alerts import AlertEngine, DEFAULT_RULES, Rule
+from app.models import HeartRate, BloodPressure
+
+console = Console()
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+def make_rules(n, patients):
+    """About a fifth global rules across metrics and kinds, the rest per-patient thresholds."""
+    rules = [Rule(**spec) for spec in DEFAULT_RULES]
+    metrics = ["heart_rate", "systolic", "diastolic", "pulse"]
+    for i in range(n // 5):
+        kind = random.choice(["threshold", "sustained", "delta"])
+        op = random.choice([">", "<"])
+        if kind == "delta":
+            value = random.randint(30, 80)
+        else:
+            value = random.randint(130, 250) if op == ">" else random.randint(20, 50)
+        rules.append(Rule(
+            name=f"global-{i}",
+            metric=random.choice(metrics),
+            kind=kind,
+            op=op,
+            value=value,
+            minutes=random.choice([5, 10, 30]) if kind != "threshold" else 0,
+        ))
+    while len(rules) < n:
+        rules.append(Rule(
+            name=f"patient-{len(rules)}",
+            metric=random.choice(metrics),
+            op=">",
+            value=random.randint(120, 200),
+            patient_id=f"P{random.randrange(patients):05d}",
+        ))
+    return rules
+
+
+def make_batches(n, patients, batch):
+    start = datetime(2025, 1, 1)
+    clock = [start] * patients
+    batches = []
+    for b in range(0, n, batch):
+        hr, bp = [], []
+        for i in range(b, min(n, b + batch)):
+            p = random.randrange(patients)
+            clock[p] += timedelta(seconds=random.randint(5, 60))
+            row = {"device_id": f"D{p:05d}", "patient_id": f"P{p:05d}", "timestamp": clock[p]}
+            if i % 2:
+                hr.append({**row, "heart_rate": int(random.gauss(75, 15))})
+            else:
+                bp.append({**row, "systolic": int(random.gauss(125, 15)), "diastolic": int(random.gauss(80, 10)),
+                           "pulse": int(random.gauss(75, 15))})
+        batches.append((HeartRate, hr, list(range(len(hr)))))
+        batches.append((BloodPressure, bp, list(range(len(bp)))))
+    return batches
+
+
+def engine_path(rules, batches):
+    engine = AlertEngine(rules)
+    fired = 0
+    for model, rows, ids in batches:
+        fired += len(engine.evaluate(model, rows, ids))
+    return fired
+
+
+def linear_scan(rules, batches):
+    """Every rule of the reading's metric compared one by one (thresholds only, no state)."""
+    by_metric = {}
+    for rule in rules:
+        if rule.kind != "delta":
+            by_metric.setdefault(rule.metric, []).append((OPS[rule.op], rule.value, rule.patient_id))
+    broken = 0
+    for model, rows, ids in batches:
+        for row in rows:
+            for metric, checks in by_metric.items():
+                value = row.get(metric)
+                if value is None:
+                    continue
+                for op, bound, patient_id in checks:
+                    if (patient_id is None or patient_id == row["patient_id"]) and op(value, bound):
+                        broken += 1
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[5, 1000, 5000])
+    parser.add_argument("--batch", type=int, default=50, help="readings per write_readings call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    batches = make_batches(args.readings, args.patients, args.batch)
+    results = {"readings": args.readings, "patients": args.patients, "rules": {}}
+    table = Table(show_header=True, header_style="bold magenta",
+                  title=f"Evaluate {args.readings} readings for {args.patients} patients")
+    for column in ("Rules", "Path", "µs/reading", "Alerts / broken"):
+        table.add_column(column)
+    for n in args.rules:
+        rules = make_rules(n, args.patients) if n > len(DEFAULT_RULES) else [Rule(**s) for s in DEFAULT_RULES]
+        results["rules"][n] = {}
+        for name, fn in (("alert engine", engine_path), ("linear scan", linear_scan)):
+            start = time.perf_counter()
+            count = fn(rules, batches)
+            micros = (time.perf_counter() - start) / args.readings * 1e6
+            results["rules"][n][name] = {"us_per_reading": round(micros, 3), "count": count}
+            table.add_row(str(len(rules)), name, f"{micros:.2f}", str(count))
+    console.print(table)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
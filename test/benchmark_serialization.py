@@ -0,0 +1,116 @@
+"""
+Serialization and compression benchmark for the readings endpoints.
+
+Compares the previous response path (a Pydantic model per row through
+response_model, then the stdlib JSON encoder) with the row fast path in
+app/responses.py, and reports the size and cost of gzip/brotli on the result.
+Runs without a database or server:
+
+    python test/benchmark_serialization.py --rows 10000 --repeat 20
+"""
+import argparse
+import json
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Union
+
+from pydantic import TypeAdapter
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app import responses
+from app.schemas import HeartRateOut, HeartRateBucketOut
+
+console = Console()
+
+
+def make_rows(n):
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "id": i + 1,
+            "device_id": "HR001",
+            "patient_id": f"P{i % 20:03d}",
+            "timestamp": start + timedelta(seconds=i),
+            "heart_rate": 60 + i % 40,
+            "quality": "good",
+        }
+        for i in range(n)
+    ]
+
+
+def model_path(rows):
+    """What FastAPI did with response_model=Union[List[HeartRateOut], ...] and JSONResponse."""
+    adapter = TypeAdapter(Union[List[HeartRateOut], List[HeartRateBucketOut]])
+    content = adapter.dump_python(adapter.validate_python(rows), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def stdlib_rows(rows):
+    orjson, responses.orjson = responses.orjson, None
+    try:
+        return responses.dumps(rows)
+    finally:
+        responses.orjson = orjson
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10, help="runs per case; the best is reported")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    cases = [("model per row (previous)", model_path), ("rows, stdlib json", stdlib_rows)]
+    if responses.orjson is not None:
+        cases.append(("rows, orjson", responses.dumps))
+
+    results = {"rows": args.rows, "serialize": {}, "compress": {}}
+    baseline, body = None, None
+    table = Table(show_header=True, header_style="bold magenta", title=f"Serialize {args.rows} heart rate rows")
+    for column in ("Path", "ms", "Speedup", "Bytes"):
+        table.add_column(column)
+    for name, fn in cases:
+        seconds, out = best_of(fn, rows, args.repeat)
+        if baseline is None:
+            baseline, body = seconds, out
+        elif json.loads(out) != json.loads(body):
+            raise AssertionError(f"{name} output differs from the previous path")
+        results["serialize"][name] = {"ms": round(seconds * 1000, 3), "bytes": len(out)}
+        table.add_row(name, f"{seconds * 1000:.2f}", f"{baseline / seconds:.1f}x", str(len(out)))
+    console.print(table)
+
+    compressors = [("gzip", lambda b: zlib.compress(b, 5, wbits=31))]
+    if responses.brotli is not None:
+        compressors.append(("br", lambda b: responses.brotli.compress(b, quality=4)))
+    table = Table(show_header=True, header_style="bold magenta", title=f"Compress a {len(body)} byte body")
+    for column in ("Encoding", "ms", "Bytes", "Ratio"):
+        table.add_column(column)
+    for name, fn in compressors:
+        seconds, out = best_of(fn, body, args.repeat)
+        results["compress"][name] = {"ms": round(seconds * 1000, 3), "bytes": len(out)}
+        table.add_row(name, f"{seconds * 1000:.2f}", str(len(out)), f"{len(body) / len(out):.1f}x")
+    console.print(table)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Token minting benchmark for POST /register/batch.
+
+Compares signing with the PEM parsed on every call (what each token cost
+before the key was cached) with the cached key in app/auth.py, serially and
+through the mint pool, for each JWT algorithm. Keys are generated with
+app/keys.py into a temporary directory; no database or server is needed:
+
+    python test/benchmark_tokens.py --tokens 2000 --algorithms RS512 ES256 EdDSA
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import jwt
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Settings needs these to load; the benchmark points them at its own keys.
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+os.environ.setdefault("JWT_PRIVATE_KEY_PATH", "unused")
+os.environ.setdefault("JWT_PUBLIC_KEY_PATH", "unused")
+
+from app import auth, keys
+from app.config import settings
+
+console = Console()
+
+
+def use_keys(algorithm, directory):
+    private, public = keys.generate(algorithm)
+    (directory / f"{algorithm}.pem").write_bytes(private)
+    (directory / f"{algorithm}.pub").write_bytes(public)
+    settings.PRIVATE_KEY_PATH = str(directory / f"{algorithm}.pem")
+    settings.PUBLIC_KEY_PATH = str(directory / f"{algorithm}.pub")
+    settings.__dict__.pop("private_key", None)
+    settings.__dict__.pop("public_key", None)
+    settings.JWT_ALGO = algorithm
+    auth._keys.clear()
+    auth.shutdown_mint_pool()
+
+
+def pem_per_call(device_ids):
+    """jwt.encode with the PEM string, so PyJWT parses the key for every token."""
+    pem = settings.private_key
+    return [jwt.encode({"sub": d, "exp": 2000000000}, pem, algorithm=settings.JWT_ALGO) for d in device_ids]
+
+
+def timed(fn, device_ids):
+    start = time.perf_counter()
+    tokens = fn(device_ids)
+    return time.perf_counter() - start, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--algorithms", nargs="+", default=["RS512", "ES256", "EdDSA"], choices=keys.ALGORITHMS)
+    parser.add_argument("--pools", nargs="+", default=["thread", "process"], choices=["thread", "process"])
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    device_ids = [f"DEV{i:06d}" for i in range(args.tokens)]
+    results = {"tokens": args.tokens, "algorithms": {}}
+    table = Table(show_header=True, header_style="bold magenta", title=f"Mint {args.tokens} tokens")
+    for column in ("Algorithm", "Path", "Tokens/s", "Speedup", "Token bytes"):
+        table.add_column(column)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for algorithm in args.algorithms:
+            use_keys(algorithm, Path(tmp))
+            cases = [("PEM per call (previous)", pem_per_call), ("cached key", auth.create_jwts)]
+            for pool in args.pools:
+                cases.append((f"{pool} pool x{settings.TOKEN_MINT_WORKERS}", pool))
+
+            baseline = None
+            results["algorithms"][algorithm] = {}
+            for name, fn in cases:
+                if isinstance(fn, str):
+                    settings.TOKEN_MINT_POOL = fn
+                    auth.shutdown_mint_pool()
+                    asyncio.run(auth.mint_tokens(device_ids[:1]))  # start workers outside the timing
+                    fn = lambda ids: asyncio.run(auth.mint_tokens(ids))
+                seconds, tokens = timed(fn, device_ids)
+                assert jwt.decode(tokens[-1], auth.verifying_key(), algorithms=[algorithm])["sub"] == device_ids[-1]
+                rate = args.tokens / seconds
+                baseline = baseline or rate
+                results["algorithms"][algorithm][name] = {"tokens_per_second": round(rate), "bytes": len(tokens[0])}
+                table.add_row(algorithm, name, f"{rate:,.0f}", f"{rate / baseline:.1f}x", str(len(tokens[0])))
+            auth.shutdown_mint_pool()
+    console.print(table)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,24 @@ test_results = []
 TESTS = [
     ("Server Availability", test_cases.check_server),
     ("Register Devices", test_cases.register_devices),
+    ("Register Devices In Bulk", test_cases.register_batch),
     ("Post Heart Rate", test_cases.post_heart_rate),
     ("Post Blood Pressure", test_cases.post_blood_pressure),
     ("Post New Patient", test_cases.post_new_patient),
+    ("Post Batch", test_cases.post_batch),
+    ("Post NDJSON Stream", test_cases.post_stream),
+    ("Post WebSocket Stream", test_cases.post_websocket),
     ("Get Heart Rate Readings", test_cases.get_heart_rate),
     ("Get Blood Pressure Readings", test_cases.get_blood_pressure),
+    ("Paginate Blood Pressure Readings", test_cases.paginate_blood_pressure),
+    ("Get Latest Readings", test_cases.get_latest),
+    ("Live Reading Stream", test_cases.live_stream),
+    ("Duplicate And Idempotent Ingestion", test_cases.duplicate_ingestion),
+    ("Export Readings", test_cases.export_readings),
+    ("Patient Readings Across Devices", test_cases.patient_readings),
+    ("Rate Limited Ingestion", test_cases.rate_limited_ingestion),
+    ("Threshold Alerts", test_cases.threshold_alerts),
+    ("Cached Closed Ranges", test_cases.response_cache),
     ("Test Concurrent Ingestion", test_cases.concurrent_ingestion),
     ("Test Invalid token (401)", test_cases.invalid_token_test),
     ("Test DB access time", test_cases.db_timing_test),
@@ -22,6 +35,7 @@ TESTS = [
     ("Insert Known BloodPressure", test_cases.insert_known_bp_values),
     ("Validate HR Aggregates", test_cases.validate_hr_aggregates),
     ("Validate BP Aggregates", test_cases.validate_bp_aggregates),
+    ("Validate HR Buckets", test_cases.validate_hr_buckets),
 ]
 
 async def run_tests():
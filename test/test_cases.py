@@ -2,7 +2,9 @@ import httpx
 from datetime import datetime, timedelta
 from rich.console import Console
 import time
+import json
 import asyncio
+import math
 
 console = Console()
 
@@ -39,6 +41,23 @@ async def register_devices():
             res.raise_for_status()
             TOKENS[device["device_id"]] = res.json()["access_token"]
 
+async def register_batch():
+    suffix = NOW.strftime("%H%M%S")
+    batch = [{"device_id": f"BULK{i:03d}-{suffix}", "device_type": "heart_rate"} for i in range(300)]
+    batch += [batch[0], {"device_id": "HR001", "device_type": "heart_rate"}]
+    async with httpx.AsyncClient() as client:
+        res = await client.post(f"{API_URL}/register/batch", json=batch)
+        res.raise_for_status()
+        body = res.json()
+        if body["registered"] != 300 or body["rejected"] != 2:
+            raise AssertionError(f"Unexpected bulk registration counts: {body['registered']}/{body['rejected']}")
+        errors = [r["error"] for r in body["results"][-2:]]
+        if errors != ["Duplicate device_id in batch", "Device already registered"]:
+            raise AssertionError(f"Unexpected bulk registration rejections: {errors}")
+        token = body["results"][299]["access_token"]
+        res = await client.get(f"{API_URL}/readings/latest", headers={"Authorization": f"Bearer {token}"})
+        res.raise_for_status()
+
 async def post_heart_rate():
     async with httpx.AsyncClient() as client:
         headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
@@ -79,11 +98,112 @@ async def post_new_patient():
         res = await client.post(f"{API_URL}/ingest", json=payload, headers=headers)
         res.raise_for_status()
 
+async def post_batch():
+    async with httpx.AsyncClient() as client:
+        headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+        payload = [
+            {
+                "device_id": "HR001",
+                "patient_id": PATIENT_ID,
+                "timestamp": (NOW - timedelta(minutes=30, seconds=i)).isoformat(),
+                "heart_rate": 70 + i,
+                "measurement_quality": "good"
+            } for i in range(5)
+        ]
+        payload.append({
+            "device_id": "HR001",
+            "patient_id": "BATCH",
+            "timestamp": (NOW - timedelta(minutes=30)).isoformat(),
+            "systolic": 118, "diastolic": 78, "pulse": 70
+        })
+        payload.append({"device_id": "HR001", "patient_id": PATIENT_ID, "heart_rate": -1})
+        payload.append({**payload[0], "device_id": "BP001"})
+        res = await client.post(f"{API_URL}/ingest/batch", json=payload, headers=headers)
+        res.raise_for_status()
+        body = res.json()
+        if body["accepted"] != 6 or body["rejected"] != 2:
+            raise AssertionError(f"Unexpected batch counts: {body['accepted']}/{body['rejected']}")
+        if not all(r["id"] for r in body["results"][:6]) or not all(r["error"] for r in body["results"][6:]):
+            raise AssertionError("Batch results do not match input order")
+
+async def post_stream():
+    lines = [
+        json.dumps({
+            "device_id": "BP001",
+            "patient_id": PATIENT_ID,
+            "timestamp": (NOW - timedelta(hours=2, seconds=i)).isoformat(),
+            "systolic": 115 + i % 10, "diastolic": 75, "pulse": 68
+        }) for i in range(2500)
+    ]
+    lines.insert(10, "not json")
+    # Over INGEST_LINE_MAX_BYTES: skipped to its newline without being buffered
+    lines.insert(20, "x" * 1_000_000)
+    body = ("\n".join(lines) + "\n").encode()
+    async with httpx.AsyncClient() as client:
+        headers = {
+            "Authorization": f"Bearer {TOKENS['BP001']}",
+            "Content-Type": "application/x-ndjson"
+        }
+        res = await client.post(f"{API_URL}/ingest/stream?chunk_size=1000", content=body, headers=headers)
+        res.raise_for_status()
+        summary = res.json()
+        if summary["accepted"] != 2500 or summary["rejected"] != 2:
+            raise AssertionError(f"Unexpected stream counts: {summary['accepted']}/{summary['rejected']}")
+        if [r["line"] for r in summary["rejected_lines"]] != [11, 21]:
+            raise AssertionError("Rejected line numbers not reported")
+        if summary["rejected_lines"][1]["error"] != "Line too long":
+            raise AssertionError(f"Oversized line not rejected as such: {summary['rejected_lines'][1]}")
+
+async def post_websocket():
+    import websockets
+
+    url = API_URL.replace("http", "ws") + "/ingest/ws"
+    frames = [
+        json.dumps({
+            "device_id": "HR001",
+            "patient_id": "WS",
+            "timestamp": (NOW - timedelta(hours=3, seconds=i)).isoformat(),
+            "heart_rate": 60 + i,
+            "measurement_quality": "good"
+        }) for i in range(20)
+    ]
+    frames.insert(5, json.dumps({"device_id": "HR001", "patient_id": "WS", "heart_rate": 70}))
+    async with websockets.connect(url, additional_headers={"Authorization": f"Bearer {TOKENS['HR001']}"}) as ws:
+        for frame in frames:
+            await ws.send(frame)
+        accepted, rejected, acked = 0, [], 0
+        while acked < len(frames):
+            ack = json.loads(await asyncio.wait_for(ws.recv(), 5))
+            if ack["type"] != "ack":
+                raise AssertionError(f"Unexpected message {ack}")
+            accepted += ack["accepted"]
+            rejected += ack["rejected"]
+            acked = ack["seq"]
+    if accepted != 20 or [r["seq"] for r in rejected] != [6]:
+        raise AssertionError(f"Unexpected websocket acks: {accepted} accepted, {rejected} rejected")
+
+    try:
+        async with websockets.connect(url + "?token=invalid_token") as ws:
+            await ws.recv()
+    except (websockets.InvalidStatus, websockets.ConnectionClosed):
+        pass
+    else:
+        raise AssertionError("Websocket with invalid token was accepted")
+
+    async with httpx.AsyncClient() as client:
+        headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+        res = await client.get(f"{API_URL}/readings/hr?from_time={(NOW - timedelta(hours=4)).isoformat()}", headers=headers)
+        res.raise_for_status()
+        if sum(1 for r in res.json() if r["patient_id"] == "WS") != 20:
+            raise AssertionError("Websocket readings were not stored")
+
 async def get_heart_rate():
     async with httpx.AsyncClient() as client:
         headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
         res = await client.get(f"{API_URL}/readings/hr", headers=headers)
         res.raise_for_status()
+        if res.headers.get("content-encoding") not in ("gzip", "br"):
+            raise AssertionError("Large readings response was not compressed")
 
 async def get_blood_pressure():
     async with httpx.AsyncClient() as client:
@@ -92,6 +212,353 @@ async def get_blood_pressure():
         res.raise_for_status()
 
 
+async def paginate_blood_pressure():
+    headers = {"Authorization": f"Bearer {TOKENS['BP001']}"}
+    async with httpx.AsyncClient() as client:
+        res = await client.get(f"{API_URL}/readings/bp", headers=headers)
+        res.raise_for_status()
+        expected = sorted((r["timestamp"], r["id"]) for r in res.json())
+
+        seen, cursor = [], None
+        while True:
+            url = f"{API_URL}/readings/bp?limit=700" + (f"&cursor={cursor}" if cursor else "")
+            res = await client.get(url, headers=headers)
+            res.raise_for_status()
+            seen.extend((r["timestamp"], r["id"]) for r in res.json())
+            cursor = res.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        if seen != expected:
+            raise AssertionError(f"Paged {len(seen)} rows, expected {len(expected)} in order")
+
+        res = await client.get(f"{API_URL}/readings/bp?stream=true", headers=headers)
+        res.raise_for_status()
+        streamed = [json.loads(line) for line in res.text.splitlines()]
+        if [(r["timestamp"], r["id"]) for r in streamed] != expected:
+            raise AssertionError("Streamed rows do not match")
+
+async def get_latest():
+    headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+    async with httpx.AsyncClient() as client:
+        res = await client.get(f"{API_URL}/readings/latest", headers=headers)
+        res.raise_for_status()
+        latest = {r["patient_id"]: r for r in res.json()}
+        res = await client.get(f"{API_URL}/readings/hr", headers=headers)
+        res.raise_for_status()
+        newest = max((r for r in res.json() if r["patient_id"] == PATIENT_ID), key=lambda r: (r["timestamp"], r["id"]))
+        if latest[PATIENT_ID]["heart_rate"] != newest:
+            raise AssertionError(f"Latest {latest[PATIENT_ID]['heart_rate']} != newest {newest}")
+        if latest["BATCH"]["blood_pressure"] is None:
+            raise AssertionError("Latest blood pressure missing for BATCH patient")
+
+async def read_event(lines):
+    event = {}
+    async for line in lines:
+        if not line:
+            if "data" in event:
+                return event
+            continue
+        field, _, value = line.partition(": ")
+        event[field] = value
+
+async def live_stream():
+    headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+    reading = {
+        "device_id": "HR001",
+        "patient_id": "SSE",
+        "timestamp": NOW.isoformat(),
+        "heart_rate": 81,
+        "measurement_quality": "good"
+    }
+    async with httpx.AsyncClient(timeout=10) as client:
+        async with client.stream("GET", f"{API_URL}/readings/stream?patient_id=SSE", headers=headers) as res:
+            res.raise_for_status()
+            lines = res.aiter_lines()
+            await anext(lines)  # retry interval
+            await asyncio.sleep(0.2)
+            (await client.post(f"{API_URL}/ingest", json=reading, headers=headers)).raise_for_status()
+            event = await asyncio.wait_for(read_event(lines), 5)
+            if event["event"] != "heart_rate" or json.loads(event["data"])["heart_rate"] != 81:
+                raise AssertionError(f"Unexpected live event {event}")
+
+        # Missed while disconnected, replayed on resume
+        (await client.post(f"{API_URL}/ingest", json={**reading, "timestamp": (NOW + timedelta(seconds=1)).isoformat(), "heart_rate": 82}, headers=headers)).raise_for_status()
+        resume = {**headers, "Last-Event-ID": event["id"]}
+        async with client.stream("GET", f"{API_URL}/readings/stream?patient_id=SSE", headers=resume) as res:
+            res.raise_for_status()
+            event = await asyncio.wait_for(read_event(res.aiter_lines()), 5)
+            if json.loads(event["data"])["heart_rate"] != 82:
+                raise AssertionError(f"Unexpected replayed event {event}")
+
+async def duplicate_ingestion():
+    headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+    batch = [
+        {
+            "device_id": "HR001",
+            "patient_id": "DUP",
+            "timestamp": (NOW - timedelta(hours=2, seconds=i)).isoformat(),
+            "heart_rate": 70 + i,
+            "measurement_quality": "good"
+        }
+        for i in range(3)
+    ]
+    async with httpx.AsyncClient() as client:
+        first = (await client.post(f"{API_URL}/ingest/batch", json=batch, headers=headers)).json()
+        if first["duplicates"] != 0:
+            raise AssertionError(f"Fresh readings reported as duplicates: {first}")
+
+        # Resending stores nothing new and returns the stored ids (202 when ingestion is buffered)
+        res = await client.post(f"{API_URL}/ingest", json=batch[0], headers=headers)
+        res.raise_for_status()
+        if res.status_code == 200 and (not res.json()["duplicate"] or res.json()["id"] != first["results"][0]["id"]):
+            raise AssertionError(f"Resent reading not detected as duplicate: {res.json()}")
+        again = (await client.post(f"{API_URL}/ingest/batch", json=batch + batch[:1], headers=headers)).json()
+        if again["duplicates"] != 4 or [r["id"] for r in again["results"][:3]] != [r["id"] for r in first["results"]]:
+            raise AssertionError(f"Resent batch not detected as duplicates: {again}")
+
+        # A retried request with the same Idempotency-Key gets the original response back
+        keyed = {**headers, "Idempotency-Key": f"dup-{NOW.isoformat()}"}
+        fresh = [{**r, "timestamp": (NOW - timedelta(hours=3, seconds=i)).isoformat()} for i, r in enumerate(batch)]
+        original = await client.post(f"{API_URL}/ingest/batch", json=fresh, headers=keyed)
+        retried = await client.post(f"{API_URL}/ingest/batch", json=fresh, headers=keyed)
+        if retried.headers.get("Idempotent-Replayed") != "true" or retried.json() != original.json():
+            raise AssertionError(f"Idempotent retry was not replayed: {retried.json()}")
+        if original.json()["duplicates"] != 0:
+            raise AssertionError(f"Original keyed batch reported duplicates: {original.json()}")
+
+async def export_readings():
+    headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+    async with httpx.AsyncClient() as client:
+        res = await client.get(f"{API_URL}/export/hr?format=csv&patient_id=WS", headers=headers)
+        res.raise_for_status()
+        lines = res.text.splitlines()
+        if lines[0] != "id,device_id,patient_id,timestamp,heart_rate,quality" or len(lines) != 21:
+            raise AssertionError(f"Unexpected CSV export: {lines[:2]} ({len(lines)} lines)")
+        # Arrow and Parquet need pyarrow on the server
+        res = await client.get(f"{API_URL}/export/hr?format=arrow&patient_id=WS", headers=headers)
+        if res.status_code not in (200, 501):
+            raise AssertionError(f"Unexpected Arrow export status {res.status_code}")
+        if res.status_code == 200 and res.headers["content-type"] != "application/vnd.apache.arrow.stream":
+            raise AssertionError("Arrow export has the wrong content type")
+
+async def patient_readings():
+    headers = {"Authorization": f"Bearer {TOKENS['HR001']}"}
+    async with httpx.AsyncClient() as client:
+        readings, cursor = [], None
+        while True:
+            url = f"{API_URL}/patients/{PATIENT_ID}/readings?limit=500" + (f"&cursor={cursor}" if cursor else "")
+            res = await client.get(url, headers=headers)
+            res.raise_for_status()
+            readings += res.json()
+            cursor = res.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        if {r["device_id"] for r in readings} < {"HR001", "BP001"}:
+            raise AssertionError("Patient readings do not include every assigned device")
+        keys = [(r["timestamp"], r["type"], r["id"]) for r in readings]
+        if keys != sorted(keys) or len(set(keys)) != len(keys):
+            raise AssertionError("Patient readings are not in time order")
+
+        # BP001 was never assigned to the websocket patient
+        res = await client.get(f"{API_URL}/patients/WS/readings", headers={"Authorization": f"Bearer {TOKENS['BP001']}"})
+        if res.status_code != 403:
+            raise AssertionError(f"Unassigned device got {res.status_code} for another patient's readings")
+
+async def rate_limited_ingestion():
+    suffix = NOW.strftime("%H%M%S")
+    async with httpx.AsyncClient() as client:
+        res = await client.post(f"{API_URL}/register/batch", json=[{"device_id": f"NOISY-{suffix}", "device_type": "heart_rate"}])
+        res.raise_for_status()
+        headers = {"Authorization": f"Bearer {res.json()['results'][0]['access_token']}"}
+        # All at once, so the burst is spent faster than the bucket refills
+        responses = await asyncio.gather(*(
+            client.post(f"{API_URL}/ingest", headers=headers, json={
+                "device_id": f"NOISY-{suffix}",
+                "patient_id": "NOISY",
+                "timestamp": (NOW + timedelta(seconds=i)).isoformat(),
+                "heart_rate": 70,
+                "measurement_quality": "good"
+            })
+            for i in range(60)
+        ))
+        statuses = [res.status_code for res in responses]
+        if 429 not in statuses:
+            # Rate limits are off unless RATE_LIMIT_DEFAULT or RATE_LIMITS is set;
+            # the burst may still be shed by an INGEST_CONCURRENCY cap (503)
+            if set(statuses) - {200, 202, 503}:
+                raise AssertionError(f"Unlimited device was refused: {statuses}")
+            return
+        retry_after = next((res.headers.get("Retry-After") for res in responses if res.status_code == 429), None)
+        if not {200, 202} & set(statuses) or not retry_after:
+            raise AssertionError(f"Device over its rate was not limited: {statuses}")
+        metrics = await client.get(f"{API_URL}/metrics")
+        if metrics.status_code == 200 and 'decision="limited"' not in metrics.text:
+            raise AssertionError("Rate limit decisions missing from metrics")
+
+    # The same bucket applies over the WebSocket: either the connection or some of its frames are refused
+    import websockets
+
+    url = API_URL.replace("http", "ws") + "/ingest/ws"
+    frames = [json.dumps({
+        "device_id": f"NOISY-{suffix}",
+        "patient_id": "NOISY",
+        "timestamp": (NOW + timedelta(minutes=5, seconds=i)).isoformat(),
+        "heart_rate": 70,
+        "measurement_quality": "good"
+    }) for i in range(60)]
+    try:
+        async with websockets.connect(url, additional_headers=headers) as ws:
+            for frame in frames:
+                await ws.send(frame)
+            rejected, acked = [], 0
+            while acked < len(frames):
+                ack = json.loads(await asyncio.wait_for(ws.recv(), 5))
+                rejected += ack.get("rejected", [])
+                acked = ack["seq"]
+    except websockets.ConnectionClosed as e:
+        if e.rcvd is None or e.rcvd.code != 1013:
+            raise
+        return
+    if not any(r["error"].startswith("Rate limit exceeded") for r in rejected):
+        raise AssertionError(f"WebSocket frames over the rate were not limited: {rejected}")
+
+async def threshold_alerts():
+    suffix = NOW.strftime("%H%M%S")
+    device_id, patient_id = f"ALERT-{suffix}", f"ALERT-{suffix}"
+    async with httpx.AsyncClient() as client:
+        res = await client.post(f"{API_URL}/register/batch", json=[
+            {"device_id": device_id, "device_type": "heart_rate"},
+            {"device_id": f"{device_id}-BP", "device_type": "blood_pressure"},
+        ])
+        res.raise_for_status()
+        hr_headers, bp_headers = ({"Authorization": f"Bearer {r['access_token']}"} for r in res.json()["results"])
+
+        # high (fires), still high, back to normal (re-arms), high again (fires);
+        # the 80 bpm jump within 5 minutes fires once
+        for i, value in enumerate([70, 150, 155, 70, 150]):
+            payload = {
+                "device_id": device_id,
+                "patient_id": patient_id,
+                "timestamp": (NOW + timedelta(minutes=i)).isoformat(),
+                "heart_rate": value,
+                "measurement_quality": "good"
+            }
+            (await client.post(f"{API_URL}/ingest", json=payload, headers=hr_headers)).raise_for_status()
+        # systolic above 140 sustained for 10 minutes fires on the third reading
+        for minutes in (0, 5, 11):
+            payload = {
+                "device_id": f"{device_id}-BP",
+                "patient_id": patient_id,
+                "timestamp": (NOW + timedelta(minutes=minutes)).isoformat(),
+                "systolic": 150,
+                "diastolic": 90,
+                "pulse": 70
+            }
+            (await client.post(f"{API_URL}/ingest", json=payload, headers=bp_headers)).raise_for_status()
+
+        expected = ["heart_rate_high", "heart_rate_high", "heart_rate_jump", "systolic_high_sustained"]
+        metrics = await client.get(f"{API_URL}/metrics")
+        if "medtrack_alert_rules 0" in metrics.text:
+            # Alerts are off unless ALERTS_ENABLED is set: nothing may be stored
+            await asyncio.sleep(0.5)
+            res = await client.get(f"{API_URL}/alerts?patient_id={patient_id}", headers=hr_headers)
+            res.raise_for_status()
+            if res.json():
+                raise AssertionError(f"Alerts stored while disabled: {res.json()}")
+            return
+        # Alerts are stored in the background, and buffered readings (with the
+        # device's patient assignment) only once the buffer flushes
+        for _ in range(20):
+            res = await client.get(f"{API_URL}/alerts?patient_id={patient_id}", headers=hr_headers)
+            if res.status_code == 200 and len(res.json()) >= len(expected):
+                break
+            await asyncio.sleep(0.1)
+        res.raise_for_status()
+        alerts = res.json()
+        if sorted(a["rule"] for a in alerts) != expected:
+            raise AssertionError(f"Unexpected alerts: {[a['rule'] for a in alerts]}")
+        sustained = next(a for a in alerts if a["rule"] == "systolic_high_sustained")
+        if sustained["device_id"] != f"{device_id}-BP" or sustained["reading_type"] != "blood_pressure":
+            raise AssertionError(f"Sustained alert has the wrong source: {sustained}")
+
+        res = await client.get(f"{API_URL}/alerts?after_id={alerts[0]['id']}", headers=hr_headers)
+        res.raise_for_status()
+        if [a["id"] for a in res.json()] != [a["id"] for a in alerts if a["device_id"] == device_id][1:]:
+            raise AssertionError("after_id did not page the device's alerts")
+
+async def response_cache():
+    suffix = NOW.strftime("%H%M%S")
+    device_id = f"CACHE-{suffix}"
+    async with httpx.AsyncClient() as client:
+        res = await client.post(f"{API_URL}/register", json={"device_id": device_id, "device_type": "heart_rate"})
+        res.raise_for_status()
+        headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+        day = datetime(2024, 1, 1)
+
+        async def ingest(timestamp, value):
+            payload = {
+                "device_id": device_id,
+                "patient_id": PATIENT_ID,
+                "timestamp": timestamp.isoformat(),
+                "heart_rate": value,
+                "measurement_quality": "good"
+            }
+            (await client.post(f"{API_URL}/ingest", json=payload, headers=headers)).raise_for_status()
+
+        async def closed_range(start, end, rows, **extra):
+            # Buffered readings show up once the buffer flushes
+            params = {"from_time": start.isoformat(), "to_time": end.isoformat()}
+            for _ in range(20):
+                res = await client.get(f"{API_URL}/readings/hr", params=params, headers={**headers, **extra})
+                res.raise_for_status()
+                if len(res.json()) == rows:
+                    break
+                await asyncio.sleep(0.1)
+            if len(res.json()) != rows or "etag" not in res.headers:
+                raise AssertionError(f"Expected {rows} rows with an ETag, got {len(res.json())}: {res.headers}")
+            return res.headers["etag"]
+
+        for minutes in (0, 10, 20):
+            await ingest(day + timedelta(minutes=minutes), 70 + minutes)
+        etag = await closed_range(day, day + timedelta(days=1), 3)
+        res = await client.get(
+            f"{API_URL}/readings/hr", headers={**headers, "If-None-Match": etag},
+            params={"from_time": day.isoformat(), "to_time": (day + timedelta(days=1)).isoformat()}
+        )
+        if res.status_code != 304 or res.headers.get("etag") != etag:
+            raise AssertionError(f"Matching If-None-Match got {res.status_code}, expected 304")
+
+        # A late reading outside the range leaves it cached, one inside changes it
+        await ingest(day + timedelta(days=2), 90)
+        await closed_range(day + timedelta(days=2), day + timedelta(days=3), 1)
+        if await closed_range(day, day + timedelta(days=1), 3) != etag:
+            raise AssertionError("A reading outside the range changed its ETag")
+        await ingest(day + timedelta(minutes=30), 100)
+        if await closed_range(day, day + timedelta(days=1), 4) == etag:
+            raise AssertionError("A late reading inside the range kept its ETag")
+
+        # Large enough to be compressed: the 304 revalidating the gzip 200 repeats its ETag and Vary
+        week = day + timedelta(days=7)
+        res = await client.post(f"{API_URL}/ingest/batch", headers=headers, json=[{
+            "device_id": device_id,
+            "patient_id": PATIENT_ID,
+            "timestamp": (week + timedelta(minutes=i)).isoformat(),
+            "heart_rate": 60 + i,
+            "measurement_quality": "good"
+        } for i in range(30)])
+        res.raise_for_status()
+        params = {"from_time": week.isoformat(), "to_time": (week + timedelta(days=1)).isoformat()}
+        etag = await closed_range(week, week + timedelta(days=1), 30, **{"Accept-Encoding": "gzip"})
+        full = await client.get(f"{API_URL}/readings/hr", params=params, headers={**headers, "Accept-Encoding": "gzip"})
+        res = await client.get(
+            f"{API_URL}/readings/hr", params=params,
+            headers={**headers, "Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        if full.headers.get("content-encoding") == "gzip" and not etag.startswith("W/"):
+            raise AssertionError(f"Compressed response kept the strong ETag {etag}")
+        if res.status_code != 304 or (res.headers.get("etag"), res.headers.get("vary")) != (etag, full.headers.get("vary")):
+            raise AssertionError(f"304 {res.headers} does not match the 200 {full.headers}")
+
 async def concurrent_ingestion():
     try:
         hr_task = post_heart_rate()
@@ -156,7 +623,13 @@ async def validate_hr_aggregates():
     expected = {
         "avg": round(sum([60, 70, 80]) / 3),
         "min": 60,
-        "max": 80
+        "max": 80,
+        "median": 70,
+        "p5": 61,
+        "p95": 79,
+        "stddev": 10,
+        # RMSSD of RR intervals 750, 857.1, 1000 ms
+        "hrv": math.sqrt(((60000 / 70 - 750) ** 2 + (1000 - 60000 / 70) ** 2) / 2)
     }
     async with httpx.AsyncClient() as client:
         for agg, exp_val in expected.items():
@@ -170,7 +643,8 @@ async def validate_hr_aggregates():
             target = next((d for d in data_list if d["patient_id"] == PATIENT_ID), None)
             if not target:
                 raise AssertionError(f"No data returned for patient {PATIENT_ID} during {agg}")
-            if target["heart_rate"] != exp_val:
+            # Statistics are floats, unrounded
+            if abs(target["heart_rate"] - exp_val) > 1e-6:
                 raise AssertionError(f"HeartRate {agg} expected {exp_val}, got {target['heart_rate']}")
 
 async def validate_bp_aggregates():
@@ -207,3 +681,28 @@ async def validate_bp_aggregates():
             for field, expected_val in expected_vals.items():
                 if target[field] != expected_val:
                     raise AssertionError(f"BloodPressure {agg} {field} expected {expected_val}, got {target[field]}")
+
+async def validate_hr_buckets():
+    headers = {"Authorization": f"Bearer {TOKENS['HRAGRE']}"}
+    async with httpx.AsyncClient() as client:
+        url = (
+            f"{API_URL}/readings/hr?"
+            f"bucket=1m&from_time={RANGE_START.isoformat()}&to_time={RANGE_END.isoformat()}"
+        )
+        res = await client.get(url, headers=headers)
+        res.raise_for_status()
+        buckets = [b for b in res.json() if b["patient_id"] == PATIENT_ID]
+        if sum(b["count"] for b in buckets) != 3:
+            raise AssertionError(f"Expected 3 readings across buckets, got {buckets}")
+        if min(b["heart_rate"]["min"] for b in buckets) != 60 or max(b["heart_rate"]["max"] for b in buckets) != 80:
+            raise AssertionError("Bucket min/max do not match inserted values")
+        for b in buckets:
+            start = datetime.fromisoformat(b["bucket_start"])
+            if start.second != 0 or start.microsecond != 0:
+                raise AssertionError(f"Bucket start {b['bucket_start']} is not minute aligned")
+
+        # Parameters that do not apply to the shape asked for are rejected rather than ignored
+        for query in ("bucket=1m&aggregate=avg", "aggregate=avg&limit=10", "bucket=1h&cursor=x", "aggregate=max&stream=true"):
+            res = await client.get(f"{API_URL}/readings/hr?{query}", headers=headers)
+            if res.status_code != 400:
+                raise AssertionError(f"{query} got {res.status_code}, expected 400")
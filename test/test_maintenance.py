@@ -0,0 +1,294 @@
+"""
+Schema migration, rollup, retention, ingest buffer and live feed checks.
+
+Unlike test_cases.py these run in-process against a temporary SQLite database
+rather than a live server, since they need a database in a given state
+(created by an earlier release, or past its retention cutoff) or a precise
+interleaving of requests:
+
+    python test/test_maintenance.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Settings needs these to load; every check works on its own database file.
+DB_PATH = Path(tempfile.mkdtemp()) / "maintenance.sqlite"
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+os.environ.setdefault("JWT_PRIVATE_KEY_PATH", "unused")
+os.environ.setdefault("JWT_PUBLIC_KEY_PATH", "unused")
+
+from sqlalchemy import func, insert, inspect, select
+
+from app import retention, rollups
+from app.config import settings
+from app.buffer import IngestBuffer
+from app.db import async_session, engine
+from app.ingest import reading_adapter, write_readings
+from app.live import broker, event_stream
+from app.migrations import migrate
+from app.models import Device, DevicePatientAssignment, HeartRate, Patient
+
+console = Console()
+
+# The schema as the first release created it, before migrations existed.
+BASELINE_SCHEMA = """
+CREATE TABLE device (
+    device_id VARCHAR NOT NULL PRIMARY KEY,
+    device_type VARCHAR NOT NULL,
+    registered_at DATETIME NOT NULL
+);
+CREATE TABLE patient (
+    patient_id VARCHAR NOT NULL PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE TABLE blood_pressure (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id VARCHAR NOT NULL REFERENCES device (device_id),
+    patient_id VARCHAR NOT NULL REFERENCES patient (patient_id),
+    timestamp DATETIME NOT NULL,
+    systolic INTEGER NOT NULL,
+    diastolic INTEGER NOT NULL,
+    pulse INTEGER NOT NULL
+);
+CREATE INDEX idx_bp_device_time ON blood_pressure (device_id, timestamp);
+CREATE TABLE device_patient_assignment (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id VARCHAR NOT NULL REFERENCES device (device_id),
+    patient_id VARCHAR NOT NULL REFERENCES patient (patient_id),
+    assigned_at DATETIME NOT NULL
+);
+CREATE INDEX idx_assignment_device_patient ON device_patient_assignment (device_id, patient_id);
+CREATE TABLE heart_rate (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id VARCHAR NOT NULL REFERENCES device (device_id),
+    patient_id VARCHAR NOT NULL REFERENCES patient (patient_id),
+    timestamp DATETIME NOT NULL,
+    heart_rate INTEGER NOT NULL,
+    quality VARCHAR NOT NULL
+);
+CREATE INDEX idx_hr_device_time ON heart_rate (device_id, timestamp);
+"""
+
+DAY = datetime(2025, 1, 1)
+
+
+async def reset_database():
+    await engine.dispose()
+    DB_PATH.unlink(missing_ok=True)
+
+
+async def baseline_database(device_id: str, patient_id: str, readings: int):
+    """A database as the first release left it: one device, a doubly recorded assignment, `readings` heart rates."""
+    await reset_database()
+    async with engine.begin() as conn:
+        for statement in filter(str.strip, BASELINE_SCHEMA.split(";")):
+            await conn.exec_driver_sql(statement)
+        # Through the tables (their columns are unchanged), so values are stored the way the app stores them
+        await conn.execute(insert(Device), {"device_id": device_id, "device_type": "heart_rate", "registered_at": DAY})
+        await conn.execute(insert(Patient), {"patient_id": patient_id, "name": patient_id, "created_at": DAY})
+        await conn.execute(insert(DevicePatientAssignment), [{"device_id": device_id, "patient_id": patient_id}] * 2)
+        await conn.execute(insert(HeartRate), [
+            {"device_id": device_id, "patient_id": patient_id, "timestamp": DAY + timedelta(minutes=37 * i),
+             "heart_rate": 60 + i % 40, "quality": "good"}
+            for i in range(readings)
+        ])
+
+
+def heart_rates(device_id: str, patient_id: str, timestamps):
+    return [
+        reading_adapter.validate_python({
+            "device_id": device_id,
+            "patient_id": patient_id,
+            "timestamp": ts.isoformat(),
+            "heart_rate": 70 + i % 30,
+            "measurement_quality": "good",
+        }) for i, ts in enumerate(timestamps)
+    ]
+
+
+async def ingest(device_id: str, patient_id: str, timestamps):
+    readings = heart_rates(device_id, patient_id, timestamps)
+    async with async_session() as db:
+        await write_readings(db, device_id, readings)
+        await db.commit()
+
+
+async def aggregates(device_id: str, from_time=None, to_time=None):
+    """(count, sum) of heart rates per patient from the rollups and from raw rows."""
+    async with async_session() as db:
+        results = []
+        for use_rollups in (True, False):
+            rows = await rollups.aggregate(db, HeartRate, device_id, from_time, to_time, use_rollups=use_rollups)
+            results.append([(row["patient_id"], row["count"], row["heart_rate_sum"]) for row in rows])
+        return results
+
+
+async def upgrade_keeps_assignments_unique():
+    await baseline_database("OLD-HR", "OLD-P", 10)
+    await migrate(engine)
+
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(
+            lambda c: {i["name"]: i["unique"] for i in inspect(c).get_indexes("device_patient_assignment")}
+        )
+        assignments = (await conn.execute(select(func.count()).select_from(DevicePatientAssignment))).scalar()
+    if not indexes.get("uq_assignment_device_patient") or "idx_assignment_device_patient" in indexes:
+        raise AssertionError(f"Unexpected assignment indexes after upgrade: {indexes}")
+    if assignments != 1:
+        raise AssertionError(f"Duplicate assignments were kept: {assignments}")
+
+    # The first reading for a new patient creates its assignment with ON CONFLICT
+    await ingest("OLD-HR", "NEW-P", [DAY + timedelta(days=3)])
+    await ingest("OLD-HR", "NEW-P", [DAY + timedelta(days=3, minutes=1)])
+    async with async_session() as db:
+        pairs = (await db.execute(select(DevicePatientAssignment.patient_id).order_by(DevicePatientAssignment.patient_id))).scalars().all()
+    if pairs != ["NEW-P", "OLD-P"]:
+        raise AssertionError(f"Unexpected assignments: {pairs}")
+
+
+async def upgrade_fills_rollups():
+    await baseline_database("ROLLUP-HR", "ROLLUP-P", 200)
+    await migrate(engine)
+    from_rollups, from_raw = await aggregates("ROLLUP-HR")
+    if not from_raw or from_rollups != from_raw:
+        raise AssertionError(f"Rollups {from_rollups} do not match raw readings {from_raw}")
+    # Whole days (answered from rollups) with unaligned edges (answered from raw rows)
+    from_rollups, from_raw = await aggregates("ROLLUP-HR", DAY + timedelta(hours=5, minutes=7), DAY + timedelta(days=3, hours=1))
+    if from_rollups != from_raw:
+        raise AssertionError(f"Rollups {from_rollups} do not match raw readings {from_raw} over a range")
+
+
+async def rebuild_after_retention():
+    await reset_database()
+    await migrate(engine)
+    await ingest("RETAIN-HR", "RETAIN-P", [DAY + timedelta(minutes=53 * i) for i in range(250)])
+    before, _ = await aggregates("RETAIN-HR")
+
+    retention_days, settings.RETENTION_RAW_DAYS = settings.RETENTION_RAW_DAYS, 5
+    try:
+        deleted = await retention.run(now=DAY + timedelta(days=10))
+    finally:
+        settings.RETENTION_RAW_DAYS = retention_days
+    if not deleted[HeartRate.__tablename__]:
+        raise AssertionError("Retention expired no raw readings")
+
+    # Without bounds, and from before the oldest raw row: the expired days stay in the rollups
+    for from_time in (None, DAY - timedelta(days=30)):
+        async with async_session() as db:
+            await rollups.rebuild(db, HeartRate, from_time)
+            await db.commit()
+        from_rollups, from_raw = await aggregates("RETAIN-HR")
+        if from_rollups != before or from_raw != before:
+            raise AssertionError(f"Aggregates changed from {before} to {from_rollups} (rollups), {from_raw} (raw)")
+
+
+async def subscriber_during_write():
+    await reset_database()
+    await migrate(engine)
+    async with async_session() as db:
+        written = await write_readings(db, "LIVE-HR", heart_rates("LIVE-HR", "LIVE-P", [DAY]))
+        # Connects after the insert but before the commit, so its replay cannot see the row
+        sub = broker.subscribe("LIVE-HR")
+        try:
+            await db.commit()
+            if sub.queue.empty():
+                raise AssertionError("Reading committed after the subscriber connected was not published")
+            table, id, row = sub.queue.get_nowait()
+            if (table, id) != (HeartRate.__tablename__, written.ids[0]):
+                raise AssertionError(f"Unexpected event {table} {id}")
+        finally:
+            broker.unsubscribe(sub)
+
+
+async def live_out_of_order_commits():
+    await reset_database()
+    await migrate(engine)
+    await ingest("ORDER-HR", "ORDER-P", [DAY])
+    stream = event_stream("ORDER-HR", None, None)
+    await stream.__anext__()  # retry: subscribed, with the current ids as cursor
+    try:
+        row = {"device_id": "ORDER-HR", "patient_id": "ORDER-P", "timestamp": DAY, "heart_rate": 70, "quality": "good"}
+        # Two concurrent transactions on Postgres: the higher id commits first
+        broker.publish(HeartRate, [row], [12])
+        broker.publish(HeartRate, [row], [11])
+        events = [await asyncio.wait_for(stream.__anext__(), 1) for _ in range(2)]
+    finally:
+        await stream.aclose()
+    ids = [event.split("\n")[0] for event in events]
+    if ids != ["id: 12:0", "id: 12:0"] or '"id":11' not in events[1]:
+        raise AssertionError(f"Unexpected live events: {events}")
+
+
+async def buffer_isolates_bad_reading():
+    await reset_database()
+    await migrate(engine)
+    good = heart_rates("BUF-A", "BUF-P", [DAY + timedelta(minutes=i) for i in range(3)])
+    bad = heart_rates("BUF-A", "BUF-P", [DAY + timedelta(minutes=3)])[0]
+    bad.heart_rate = None  # passes validation only because it is set afterwards; NOT NULL fails the insert
+    other = heart_rates("BUF-B", "BUF-P", [DAY])
+
+    buffer = IngestBuffer(maxsize=100, flush_rows=100, flush_interval=0.05, durability="commit")
+    await buffer.start()
+    try:
+        results = await asyncio.gather(
+            *(buffer.submit("BUF-A", reading) for reading in good + [bad]),
+            buffer.submit("BUF-B", other[0]),
+            return_exceptions=True,
+        )
+    finally:
+        await buffer.stop()
+    failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+    if failed != [3] or buffer.flushes != 1:
+        raise AssertionError(f"Expected only the bad reading to fail in one flush: {results}")
+    async with async_session() as db:
+        stored = (await db.execute(select(HeartRate.device_id, func.count()).group_by(HeartRate.device_id))).all()
+    if sorted(stored) != [("BUF-A", 3), ("BUF-B", 1)]:
+        raise AssertionError(f"Readings lost with the bad one: {stored}")
+
+
+TESTS = [
+    ("Upgrade Keeps Assignments Unique", upgrade_keeps_assignments_unique),
+    ("Upgrade Fills Rollups", upgrade_fills_rollups),
+    ("Rebuild After Retention", rebuild_after_retention),
+    ("Buffer Isolates Bad Reading", buffer_isolates_bad_reading),
+    ("Live Subscriber During Write", subscriber_during_write),
+    ("Live Out Of Order Commits", live_out_of_order_commits),
+]
+
+
+async def run_tests():
+    results = []
+    for name, test_fn in TESTS:
+        try:
+            console.print(f"▶ [cyan]{name}[/cyan]")
+            await test_fn()
+            results.append((name, "✅"))
+        except Exception as e:
+            console.print(f"❌ [red]{name} failed:[/red] {e!r}")
+            results.append((name, "❌"))
+    await reset_database()
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Test Case")
+    table.add_column("Result")
+    for name, status in results:
+        table.add_row(name, status)
+    console.print(table)
+
+    failed = sum(1 for _, status in results if status != "✅")
+    console.print(f"[bold green]PASSED: {len(results) - failed}[/bold green] / [bold red]FAILED: {failed}[/bold red]")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_tests()))